@@ -3,12 +3,13 @@ Faraday Penetration Test IDE
 Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
 See the file 'doc/LICENSE' for the license information
 """
-import requests
 from tqdm import tqdm
 from dateutil import parser
 from datetime import datetime
 
 from faraday_client.persistence.server import models
+from faraday_client.persistence.server.filters import F
+from faraday_client.persistence.server.session import new_session
 
 
 __description__ = 'Closes vulns from the current workspace if a certain time has passed'
@@ -16,10 +17,16 @@ __prettyname__ = 'Close vulns if a certain time has passed'
 
 
 def get_vulns_from_workspace(session, url, workspace):
-    vulns = session.get('{url}/_api/v2/ws/{ws_name}/vulns/'\
-                        .format(url=url, ws_name=workspace))
+    # only the vulns which aren't closed yet are downloaded
+    where = F.status.in_(models.NOT_CLOSED_VULN_STATUSES)
+    vulnerabilities = []
+    for params in where.server_params(models.SERVER_FILTER_COLUMNS['vulns']):
+        vulns = session.get('{url}/_api/v2/ws/{ws_name}/vulns/'\
+                            .format(url=url, ws_name=workspace),
+                            params=params)
+        vulnerabilities += vulns.json()['vulnerabilities']
 
-    return vulns.json()
+    return {'vulnerabilities': vulnerabilities}
 
 
 def close_vulns(session, url, workspace, vulns, duration_time):
@@ -56,7 +63,7 @@ def main(workspace='', args=None, parser=None):
                         required=True)
     vuln_duration = parser.parse_args(args).vuln_duration
 
-    s = requests.Session()
+    s = new_session()
 
     url = models.server.SERVER_URL
     data = {
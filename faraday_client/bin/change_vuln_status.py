@@ -7,6 +7,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 from faraday_client.persistence.server.server_io_exceptions  import ResourceDoesNotExist
 from faraday_client.persistence.server import models
+from faraday_client.persistence.server.filters import F
 from faraday_client.utils.user_input import query_yes_no
 
 __description__ = 'Changes Vulns Status (to closed)'
@@ -18,7 +19,7 @@ def main(workspace='', args=None, parser=None):
     parsed_args = parser.parse_args(args)
 
     try:
-        vulns = models.get_all_vulns(workspace)
+        vulns = models.get_all_vulns(workspace, where=F.status.in_(models.NOT_CLOSED_VULN_STATUSES))
     except ResourceDoesNotExist:
         print ("Invalid workspace name: ", workspace)
         return 1, None
@@ -16,10 +16,10 @@ try:
 except ImportError:
     xlsxwriter = None
 
-from requests import Session
 from tqdm import tqdm
 
 from faraday_client.persistence.server import models
+from faraday_client.persistence.server.session import new_session
 
 __description__ = 'Creates a xls report from current workspace'
 __prettyname__ = 'Create XLS Report'
@@ -208,7 +208,7 @@ def main(workspace='', args=None, parser=None):
         print('ImportError: XlsxWriter is not installed. Please install it by running: pip install xlsxwriter')
         return 0, None
 
-    session = Session()
+    session = new_session()
     session.post(models.server.SERVER_URL + '/_api/login', json={'email': models.server.AUTH_USER, 'password': models.server.AUTH_PASS})
     vulns = session.get(models.server.SERVER_URL + '/_api/v2/ws/' + workspace + '/vulns')
 
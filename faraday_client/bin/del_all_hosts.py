@@ -23,10 +23,14 @@ def main(workspace='', args=None, parser=None):
                    workspace))
         if input(msg) not in ('y', 'yes'):
             return 1, None
-    for host in models.get_hosts(workspace):
+    hosts = models.get_hosts(workspace)
+    for host in hosts:
         print('Delete Host:' + host.name)
-        models.delete_host(workspace, host.id)
-    return 0, None
+    failed = models.delete_objects(workspace, models.Host.class_signature,
+                                   [host.id for host in hosts])
+    for host_id, error in failed.items():
+        print('Could not delete host {}: {}'.format(host_id, error))
+    return 0 if not failed else 1, None
 
 
 # I'm Py3
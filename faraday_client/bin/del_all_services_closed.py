@@ -19,11 +19,15 @@ def main(workspace='', args=None, parser=None):
                             "workspace %s" % workspace, default='no'):
             return 1, None
 
+    services_ids = []
     for service in models.get_services(workspace):
         if service.status != 'open' and service.status != 'opened':
             print('Deleted service: ' + service.name)
-            models.delete_service(workspace, service.id)
-    return 0, None
+            services_ids.append(service.id)
+    failed = models.delete_objects(workspace, models.Service.class_signature, services_ids)
+    for service_id, error in failed.items():
+        print('Could not delete service {}: {}'.format(service_id, error))
+    return 0 if not failed else 1, None
 
 
 # I'm Py3
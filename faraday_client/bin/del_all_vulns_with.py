@@ -7,8 +7,8 @@ from __future__ import absolute_import
 from __future__ import print_function
 from builtins import input
 
-import re
 from faraday_client.persistence.server import models
+from faraday_client.persistence.server.filters import F
 
 __description__ = "Delete all vulnerabilities matched with regex"
 __prettyname__ = "Delete all vulnerabilities with (...)"
@@ -29,11 +29,15 @@ def main(workspace='', args=None, parser=None):
         if input(msg) not in ('y', 'yes'):
             return 1, None
 
-    for vuln in models.get_all_vulns(workspace):
-        if re.findall(parsed_args.regex, vuln.name, ) != []:
-            print("Delete Vuln: " + vuln.name)
-            models.delete_vuln(workspace, vuln.id)
-    return 0, None
+    vulns_ids = []
+    for vuln in models.get_all_vulns(workspace, where=F.name.matches(parsed_args.regex), fields=["name"]):
+        print("Delete Vuln: " + vuln.name)
+        vulns_ids.append(vuln.id)
+    # web vulns share the same endpoint as the normal ones
+    failed = models.delete_objects(workspace, models.Vuln.class_signature, vulns_ids)
+    for vuln_id, error in failed.items():
+        print("Could not delete vuln {}: {}".format(vuln_id, error))
+    return 0 if not failed else 1, None
 
 
 # I'm Py3
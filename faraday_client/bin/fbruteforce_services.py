@@ -13,12 +13,12 @@ import base64
 import shlex
 import time
 import re
-import requests
 
 
 from subprocess import Popen, PIPE, call
 from faraday_client.persistence.server import models, server
 from faraday_client.persistence.server.server import SERVER_URL
+from faraday_client.persistence.server.session import get_session
 
 __description__ = 'Script to perform a brute force attack on different services in a workspace'
 __prettyname__ = 'FBrute'
@@ -42,13 +42,13 @@ def check_hydra():
 def add_output(output):
     pwd = os.getcwd()
     data = {"cmd" : base64.b64encode(output), "pid" : PID, "pwd" : base64.b64encode(pwd)}
-    requests.post("http://localhost:9977/cmd/input", json=data)
+    get_session().post("http://localhost:9977/cmd/input", json=data)
 
 
 def send_output(output):
     output = base64.b64encode(open(output, "r").read())
     data = {"exit_code" : 0, "pid" : PID, "output" : output}
-    requests.post("http://localhost:9977/cmd/output", json=data)
+    get_session().post("http://localhost:9977/cmd/output", json=data)
 
 
 def search_hosts_by_service(workspace, b_service):
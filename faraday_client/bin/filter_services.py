@@ -11,6 +11,7 @@ from colorama import Fore
 import sys
 
 from faraday_client.persistence.server import models
+from faraday_client.persistence.server.filters import F, all_of, any_of
 
 __description__ = 'Filter services by port or service name'
 __prettyname__ = 'Filter services'
@@ -82,7 +83,14 @@ def main(workspace='', args=None, parser=None):
 
     lines = []
 
-    for service in models.get_services(workspace):
+    where = None
+    if not parsed_args.no_filter:
+        where = all_of(filter(None, [
+            any_of(F.ports.contains(port) for port in port_list),
+            F.status.in_(status_filter) if status_filter is not None else None,
+        ]))
+
+    for service in models.get_services(workspace, where=where):
         for port in service.ports:
             if port in port_list or parsed_args.no_filter:
 
@@ -4,7 +4,7 @@ Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
 See the file 'doc/LICENSE' for the license information
 """
 import re
-from faraday_client.persistence.server import models
+from faraday_client.persistence.server.snapshot import WorkspaceSnapshot
 
 __description__ = "Get all scanned interfaces"
 __prettyname__ = "Get All IPs Interfaces"
@@ -13,9 +13,10 @@ __prettyname__ = "Get All IPs Interfaces"
 def main(workspace='', args=None, parser=None):
     ip_regex = re.compile("^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
     not_matching_count = 0
-    for host in models.get_hosts(workspace):
-        if re.match(ip_regex, host.ip):
-            print(host.ip)
+    hosts = WorkspaceSnapshot.load(workspace, tables=['hosts']).hosts
+    for ip in hosts.values('ip'):
+        if re.match(ip_regex, ip):
+            print(ip)
         else:
             not_matching_count += 1
     if not_matching_count:
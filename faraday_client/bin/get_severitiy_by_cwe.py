@@ -8,15 +8,25 @@ from __future__ import print_function
 
 import json
 
-import requests
-
 from faraday_client.persistence.server import models
+from faraday_client.persistence.server.filters import F
+from faraday_client.persistence.server.session import get_session
 
 __description__ = 'Get Vulns filtered by Severity and change Severity based in CWE'
 __prettyname__ = 'Get Severity By CWE'
 
 SEVERITY_OPTIONS = ('unclassified', 'info', 'low', 'med', 'high', 'critical', 'all')
 
+SEVERITY_LEVELS = {
+    'unclassified': 0,
+    'info': 1,
+    'low': 2,
+    'med': 3,
+    'high': 4,
+    'critical': 5,
+    'all': 100
+}
+
 
 def getCweData(couch_url):
     # Get elements from cwe DB in couchdb
@@ -28,7 +38,7 @@ def getCweData(couch_url):
             'emit(doc.name, doc.severity); }}'
     }
 
-    r = requests.post(
+    r = get_session().post(
         couch_url + '/cwe/_temp_view',
         headers=headers,
         data=json.dumps(payload)
@@ -62,33 +72,23 @@ def getCweData(couch_url):
 
 
 def checkSeverity(vuln, cwe_dict, severity_choose, workspace, couch_url):
-    severity_dict = {
-        'unclassified': 0,
-        'info': 1,
-        'low': 2,
-        'med': 3,
-        'high': 4,
-        'critical': 5,
-        'all': 100
-    }
+    if vuln.name in cwe_dict and SEVERITY_LEVELS[vuln.severity] <= SEVERITY_LEVELS[severity_choose]:
 
-    if vuln._name in cwe_dict and severity_dict[vuln.severity] <= severity_dict[severity_choose]:
-
-        print('Change: ' + vuln._name + ' to ' + cwe_dict[vuln._name])
+        print('Change: ' + vuln.name + ' to ' + cwe_dict[vuln.name])
 
         # Get object Vuln
-        response = requests.get(
-            models.server.SERVER_URL + '/' + workspace + '/' + str(vuln._id)
+        response = get_session().get(
+            models.server.SERVER_URL + '/' + workspace + '/' + str(vuln.id)
         )
         vulnWeb = response.json()
 
         # Change severity
-        vulnWeb['severity'] = cwe_dict[vuln._name]
+        vulnWeb['severity'] = cwe_dict[vuln.name]
 
         # Put changes...
         headers = {'Content-Type': 'application/json'}
-        update = requests.put(
-            couch_url + '/' + workspace + '/' + vuln._id,
+        update = get_session().put(
+            couch_url + '/' + workspace + '/' + str(vuln.id),
             headers=headers,
             data=json.dumps(vulnWeb)
         )
@@ -112,14 +112,11 @@ def main(workspace='', args=None, parser=None):
         print('CWE DB not downloaded....EXIT')
         return 2, None
 
-    for host in models.get_hosts(workspace):
-        for v in host.getVulns():
-            checkSeverity(v, cwe, parsed_args.severity, workspace, parsed_args.couchdb)
-
-        for i in host.getAllInterfaces():
-            for s in i.getAllServices():
-                for v in s.getVulns():
-                    checkSeverity(v, cwe, parsed_args.severity, workspace, parsed_args.couchdb)
+    severities = [severity for severity, level in SEVERITY_LEVELS.items()
+                  if severity != 'all' and level <= SEVERITY_LEVELS[parsed_args.severity]]
+    where = F.severity.in_(severities) & F.name.in_(cwe)
+    for v in models.get_all_vulns(workspace, where=where):
+        checkSeverity(v, cwe, parsed_args.severity, workspace, parsed_args.couchdb)
 
     return 0, None
 
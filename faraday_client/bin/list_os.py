@@ -9,7 +9,7 @@ from __future__ import print_function
 __description__ = 'Lists all scanned OSs'
 __prettyname__ = 'Get All OSs'
 
-from faraday_client.persistence.server import models
+from faraday_client.persistence.server.snapshot import WorkspaceSnapshot
 
 
 def main(workspace='', args=None, parser=None):
@@ -17,22 +17,14 @@ def main(workspace='', args=None, parser=None):
 
     parsed_args = parser.parse_args(args)
 
-    host_count = {}
-
-    for host in models.get_hosts(workspace):
-
-        if parsed_args.unique:
-            if host.os in host_count:
-                host_count[host.os] += 1
-            else:
-                host_count[host.os] = 1
-
-        else:
-            print(host.os)
+    hosts = WorkspaceSnapshot.load(workspace, tables=['hosts']).hosts
 
     if parsed_args.unique:
-        for host, count in host_count.items():
-            print('%s\t(%d)' % (host, count))
+        for os, count in hosts.group_count('os').items():
+            print('%s\t(%d)' % (os, count))
+    else:
+        for os in hosts.values('os'):
+            print(os)
 
     return 0, None
 
@@ -438,7 +438,8 @@ class GuiApp(Gtk.Application, FaradayUi):
         else:
             current_ws_name = ""
 
-        host = self.serverIO.get_host(host_id)
+        # the dialog shows every service and vuln of the host
+        host = self.serverIO.get_host(host_id, prefetch=('services', 'vulns'))
         if not host:
             self.show_normal_error("The host you clicked isn't accessible. "
                                    "This is most probably due to an internal "
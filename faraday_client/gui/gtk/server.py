@@ -6,19 +6,26 @@ See the file 'doc/LICENSE' for the license information
 """
 from __future__ import absolute_import
 
+import logging
 import time
 import threading
 
 from faraday_client.model.guiapi import notification_center
 from faraday_client.gui.gtk.decorators import safe_io_with_server
-from faraday_client.persistence.server import models, server_io_exceptions
+from faraday_client.persistence.server import models
+from faraday_client.persistence.server.changes_stream import coalesce_changes
+
+logger = logging.getLogger(__name__)
+
+# seconds the changes wait for others of the same objects, so they are
+# coalesced and the objects refreshed once
+CHANGES_COALESCE_WINDOW = 0.2
 
 
 class ServerIO:
     def __init__(self, active_workspace):
         self.__active_workspace = active_workspace
         self.stream = None  # will be set when active workpsace is set
-        self.changes_lock = models.get_changes_lock()
 
     @property
     def active_workspace(self):
@@ -27,9 +34,11 @@ class ServerIO:
     @active_workspace.setter
     def active_workspace(self, new_workspace):
         self.__active_workspace = new_workspace
-        if self.stream:
-            self.stream.stop()
-        self.stream = self.get_changes_stream()
+        # the streams share the websocket, joining the new workspace before
+        # leaving the old one keeps it open
+        old_stream, self.stream = self.stream, self.get_changes_stream()
+        if old_stream:
+            old_stream.stop()
         self.continously_get_changes()
 
     @safe_io_with_server([])
@@ -72,8 +81,14 @@ class ServerIO:
     def get_object(self, object_signature, object_id):
         return models.get_object(self.active_workspace, object_signature, object_id)
 
+    @safe_io_with_server({})
+    def get_objects_by_ids(self, object_signature, object_ids):
+        return models.get_objects_by_ids(self.active_workspace, object_signature, object_ids)
+
     @safe_io_with_server(None)
-    def get_host(self, host_id):
+    def get_host(self, host_id, prefetch=()):
+        if prefetch:
+            return models.get_host(self.active_workspace, host_id, prefetch=prefetch)
         return models.get_host(self.active_workspace, host_id)
 
     @safe_io_with_server((0, 0, 0))
@@ -97,44 +112,69 @@ class ServerIO:
         return models.get_deleted_object_name_and_type(self.active_workspace, obj_id)
 
     def continously_get_changes(self):
-        """Creates a thread which will continuously check the changes
-        coming from other instances of Faraday. Return the thread on any
-        exception, of if self.stream is None.
+        """Subscribe to the changes stream, so the changes coming from other
+        instances of Faraday are applied as soon as they arrive, in batches.
+        Return False if self.stream is None.
         """
-
-        def get_changes():
-            if not self.stream:
-                return False
-            while True:
-                try:
-                    for obj_information in self.stream:
-                        action = obj_information.get('action')
-                        obj_id = obj_information.get('id')
-                        obj_type = obj_information.get('type')
-                        obj_name = obj_information.get('name')
-                        if action == 'CREATE':
-                            obj = self.get_object(obj_type, obj_id)
-                            notification_center.addObject(obj)
-                        elif action == 'UPDATE':
-                            obj = self.get_object(obj_type, obj_id)
-                            notification_center.editObject(obj)
-                        elif action == 'DELETE':
-                            notification_center.deleteObject(obj_id, obj_type)
-                        else:
-                            raise Exception('Invalid action')
-                        notification_center.changeFromInstance(
-                                action,
-                                obj_id,
-                                obj_type,
-                                obj_name)
-                except server_io_exceptions.ChangesStreamStoppedAbruptly:
-                    notification_center.WorkspaceProblem()
-                    return False
-                time.sleep(0.5)
-
-        get_changes_thread = threading.Thread(target=get_changes, name='get_changes')
-        get_changes_thread.daemon = True
-        get_changes_thread.start()
+        stream = self.stream
+        if not stream:
+            return False
+
+        def apply_changes(changes):
+            # a batch of the previous workspace may arrive after a switch
+            if stream is self.stream:
+                self.apply_changes(changes)
+
+        stream.subscribe(apply_changes, linger=CHANGES_COALESCE_WINDOW)
+
+    def apply_changes(self, changes):
+        """Skip the echoes of our own writes, coalesce the changes of the
+        same objects, get the objects created or updated concurrently (see
+        models.get_objects_by_ids) and notify them."""
+        changes = coalesce_changes([change for change in changes
+                                    if not models.ECHO_FILTER.is_echo(self.active_workspace, change)])
+        ids_by_type = {}
+        for obj_information in changes:
+            action = obj_information.get('action')
+            obj_type = obj_information.get('type')
+            if action in ('UPDATE', 'DELETE'):
+                # someone else changed it, the object we have is stale, and
+                # so are the children of its parents after a delete
+                models.forget_object(self.active_workspace, obj_type, obj_information.get('id'),
+                                     parents=action == 'DELETE')
+            if action in ('CREATE', 'UPDATE'):
+                ids_by_type.setdefault(obj_type, []).append(obj_information.get('id'))
+        objects_by_type = {obj_type: self.get_objects_by_ids(obj_type, obj_ids)
+                           for obj_type, obj_ids in ids_by_type.items()}
+
+        for obj_information in changes:
+            action = obj_information.get('action')
+            obj_id = obj_information.get('id')
+            obj_type = obj_information.get('type')
+            obj_name = obj_information.get('name')
+            if action in ('CREATE', 'UPDATE'):
+                obj = objects_by_type[obj_type].get(str(obj_id))
+                if obj is None:
+                    logger.debug('%s %s changed but could not be found', obj_type, obj_id)
+                elif action == 'CREATE':
+                    models.forget_parents(self.active_workspace, obj)
+                    notification_center.addObject(obj)
+                else:
+                    notification_center.editObject(obj)
+            elif action == 'DELETE':
+                notification_center.deleteObject(obj_id, obj_type)
+            else:
+                logger.warning('Invalid action in the changes stream: %s', action)
+                continue
+            notification_center.changeFromInstance(
+                    action,
+                    obj_id,
+                    obj_type,
+                    obj_name)
+
+    def changes_metrics(self):
+        """The lag and throughput of the changes stream, see ChangesMetrics"""
+        return self.stream.metrics.snapshot() if self.stream else None
 
     def continously_check_server_connection(self):
         """Starts a thread which requests from the server every second, so
@@ -0,0 +1,146 @@
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from faraday_client.persistence.server.models import create_object
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 100
+MAX_DELAY = 0.2  # seconds an object may wait in the buffer
+MAX_WORKERS = 10  # requests of the same batch sent at the same time
+
+
+def get_id_from_response(saved_raw_obj):
+    if '_id' in saved_raw_obj or 'id' in saved_raw_obj:
+        return saved_raw_obj.get('_id', None) or saved_raw_obj['id']
+    raise RuntimeError('Could not retrieve id from server.')
+
+
+class BulkWriter:
+    """Buffers the creation of objects and sends them to the server in
+    batches, either when MAX_BATCH_SIZE objects are waiting, when the oldest
+    of them waited MAX_DELAY seconds or when flush() is called.
+
+    The requests of a batch are sent concurrently over the pooled keep-alive
+    connections. When the server answers, the id of each object is set with
+    setID (which resolves its id_future, so any getID() waiting for it
+    returns) and the callback given to add() is called with
+    (obj, obj_id, error). If the object still has no id after that, its
+    id_future fails with the error.
+
+    Objects whose parent id is a placeholder wait for the parent to be
+    saved. The parent was added before them, so it is sent first.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_delay=MAX_DELAY,
+                 max_workers=MAX_WORKERS):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+        self._pending = []
+        self._unfinished = 0
+        self._flush_requested = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self.batches_sent = 0
+        self.objects_sent = 0
+
+    def _start(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self._thread = threading.Thread(target=self._run, name='BulkWriterThread')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def add(self, workspace_name, obj, command_id=None, callback=None):
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError('The BulkWriter was closed')
+            self._start()
+            self._pending.append((workspace_name, obj, command_id, callback, time()))
+            self._unfinished += 1
+            self._condition.notify_all()
+
+    def flush(self, wait=False):
+        """Send every buffered object without waiting for the thresholds.
+        If wait is True, block until the server answered all of them."""
+        with self._condition:
+            if self._pending:
+                self._flush_requested = True
+                self._condition.notify_all()
+            if wait:
+                while self._unfinished:
+                    self._condition.wait()
+
+    def close(self):
+        """Send everything that is buffered and stop the writer thread."""
+        self.flush(wait=True)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0][4] + self.max_delay
+            while (len(self._pending) < self.max_batch_size
+                   and not self._flush_requested and not self._stopped):
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if not self._pending:
+                self._flush_requested = False
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            list(self._executor.map(self._send, batch))
+            self.batches_sent += 1
+            self.objects_sent += len(batch)
+            with self._condition:
+                self._unfinished -= len(batch)
+                self._condition.notify_all()
+
+    def _send(self, pending_object):
+        workspace_name, obj, command_id, callback, _ = pending_object
+        obj_id, error = None, None
+        try:
+            saved_raw_obj = create_object(workspace_name, obj.class_signature, obj, command_id)
+            obj_id = get_id_from_response(saved_raw_obj)
+        except Exception as ex:
+            error = ex
+        else:
+            obj.setID(obj_id)
+        if callback is not None:
+            try:
+                callback(obj, obj_id, error)
+            except Exception:
+                logger.exception('Error in BulkWriter callback')
+        elif error is not None:
+            logger.error('Could not save %s: %s', obj.class_signature, error)
+        if error is not None:
+            obj.failID(error)
+
+
+# I'm Py3
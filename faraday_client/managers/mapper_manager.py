@@ -4,7 +4,11 @@ Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
 See the file 'doc/LICENSE' for the license information
 """
 import logging
-from faraday_client.persistence.server.models import create_object, get_object, update_object, delete_object
+from faraday_client.persistence.server.models import (create_object, get_object, update_object, delete_object,
+                                                      get_changes_stream)
+from faraday_client.persistence.server.id_future import is_placeholder
+from faraday_client.managers.bulk_writer import get_id_from_response
+from faraday_client.managers.upload_store import UploadStore
 
 # NOTE: This class is intended to be instantiated by the
 # service or controller that needs it.
@@ -15,19 +19,76 @@ logger = logging.getLogger(__name__)
 
 
 class MapperManager:
-    def __init__(self):
+    def __init__(self, bulk_writer=None, dedup_uploads=False):
         # create and store the datamappers
         self.workspace_name = None
         self.session = None
+        # if set, save_later will buffer the objects in it
+        self.bulk_writer = bulk_writer
+        # if set, each workspace gets an UploadStore and the objects
+        # already uploaded with the same content are not sent again
+        self.dedup_uploads = dedup_uploads
+        self.upload_store = None
 
     def createMappers(self, workpace_name):
         self.workspace_name = workpace_name
+        if self.dedup_uploads:
+            if self.upload_store is not None:
+                self.upload_store.close()
+            self.upload_store = UploadStore(workpace_name)
+            try:
+                self.upload_store.follow(get_changes_stream(workpace_name))
+            except Exception as ex:
+                logger.warning('The deletes in %s made by others will not be seen: %s', workpace_name, ex)
+
+    def skip_unchanged(self, obj):
+        """Return True if obj was already uploaded to the workspace with the
+        same content. Its id is set to the one in the server, there is no
+        need to save it."""
+        if self.upload_store is None:
+            return False
+        return self.upload_store.skip_unchanged(obj)
+
+    def upload_summary(self):
+        """The number of objects sent and skipped, None if uploads aren't
+        deduplicated"""
+        if self.upload_store is None:
+            return None
+        return self.upload_store.summary()
 
     def save(self, obj, command_id=None):
         saved_raw_obj = create_object(self.workspace_name, obj.class_signature, obj, command_id)
-        if '_id' in saved_raw_obj or 'id' in saved_raw_obj:
-            return saved_raw_obj.get('_id', None) or saved_raw_obj['id']
-        raise RuntimeError('Could not retrieve id from server.')
+        return get_id_from_response(saved_raw_obj)
+
+    def save_later(self, obj, command_id=None, callback=None):
+        """Like save, but if there is a bulk writer the object is buffered
+        and sent with others later. The object id is set when the server
+        answers, and then callback(obj, obj_id, error) is called.
+        """
+        if self.bulk_writer is not None:
+            self.bulk_writer.add(self.workspace_name, obj, command_id, callback)
+            return
+        obj_id, error = None, None
+        try:
+            obj_id = self.save(obj, command_id)
+        except Exception as ex:
+            error = ex
+        else:
+            obj.setID(obj_id)
+        if callback is not None:
+            callback(obj, obj_id, error)
+        if error is not None:
+            obj.failID(error)
+
+    def flush(self, wait=False):
+        if self.bulk_writer is not None:
+            self.bulk_writer.flush(wait)
+
+    def close(self):
+        if self.bulk_writer is not None:
+            self.bulk_writer.close()
+        if self.upload_store is not None:
+            self.upload_store.close()
 
     def update(self, obj, command_id=None):
         if update_object(self.workspace_name, obj.class_signature, obj, command_id):
@@ -37,9 +98,14 @@ class MapperManager:
     def find(self, class_signature, obj_id):
         if self.workspace_name is None:
             logger.warning('No workspace detected. please call createMappers first.')
+        if is_placeholder(obj_id) and not obj_id.future.done():
+            # the object may be waiting in the bulk writer buffer
+            self.flush()
         return get_object(self.workspace_name, class_signature, obj_id)
 
     def remove(self, obj_id, class_signature):
+        if self.upload_store is not None:
+            self.upload_store.forget(class_signature, obj_id)
         return delete_object(self.workspace_name, class_signature, obj_id)
 
 # I'm Py3
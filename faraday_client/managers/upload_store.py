@@ -0,0 +1,332 @@
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from functools import partial
+from time import time
+
+from faraday_client.config.constant import CONST_FARADAY_HOME_PATH
+from faraday_client.persistence.server import server
+from faraday_client.persistence.server.id_future import is_placeholder, resolve_id
+from faraday_client.persistence.server.utils import (get_service_properties,
+                                                     get_vuln_properties,
+                                                     get_vuln_web_properties)
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_STORES_PATH = os.path.join(CONST_FARADAY_HOME_PATH, 'uploads')
+# seconds an upload is trusted. Objects deleted in the server by someone
+# else are sent again, at the latest, after this time.
+UPLOADED_MAX_AGE = 24 * 60 * 60
+# the properties which don't describe the content of an object
+IGNORED_PROPERTIES = ('metadata', 'parent', 'parent_type')
+
+
+def _host_content(host):
+    # not get_host_properties, it may resolve the name of the host
+    return {'ip': host.getName(),
+            'os': host.getOS(),
+            'hostnames': host.getHostnames(),
+            'mac': host.getMac(),
+            'default_gateway': host.getDefaultGateway(),
+            'description': host.getDescription(),
+            'owned': host.isOwned(),
+            'owner': host.getOwner()}
+
+
+def _properties_content(get_properties, obj):
+    properties = get_properties(obj)
+    for name in IGNORED_PROPERTIES:
+        properties.pop(name, None)
+    return properties
+
+
+# both kinds of vulns share the same ids, a delete may name either
+VULN_SIGNATURES = ('Vulnerability', 'VulnerabilityWeb')
+
+
+def _row_id(row):
+    value = row.get('value', row)
+    return value.get('id', row.get('id'))
+
+
+def _workspace_identity(workspace_name):
+    """Something which changes when the workspace is deleted and created
+    again with the same name, None if the server can't tell"""
+    try:
+        workspace = server.get_workspace(workspace_name)
+    except Exception as ex:
+        logger.info('Could not get the workspace %s: %s', workspace_name, ex)
+        return None
+    return json.dumps([workspace.get('id', workspace.get('_id')), workspace.get('create_date')])
+
+
+CONTENT_FUNCTIONS = {
+    'Host': _host_content,
+    'Service': partial(_properties_content, get_service_properties),
+    'Vulnerability': partial(_properties_content, get_vuln_properties),
+    'VulnerabilityWeb': partial(_properties_content, get_vuln_web_properties),
+}
+
+
+def content_hash(obj):
+    """A hash of what would be sent to the server about obj, without its
+    parent and metadata"""
+    content = CONTENT_FUNCTIONS[obj.class_signature](obj)
+    serialized = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.blake2b(serialized.encode('utf8'), digest_size=16).hexdigest()
+
+
+class Upload:
+    __slots__ = ('parent_key', 'signature', 'content_hash', 'obj_id', 'uploaded_at')
+
+    def __init__(self, parent_key, signature, content_hash, obj_id, uploaded_at):
+        self.parent_key = parent_key
+        self.signature = signature
+        self.content_hash = content_hash
+        self.obj_id = obj_id
+        self.uploaded_at = uploaded_at
+
+
+class UploadStore:
+    """Remembers the hosts, services and vulns uploaded to a workspace, so
+    importing the same report again doesn't send them again.
+
+    Each object is known by a natural key: the ip of a host, the protocol
+    and ports of a service in its host, the name of a vuln in its parent
+    (plus the website, path and method of web vulns). With it, the store
+    keeps a hash of the content sent and the id the server gave.
+
+    skip_unchanged(obj) tells if obj was already uploaded with the same
+    content, and then gives obj the id it has in the server. Other objects
+    are remembered once the server answers their id. Notes, credentials
+    and commands are always sent.
+
+    There is a store for each server and workspace name, and it is emptied
+    when the workspace was created again. A host is only skipped if it is
+    still in the server, and a service or vuln if its parent was skipped.
+    Deletes are forgotten as they arrive through follow().
+    """
+
+    def __init__(self, workspace_name, path=None, server_url=None):
+        self.workspace_name = workspace_name
+        if path is None:
+            if not os.path.isdir(UPLOAD_STORES_PATH):
+                os.makedirs(UPLOAD_STORES_PATH)
+            server_url = server_url or server._get_base_server_url()
+            server_hash = hashlib.blake2b(server_url.encode('utf8'), digest_size=8).hexdigest()
+            path = os.path.join(UPLOAD_STORES_PATH, '{0}-{1}.sqlite'.format(workspace_name, server_hash))
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS uploads (key TEXT PRIMARY KEY, '
+                                 'parent_key TEXT, signature TEXT, obj_id TEXT, '
+                                 'content_hash TEXT, uploaded_at REAL)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS workspace (identity TEXT)')
+        identity = _workspace_identity(workspace_name)
+        stored_identity = self._connection.execute('SELECT identity FROM workspace').fetchone()
+        if identity is not None and (stored_identity is None or stored_identity[0] != identity):
+            # another workspace had this name, its ids mean nothing now
+            self._connection.execute('DELETE FROM uploads')
+            self._connection.execute('DELETE FROM workspace')
+            self._connection.execute('INSERT INTO workspace VALUES (?)', (identity, ))
+        # the ids of the hosts in the server, loaded with the first host
+        # which could be skipped
+        self._host_ids = None
+        # the objects skipped since the store was opened, their children
+        # can be skipped too
+        self._skipped_keys = set()
+        self._stream = None
+        self._uploads = {}
+        self._keys_by_id = {}
+        # the keys of the children of each key, to forget them with it
+        self._children = {}
+        # the keys of the objects still waiting for their id, so their
+        # children can find them by the placeholder they have as parent id
+        self._keys_by_placeholder = {}
+        for key, parent_key, signature, obj_id, object_hash, uploaded_at in self._connection.execute(
+                'SELECT key, parent_key, signature, obj_id, content_hash, uploaded_at FROM uploads'):
+            self._remember(key, Upload(parent_key, signature, object_hash, json.loads(obj_id),
+                                       uploaded_at))
+        self.sent = 0
+        self.skipped = 0
+
+    def close(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+        self._connection.close()
+
+    def follow(self, changes_stream):
+        """Forget the objects deleted in the server, by anyone, as their
+        DELETE changes arrive through changes_stream"""
+        self._stream = changes_stream
+        changes_stream.subscribe(self.apply_changes)
+
+    def apply_changes(self, changes):
+        deleted = []
+        for change in changes:
+            if change.get('action') != 'DELETE' or change.get('id') is None:
+                continue
+            signature = change.get('type')
+            for each in VULN_SIGNATURES if signature in VULN_SIGNATURES else (signature, ):
+                deleted.append((each, change['id']))
+        self._forget(deleted)
+
+    def summary(self):
+        return {'sent': self.sent, 'skipped': self.skipped}
+
+    def _parent_key(self, obj):
+        parent_id = obj.getParent()
+        if is_placeholder(parent_id):
+            key = self._keys_by_placeholder.get(parent_id)
+            if key is not None:
+                return key
+            parent_id = resolve_id(parent_id, timeout=0)
+        parent_type = 'Host' if obj.class_signature == 'Service' else obj.getParentType()
+        return self._keys_by_id.get((parent_type, str(parent_id)))
+
+    def natural_key(self, obj):
+        """Return the natural key of obj and the one of its parent (None for
+        hosts). The key is None if obj isn't deduplicated or its parent
+        isn't known by the store."""
+        signature = obj.class_signature
+        if signature == 'Host':
+            return json.dumps([signature, obj.getName()]), None
+        if signature not in CONTENT_FUNCTIONS:
+            return None, None
+        parent_key = self._parent_key(obj)
+        if parent_key is None:
+            return None, None
+        if signature == 'Service':
+            key = [signature, parent_key, obj.getProtocol(), sorted(str(port) for port in obj.getPorts() or [])]
+        elif signature == 'Vulnerability':
+            key = [signature, parent_key, obj.getParentType(), obj.getName()]
+        else:
+            key = [signature, parent_key, obj.getParentType(), obj.getName(),
+                   obj.getWebsite(), obj.getPath(), obj.getMethod()]
+        return json.dumps(key), parent_key
+
+    def skip_unchanged(self, obj):
+        """Return True if obj was already uploaded with the same content, its
+        id is set to the one in the server. If not, return False and
+        remember obj once the server answers its id."""
+        key, parent_key = self.natural_key(obj)
+        if key is None:
+            self.sent += 1
+            return False
+        object_hash = content_hash(obj)
+        with self._lock:
+            upload = self._uploads.get(key)
+            if (upload is not None and upload.content_hash == object_hash
+                    and time() - upload.uploaded_at < UPLOADED_MAX_AGE
+                    and self._still_in_server(obj, upload)):
+                self.skipped += 1
+                self._skipped_keys.add(key)
+                obj.setID(upload.obj_id)
+                return True
+            self.sent += 1
+            id_future = obj.id_future
+            self._keys_by_placeholder[id_future.placeholder] = key
+        id_future.add_done_callback(partial(self._uploaded, obj.class_signature, key, parent_key,
+                                            object_hash))
+        return False
+
+    def _still_in_server(self, obj, upload):
+        """Whether the object of upload can be trusted to be in the server:
+        hosts are looked for in it, the other objects need their parent
+        to have been skipped too (if it was sent again, the object it had
+        is gone or belongs to another parent)."""
+        if obj.class_signature == 'Host':
+            host_ids = self._host_ids
+            if host_ids is None:
+                try:
+                    rows = server.get_hosts(self.workspace_name, fields='id')
+                except Exception as ex:
+                    logger.info('Could not get the hosts of %s, sending them again: %s',
+                                self.workspace_name, ex)
+                    return False
+                host_ids = self._host_ids = {str(_row_id(row)) for row in rows}
+            return str(upload.obj_id) in host_ids
+        return upload.parent_key in self._skipped_keys
+
+    def _uploaded(self, signature, key, parent_key, object_hash, id_future):
+        with self._lock:
+            self._keys_by_placeholder.pop(id_future.placeholder, None)
+            if id_future.exception() is not None:
+                return
+            obj_id = id_future.result()
+            uploaded_at = time()
+            self._remember(key, Upload(parent_key, signature, object_hash, obj_id, uploaded_at))
+            if signature == 'Host' and self._host_ids is not None:
+                self._host_ids.add(str(obj_id))
+            try:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, parent_key, signature, json.dumps(obj_id), object_hash, uploaded_at))
+            except sqlite3.Error as ex:
+                logger.warning('Could not remember the upload of %s: %s', key, ex)
+
+    def _remember(self, key, upload):
+        previous = self._uploads.get(key)
+        if previous is not None:
+            self._forget_id(key, previous)
+        self._uploads[key] = upload
+        self._keys_by_id[(upload.signature, str(upload.obj_id))] = key
+        if upload.parent_key is not None:
+            self._children.setdefault(upload.parent_key, set()).add(key)
+
+    def _forget_id(self, key, upload):
+        id_key = (upload.signature, str(upload.obj_id))
+        if self._keys_by_id.get(id_key) == key:
+            del self._keys_by_id[id_key]
+
+    def forget(self, signature, obj_id):
+        """Forget the object, and its children, when it is deleted"""
+        self._forget([(signature, obj_id)])
+
+    def _forget(self, deleted):
+        """Forget the objects of the (signature, id) pairs in deleted and
+        their children, removing them from the database in one transaction"""
+        with self._lock:
+            keys = []
+            for signature, obj_id in deleted:
+                if signature == 'Host' and self._host_ids is not None:
+                    self._host_ids.discard(str(obj_id))
+                key = self._keys_by_id.get((signature, str(obj_id)))
+                if key is not None:
+                    keys.append(key)
+            forgotten = []
+            while keys:
+                key = keys.pop()
+                upload = self._uploads.pop(key, None)
+                if upload is None:
+                    continue
+                forgotten.append((key, ))
+                self._forget_id(key, upload)
+                self._skipped_keys.discard(key)
+                keys.extend(self._children.pop(key, ()))
+                siblings = self._children.get(upload.parent_key)
+                if siblings is not None:
+                    siblings.discard(key)
+                    if not siblings:
+                        del self._children[upload.parent_key]
+            if not forgotten:
+                return
+            try:
+                with self._connection:
+                    self._connection.execute('BEGIN')
+                    self._connection.executemany('DELETE FROM uploads WHERE key = ?', forgotten)
+            except sqlite3.Error as ex:
+                logger.warning('Could not forget %d uploads: %s', len(forgotten), ex)
+
+
+# I'm Py3
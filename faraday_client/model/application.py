@@ -23,6 +23,7 @@ import faraday_client.model.log
 from faraday_client.config.configuration import getInstanceConfiguration
 
 from faraday_client.plugins.manager import PluginManager
+from faraday_client.managers.bulk_writer import BulkWriter
 from faraday_client.managers.mapper_manager import MapperManager
 from faraday_client.managers.workspace_manager import WorkspaceManager
 from faraday_client.model.controller import ModelController
@@ -46,7 +47,7 @@ class MainApplication:
 
         self.args = args
 
-        self._mappers_manager = MapperManager()
+        self._mappers_manager = MapperManager(bulk_writer=BulkWriter(), dedup_uploads=True)
         pending_actions = Queue()
         self._model_controller = ModelController(self._mappers_manager, pending_actions)
 
@@ -141,6 +142,7 @@ class MainApplication:
         if self._model_controller.is_alive():
             # runs only if thread has started, i.e. self._model_controller.start() is run first
             self._model_controller.join()
+        self._mappers_manager.close()
         faraday_client.model.api.devlog("Waiting for controller threads to end...")
         return exit_code
 
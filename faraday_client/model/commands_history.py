@@ -13,9 +13,10 @@ from faraday_client.config.configuration import getInstanceConfiguration
 CONF = getInstanceConfiguration()
 
 
-from threading import Event
 from sys import platform as _platform
 
+from faraday_client.persistence.server.id_future import IdFuture
+
 
 def get_private_ip():
     """
@@ -74,19 +75,25 @@ class CommandRunInformation:
         self.workspace = None
         self.import_source = None
         self._id = None
-        self.id_available = Event()
+        self.id_future = IdFuture()
 
         for k, v in kwargs.items():
             setattr(self, k, v)
 
     def getID(self):
         if self._id is None:
-            self.id_available.wait(timeout=1)
+            self.id_future.wait(timeout=1)
         return self._id
 
+    def getIDOrPlaceholder(self):
+        if self._id is not None:
+            return self._id
+        return self.id_future.placeholder
+
     def setID(self, id):
         self._id = id
-        self.id_available.set()
+        if id:
+            self.id_future.resolve(id)
 
     def toDict(self):
         return self.__dict__
@@ -19,7 +19,7 @@ from faraday_client.model import Modelactions
 from faraday_client.persistence.server.server_io_exceptions import ConflictInDatabase
 import faraday_client.model.api as api
 from faraday_client.model.guiapi import notification_center as notifier
-from functools import wraps
+from functools import partial, wraps
 from faraday_client.persistence.server import models
 
 # XXX: consider re-writing this module! There's alot of repeated code
@@ -293,6 +293,9 @@ class ModelController(Thread):
             parameters = current_action[1:]
             # dispatch the action
             self._processAction(action, list(parameters))
+            # nothing else to buffer for now, don't keep the objects waiting
+            if self._pending_actions.empty():
+                self.mappers_manager.flush()
         except Empty:
             # if timeout was reached, just let the daemon run again
             # this is done just to be able to test the stop flag
@@ -357,6 +360,18 @@ class ModelController(Thread):
             notifier.addObject(new_object)
         return res
 
+    def _on_object_saved(self, command_id, new_object, obj_id, error):
+        """Called by the bulk writer once the server answered about
+        new_object."""
+        if error is None:
+            notifier.addObject(new_object)
+        elif isinstance(error, ConflictInDatabase):
+            old_obj = new_object.__class__(error.answer.json()['object'], new_object._workspace_name)
+            new_object.setID(old_obj.getID())
+            self._dispatchActionWithLock(self._handle_conflict, old_obj, new_object, command_id)
+        else:
+            logger.error('Could not save %s: %s', new_object.class_signature, error)
+
     def _handle_conflict(self, old_obj, new_obj, command_id):
         if not old_obj.needs_merge(new_obj): return True
         return self.addUpdate(old_obj, new_obj, command_id)
@@ -370,6 +385,12 @@ class ModelController(Thread):
         :param args:
         :return:
         """
+        if self.mappers_manager.skip_unchanged(new_obj):
+            return True
+        if self.mappers_manager.bulk_writer is not None:
+            self.mappers_manager.save_later(new_obj, command_id,
+                                            partial(self._on_object_saved, command_id))
+            return True
         try:
             self._save_new_object(new_obj, command_id)
         except ConflictInDatabase as conflict:
@@ -378,7 +399,7 @@ class ModelController(Thread):
             return self._handle_conflict(old_obj, new_obj, command_id)
         except Exception as ex:
             logger.exception(ex)
-            new_obj.setID(None)
+            new_obj.failID(ex)
             raise
 
     def __edit(self, obj, command_id=None, *args, **kwargs):
@@ -443,6 +464,10 @@ class ModelController(Thread):
         self.active_plugins_count -= 1
         if self.active_plugins_count == 0:
             self.processing = False
+            upload_summary = self.mappers_manager.upload_summary()
+            if upload_summary:
+                logger.info("Objects sent: {sent}, skipped as already uploaded: {skipped}".format(
+                    **upload_summary))
         self.active_plugins_count_lock.release()
         return True
 
@@ -29,10 +29,12 @@ class ModelObjectDiff:
 
     def getPropertiesDiff(self):
         prop_diff = {}
-        for attrname in self.obj1.publicattrsrefs().keys():
-            def info(attr_ref): return attr_ref() if callable(attr_ref) else attr_ref
-            prop1 = info(self.obj1.__getattribute__(self.obj1.publicattrsrefs().get(attrname)))
-            prop2 = info(self.obj2.__getattribute__(self.obj2.publicattrsrefs().get(attrname)))
+        def info(attr_ref): return attr_ref() if callable(attr_ref) else attr_ref
+        publicattrs1 = self.obj1.publicattrsrefs()
+        publicattrs2 = self.obj2.publicattrsrefs()
+        for attrname, attribute in publicattrs1.items():
+            prop1 = info(self.obj1.__getattribute__(attribute))
+            prop2 = info(self.obj2.__getattribute__(publicattrs2.get(attrname)))
             if prop1 != prop2:
                 prop_diff[attrname] = (prop1, prop2)
 
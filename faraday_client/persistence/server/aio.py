@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Faraday Penetration Test IDE
+# Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+# See the file 'doc/LICENSE' for the license information
+
+
+"""Coroutine versions of the persistence.server.server functions.
+
+The functions here take the same arguments, return the same values and
+raise the same server_io_exceptions as their blocking counterparts, so a
+script can fire hundreds of them from one event loop:
+
+    async def delete_all(workspace_name):
+        hosts = await aio.get_hosts(workspace_name)
+        await asyncio.gather(*[aio.delete_host(workspace_name, host['id'])
+                               for host in hosts])
+
+The requests themselves are made by a bounded pool of worker threads
+which share the keep-alive connections of persistence.server.session,
+and at most MAX_CONCURRENCY of them are in flight at the same time.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from faraday_client.persistence.server import server, session
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 20
+
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR = None
+_SEMAPHORES = weakref.WeakKeyDictionary()
+
+
+def _get_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY,
+                                           thread_name_prefix='ServerAIO')
+        return _EXECUTOR
+
+
+def _get_semaphore(loop):
+    semaphore = _SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        _SEMAPHORES[loop] = semaphore
+    return semaphore
+
+
+def set_max_concurrency(max_concurrency):
+    """Change how many requests may be in flight at the same time.
+    Requests already running are not affected.
+
+    Call it while configuring the client, before any request is made: if
+    the connection pool of persistence.server.session is smaller than
+    max_concurrency it is resized, which closes its open connections."""
+    global MAX_CONCURRENCY, _EXECUTOR
+    if session.POOL_MAXSIZE < max_concurrency:
+        # otherwise every request over the pool size opens a new
+        # connection which is thrown away after the response
+        session.configure(pool_maxsize=max_concurrency)
+    with _EXECUTOR_LOCK:
+        MAX_CONCURRENCY = max_concurrency
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR = None
+    _SEMAPHORES.clear()
+
+
+async def run(server_function, *args, **kwargs):
+    """Run any blocking function of the server module (or any other function
+    doing I/O with the server) without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore(loop):
+        return await loop.run_in_executor(_get_executor(),
+                                          partial(server_function, *args, **kwargs))
+
+
+def _coroutine_version_of(function_name):
+    # the function is looked up on every call so patching the server
+    # module (as fplugin and the tests do) affects this module too
+    @wraps(getattr(server, function_name))
+    async def coroutine(*args, **kwargs):
+        return await run(getattr(server, function_name), *args, **kwargs)
+    return coroutine
+
+
+get_hosts = _coroutine_version_of('get_hosts')
+get_all_vulns = _coroutine_version_of('get_all_vulns')
+get_vulns = _coroutine_version_of('get_vulns')
+get_web_vulns = _coroutine_version_of('get_web_vulns')
+get_services = _coroutine_version_of('get_services')
+get_credentials = _coroutine_version_of('get_credentials')
+get_notes = _coroutine_version_of('get_notes')
+get_commands = _coroutine_version_of('get_commands')
+get_objects = _coroutine_version_of('get_objects')
+get_object = _coroutine_version_of('get_object')
+get_host = _coroutine_version_of('get_host')
+get_vuln = _coroutine_version_of('get_vuln')
+get_web_vuln = _coroutine_version_of('get_web_vuln')
+get_service = _coroutine_version_of('get_service')
+
+create_host = _coroutine_version_of('create_host')
+update_host = _coroutine_version_of('update_host')
+create_service = _coroutine_version_of('create_service')
+update_service = _coroutine_version_of('update_service')
+create_vuln = _coroutine_version_of('create_vuln')
+update_vuln = _coroutine_version_of('update_vuln')
+create_vuln_web = _coroutine_version_of('create_vuln_web')
+update_vuln_web = _coroutine_version_of('update_vuln_web')
+create_note = _coroutine_version_of('create_note')
+update_note = _coroutine_version_of('update_note')
+create_credential = _coroutine_version_of('create_credential')
+update_credential = _coroutine_version_of('update_credential')
+
+delete_host = _coroutine_version_of('delete_host')
+delete_service = _coroutine_version_of('delete_service')
+delete_vuln = _coroutine_version_of('delete_vuln')
+delete_note = _coroutine_version_of('delete_note')
+delete_credential = _coroutine_version_of('delete_credential')
+delete_command = _coroutine_version_of('delete_command')
+
+
+# I'm Py3
@@ -13,10 +13,13 @@ import os
 
 from past.builtins import basestring
 
+import itertools
 import json
 import logging
+import random
 import threading
 from queue import Queue, Empty
+from time import time
 import requests
 import websocket
 import ssl
@@ -27,8 +30,271 @@ from faraday_client.persistence.server.server_io_exceptions import (
 )
 logger = logging.getLogger(__name__)
 
+# most changes handed at once to the subscribers or returned by get_batch
+CHANGES_BATCH_SIZE = 500
+
+# put in the queue to wake up the consumers when the stream stops
+_STOPPED = object()
+
+# seconds before reconnecting a websocket which closed, doubled after each
+# failed attempt up to RECONNECT_MAX_DELAY (see reconnect_delay)
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# after a reconnection, the objects modified since this many seconds before
+# the last change seen are notified again, for the clocks of client and
+# server to differ a bit
+CATCH_UP_MARGIN = 60
+# the query parameter asking the server only for the objects modified
+# since a time, in milliseconds like their metadata (see catch_up)
+CATCH_UP_SINCE_PARAM = 'update_time__gte'
+
+
+def reconnect_delay(attempt):
+    """Seconds to wait before the reconnection attempt number attempt
+    (from 0): exponential backoff, with a random half of it as jitter so
+    clients don't reconnect all at once."""
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def _timestamp(value):
+    """The seconds of a metadata time, which the server may send in
+    milliseconds. None if it isn't a number."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value / 1000 if value > 1e11 else value
+
+
+def catch_up_change(row, since, object_type=None):
+    """Return the change to notify about the object of row if it was created
+    or modified since that time, None if not."""
+    value = row.get('value', row)
+    metadata = value.get('metadata') or {}
+    created_at = _timestamp(metadata.get('create_time'))
+    updated_at = _timestamp(metadata.get('update_time'))
+    if updated_at is None:
+        updated_at = created_at
+    if updated_at is None or updated_at < since:
+        return None
+    return {'action': 'CREATE' if created_at is not None and created_at >= since else 'UPDATE',
+            'id': value.get('id', row.get('id')),
+            'type': object_type or value.get('type'),
+            'name': value.get('name')}
+
+
+def coalesce_changes(changes):
+    """Collapse the changes of the same object into one: a CREATE followed
+    by UPDATEs is a CREATE, anything followed by a DELETE is a DELETE and
+    several UPDATEs are one. Each change keeps the place of the first one
+    of its object, with the name of the last one.
+
+    Return the list of the remaining changes.
+    """
+    coalesced = {}
+    for change in changes:
+        key = (change.get('type'), change.get('id'))
+        previous = coalesced.get(key)
+        if previous is None:
+            coalesced[key] = dict(change)
+            continue
+        action = change.get('action')
+        if action != 'DELETE' and previous.get('action') == 'CREATE':
+            action = 'CREATE'
+        previous.update(change, action=action)
+    return list(coalesced.values())
+
+
+def _changed_pages(iter_pages, workspace_name, since):
+    """Return the pages of iter_pages(workspace_name) with the objects
+    modified since that time, asking the server to filter them with
+    CATCH_UP_SINCE_PARAM. If the server rejects it the whole table is
+    read instead, as it is if the server ignores it: the rows must still
+    be checked with catch_up_change."""
+    pages = iter_pages(workspace_name, **{CATCH_UP_SINCE_PARAM: int(since * 1000)})
+    try:
+        first_page = next(pages, None)
+    except Exception as ex:
+        logger.info('The server can not filter the changes since %s, reading all of %s: %s',
+                    since, workspace_name, ex)
+        return iter_pages(workspace_name)
+    if first_page is None:
+        return iter(())
+    return itertools.chain([first_page], pages)
+
+
+class ChangesMetrics:
+    """How many changes a stream received and handed to its consumers, and
+    how long they waited in between (the lag, in seconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.received = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.batches = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._first_received_at = None
+        self._last_dispatched_at = None
+
+    def change_received(self, received_at):
+        with self._lock:
+            self.received += 1
+            if self._first_received_at is None:
+                self._first_received_at = received_at
+
+    def change_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def batch_dispatched(self, received_times, dispatched_at):
+        with self._lock:
+            self.batches += 1
+            self.dispatched += len(received_times)
+            for received_at in received_times:
+                self.total_lag += dispatched_at - received_at
+            self.last_lag = dispatched_at - received_times[0]
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self._last_dispatched_at = dispatched_at
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = None
+            if self._last_dispatched_at is not None:
+                elapsed = self._last_dispatched_at - self._first_received_at
+            return {
+                'received': self.received,
+                'dispatched': self.dispatched,
+                'dropped': self.dropped,
+                'pending': self.received - self.dispatched - self.dropped,
+                'batches': self.batches,
+                'mean_lag': self.total_lag / self.dispatched if self.dispatched else 0.0,
+                'max_lag': self.max_lag,
+                'last_lag': self.last_lag,
+                # changes dispatched per second since the first one arrived
+                'throughput': self.dispatched / elapsed if elapsed else None,
+            }
+
 
 class ChangesStream:
+    """The changes of a workspace, as they arrive (see _put).
+
+    Consumers either call get_batch, which blocks until there are changes
+    and returns all of them (up to CHANGES_BATCH_SIZE), or subscribe a
+    callback, which is called from a thread with each batch. A stream
+    should have only one of those consumers.
+    """
+
+    def __init__(self):
+        self.changes_queue = Queue()
+        self.metrics = ChangesMetrics()
+        self._response = None
+        self._stop = False
+        self._subscribers = []
+        # seconds the batches of the subscribers wait for more changes
+        self.linger = 0
+        self._dispatcher = None
+        self._subscribers_lock = threading.Lock()
+
+    def _put(self, message):
+        received_at = time()
+        self.metrics.change_received(received_at)
+        self.changes_queue.put((received_at, message))
+
+    def _next_batch(self, max_size, block=True, timeout=None, linger=0):
+        """Return the received times and the changes of the next batch,
+        ([], []) if none arrived in timeout seconds and None if the stream
+        was stopped. After the first change, the ones arriving in the next
+        linger seconds join the batch too."""
+        if self._stop:
+            return None
+        try:
+            items = [self.changes_queue.get(block, timeout)]
+        except Empty:
+            return [], []
+        deadline = time() + linger
+        while len(items) < max_size and items[-1] is not _STOPPED:
+            remaining = deadline - time()
+            try:
+                if remaining > 0:
+                    items.append(self.changes_queue.get(timeout=remaining))
+                else:
+                    items.append(self.changes_queue.get_nowait())
+            except Empty:
+                break
+        if _STOPPED in items:
+            # leave it for the other consumers
+            self.changes_queue.put(_STOPPED)
+            return None
+        received_times, changes = [], []
+        for received_at, message in items:
+            change = self._parse_change(message)
+            if change is None:
+                logger.warning('Invalid change in the changes stream: %r', message)
+                self.metrics.change_dropped()
+                continue
+            received_times.append(received_at)
+            changes.append(change)
+        return received_times, changes
+
+    def get_batch(self, max_size=CHANGES_BATCH_SIZE, timeout=None, linger=0):
+        """Wait at most timeout seconds (None for ever) for a change, and
+        return a list with it and all the ones that arrived since (or in the
+        next linger seconds), up to max_size. The list is empty if none
+        arrived in time, and None is returned once the stream was stopped."""
+        batch = self._next_batch(max_size, timeout=timeout, linger=linger)
+        if batch is None:
+            return None
+        received_times, changes = batch
+        if changes:
+            self.metrics.batch_dispatched(received_times, time())
+        return changes
+
+    def subscribe(self, callback, linger=None):
+        """Call callback with each batch of changes (a list of dictionaries)
+        from a daemon thread, until the stream is stopped. If linger is
+        given, the batches wait that many seconds after their first change
+        for others to join them (see coalesce_changes)."""
+        with self._subscribers_lock:
+            if linger is not None:
+                self.linger = linger
+            self._subscribers.append(callback)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='ChangesDispatcher')
+                self._dispatcher.daemon = True
+                self._dispatcher.start()
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            self._subscribers.remove(callback)
+
+    def _dispatch(self):
+        while self._dispatch_batch(linger=self.linger) is not None:
+            pass
+
+    def _dispatch_batch(self, block=True, linger=0):
+        """Hand the next batch of changes to the subscribers. Return the
+        number of changes dispatched, None once the stream was stopped."""
+        batch = self._next_batch(CHANGES_BATCH_SIZE, block=block, linger=linger)
+        if batch is None:
+            return None
+        received_times, changes = batch
+        if not changes:
+            return 0
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(changes)
+            except Exception:
+                logger.exception('Error in a subscriber of the changes stream')
+        self.metrics.batch_dispatched(received_times, time())
+        logger.debug('Dispatched %d changes, %.3f seconds after they arrived',
+                     len(changes), self.metrics.last_lag)
+        return len(changes)
 
     def __enter__(self):
         return self
@@ -40,7 +306,15 @@ class ChangesStream:
         return self
 
     def __iter__(self):
-        raise NotImplementedError('Abstract class')
+        """Yield the changes that already arrived, without waiting"""
+        batch = self._next_batch(CHANGES_BATCH_SIZE, block=False)
+        if not batch:
+            return
+        received_times, changes = batch
+        if changes:
+            self.metrics.batch_dispatched(received_times, time())
+        for change in changes:
+            yield change
 
     def _get_object_type_and_name_from_change(self, change):
         try:
@@ -75,99 +349,349 @@ class ChangesStream:
             self._response.close()
             self._response = None
         self._stop = True
+        self.changes_queue.put(_STOPPED)
 
 
-class WebsocketsChangesStream(ChangesStream):
-
-    def __init__(self, workspace_name, server_url, **params):
-        server_url_info = urlparse(server_url)
-        self.changes_queue = Queue()
-        self.workspace_name = workspace_name
-        self._response = None
-        ws_port = 9000
-        self._base_url = server_url_info.hostname
-        ws_kwargs = {'ping_interval': 30}
-        if server_url_info.scheme == "https":
-            if server_url_info.port:
-                # Using HTTPS but not for standard 443 port
-                websockets_url = f"wss://{server_url_info.hostname}:{server_url_info.port}/websockets"
-                test_ws_url = f"https://{server_url_info.hostname}:{server_url_info.port}/websockets"
-            else:
-                websockets_url = f"wss://{server_url_info.hostname}/websockets"
-                test_ws_url = f"https://{server_url_info.hostname}/websockets"
-            try:
-                ws_response = requests.get(test_ws_url)
-                if ws_response.status_code == 404:
-                    # Using HTTPS but not for websockets
-                    websockets_url = f"ws://{server_url_info.hostname}:{ws_port}/"
-                else:
-                    cert_path = os.environ.get("REQUESTS_CA_BUNDLE", None)
-                    if cert_path:
-                        ws_kwargs["sslopt"] = {"ca_certs": cert_path}
-                        logger.info("Using self signed certificate for WSS")
-            except requests.exceptions.ConnectionError:
-                logger.warning("Faraday server is over https but websockets are not")
-                websockets_url = f"ws://{server_url_info.hostname}:{ws_port}/"
+def _websockets_url(server_url):
+    """The url of the websockets of the server, and the keyword arguments
+    of WebSocketApp.run_forever to connect to it"""
+    server_url_info = urlparse(server_url)
+    ws_port = 9000
+    ws_kwargs = {'ping_interval': 30}
+    if server_url_info.scheme == "https":
+        if server_url_info.port:
+            # Using HTTPS but not for standard 443 port
+            websockets_url = f"wss://{server_url_info.hostname}:{server_url_info.port}/websockets"
+            test_ws_url = f"https://{server_url_info.hostname}:{server_url_info.port}/websockets"
         else:
+            websockets_url = f"wss://{server_url_info.hostname}/websockets"
+            test_ws_url = f"https://{server_url_info.hostname}/websockets"
+        try:
+            ws_response = requests.get(test_ws_url)
+            if ws_response.status_code == 404:
+                # Using HTTPS but not for websockets
+                websockets_url = f"ws://{server_url_info.hostname}:{ws_port}/"
+            else:
+                cert_path = os.environ.get("REQUESTS_CA_BUNDLE", None)
+                if cert_path:
+                    ws_kwargs["sslopt"] = {"ca_certs": cert_path}
+                    logger.info("Using self signed certificate for WSS")
+        except requests.exceptions.ConnectionError:
+            logger.warning("Faraday server is over https but websockets are not")
             websockets_url = f"ws://{server_url_info.hostname}:{ws_port}/"
-        logger.info('Connecting to websocket url %s', websockets_url)
-        self.ws = websocket.WebSocketApp(
-                websockets_url,
+    else:
+        websockets_url = f"ws://{server_url_info.hostname}:{ws_port}/"
+    return websockets_url, ws_kwargs
+
+
+class WebsocketsConnection:
+    """One websocket to the server, joined to the workspaces of the
+    WebsocketsChangesStreams using it (see join), so watching many
+    workspaces or switching between them doesn't open a connection each.
+
+    The changes are routed to the streams of their workspace. The
+    subscribers of all the streams are called from a single thread, and
+    the websocket is opened again when it closes (see _run).
+    """
+
+    def __init__(self, server_url):
+        self._base_url = urlparse(server_url).hostname
+        self._websockets_url, self._ws_kwargs = _websockets_url(server_url)
+        self._stopped = threading.Event()
+        self.connected = False
+        self.reconnections = 0
+        # when the last change arrived, or the connection was opened
+        self.last_change_at = None
+        # the streams of each workspace joined
+        self._streams = {}
+        self._streams_lock = threading.RLock()
+        self._thread = None
+        # when each stream with subscribers hands them its next batch
+        self._due = {}
+        self._dispatch_condition = threading.Condition()
+        self._dispatcher = None
+        self.ws = self._new_websocket()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def workspaces(self):
+        with self._streams_lock:
+            return list(self._streams)
+
+    def join(self, stream):
+        """Send the changes of the workspace of stream to it. The websocket
+        is opened with the first stream."""
+        workspace_name = stream.workspace_name
+        with self._streams_lock:
+            streams = self._streams.setdefault(workspace_name, [])
+            streams.append(stream)
+            # if not connected yet, on_open joins it
+            send_join = len(streams) == 1 and self.connected
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='WebsocketsConnection')
+                self._thread.daemon = True
+                self._thread.start()
+        if send_join and not self._send_join(workspace_name):
+            # without joining the workspace no change arrives, try again
+            self.ws.close()
+
+    def leave(self, stream):
+        """Stop sending changes to stream, and leave its workspace if no
+        other stream uses it"""
+        workspace_name = stream.workspace_name
+        with self._streams_lock:
+            streams = self._streams.get(workspace_name)
+            if streams is None or stream not in streams:
+                return
+            streams.remove(stream)
+            send_leave = False
+            if not streams:
+                del self._streams[workspace_name]
+                send_leave = self.connected
+        with self._dispatch_condition:
+            self._due.pop(stream, None)
+        if send_leave:
+            try:
+                self.ws.send(json.dumps({'action': 'LEAVE_WORKSPACE', 'workspace': workspace_name}))
+            except Exception as ex:
+                logger.info('Could not leave the workspace %s: %s', workspace_name, ex)
+
+    def subscribe(self, stream):
+        """Hand the batches of stream to its subscribers, from the dispatcher
+        thread of the connection"""
+        with self._dispatch_condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='ChangesDispatcher')
+                self._dispatcher.daemon = True
+                self._dispatcher.start()
+        if not stream.changes_queue.empty():
+            self.schedule(stream)
+
+    def schedule(self, stream, delay=None):
+        """Hand the changes of stream to its subscribers in delay seconds
+        (by default, its linger), unless they are already due"""
+        with self._dispatch_condition:
+            if stream not in self._due:
+                self._due[stream] = time() + (stream.linger if delay is None else delay)
+                self._dispatch_condition.notify()
+
+    def _dispatch(self):
+        while not self._stopped.is_set():
+            with self._dispatch_condition:
+                now = time()
+                due = [stream for stream, due_at in self._due.items() if due_at <= now]
+                if not due:
+                    timeout = min(self._due.values()) - now if self._due else None
+                    self._dispatch_condition.wait(timeout)
+                    continue
+                for stream in due:
+                    del self._due[stream]
+            for stream in due:
+                if stream._dispatch_batch(block=False) and not stream.changes_queue.empty():
+                    # more changes than fit in a batch
+                    self.schedule(stream, 0)
+
+    def _new_websocket(self):
+        logger.info('Connecting to websocket url %s', self._websockets_url)
+        # ws.run_forever will call on_message, on_error, on_close and on_open
+        # see websocket client python docs on:
+        # https://github.com/websocket-client/websocket-client
+        return websocket.WebSocketApp(
+                self._websockets_url,
                 on_message=self.on_message,
                 on_error=self.on_error,
                 on_open=self.on_open,
                 on_close=self.on_close
         )
-        # ws.run_forever will call on_message, on_error, on_close and on_open
-        # see websocket client python docs on:
-        # https://github.com/websocket-client/websocket-client
-        thread = threading.Thread(target=self.ws.run_forever, args=(), kwargs=ws_kwargs, name='WebsocketsChangesStream')
-        thread.daemon = True
-        thread.start()
+
+    def _run(self):
+        """Keep the websocket connected: when it closes, it is opened again
+        after reconnect_delay, until the connection is stopped."""
+        attempt = 0
+        while not self._stopped.is_set():
+            was_open = self.last_change_at
+            self.ws.run_forever(**self._ws_kwargs)
+            self.connected = False
+            if self._stopped.is_set():
+                return
+            if self.last_change_at != was_open:
+                # it was connected, start the backoff again
+                attempt = 0
+            delay = reconnect_delay(attempt)
+            attempt += 1
+            logger.warning('The websocket of %s closed, reconnecting in %.1f seconds',
+                           ', '.join(self.workspaces()), delay)
+            if self._stopped.wait(delay):
+                return
+            self.reconnections += 1
+            self.ws = self._new_websocket()
 
     def stop(self):
+        """Close the websocket and stop all the streams using it"""
+        self._stopped.set()
         self.ws.close()
-        super(WebsocketsChangesStream, self).stop()
+        with self._dispatch_condition:
+            self._dispatch_condition.notify()
+        with self._streams_lock:
+            streams = [stream for streams in self._streams.values() for stream in streams]
+        for stream in streams:
+            stream.stop()
 
-    def on_open(self):
+    def _send_join(self, workspace_name):
         from faraday_client.persistence.server.server import _create_server_api_url, _post  # pylint:disable=import-outside-toplevel
 
-        response = _post(
-            _create_server_api_url() +
-            '/ws/{}/websocket_token/'.format(self.workspace_name),
-            expected_response=200)
-        token = response['token']
-        self.ws.send(json.dumps({
-            'action': 'JOIN_WORKSPACE',
-            'workspace': self.workspace_name,
-            'token': token,
-        }))
-
-    def on_message(self, message):
-        logger.debug('New message {0}'.format(message))
-        self.changes_queue.put(message)
+        # a new token each time, the one of the last connection may be expired
+        try:
+            response = _post(
+                _create_server_api_url() +
+                '/ws/{}/websocket_token/'.format(workspace_name),
+                expected_response=200)
+            token = response['token']
+            self.ws.send(json.dumps({
+                'action': 'JOIN_WORKSPACE',
+                'workspace': workspace_name,
+                'token': token,
+            }))
+        except Exception as ex:
+            logger.error('Could not join the workspace %s: %s', workspace_name, ex)
+            return False
+        return True
 
-    def on_error(ws, error):
-        logger.error('Websocket connection error: {0}'.format(error))
+    # the websocket client passes the WebSocketApp as the first argument of
+    # the callbacks or not, depending on its version
 
-    def on_close(self):
-        pass
+    def on_open(self, *args):
+        with self._streams_lock:
+            # the workspaces joined from now on are sent by join
+            self.connected = True
+            workspace_names = list(self._streams)
+        for workspace_name in workspace_names:
+            if not self._send_join(workspace_name):
+                # without joining the workspace no change arrives, try again
+                self.ws.close()
+                return
+        last_change_at, self.last_change_at = self.last_change_at, time()
+        if last_change_at is not None:
+            # changes may have been missed while it was disconnected
+            thread = threading.Thread(target=self.catch_up,
+                                      args=(workspace_names, last_change_at - CATCH_UP_MARGIN),
+                                      name='WebsocketsChangesCatchUp')
+            thread.daemon = True
+            thread.start()
 
-    def __enter__(self):
-        return self
+    def catch_up(self, workspace_names, since):
+        """Put in the streams a change for each host, service and vuln of
+        their workspace created or modified since that time"""
+        from faraday_client.persistence.server.server import iter_hosts, iter_services, iter_all_vulns  # pylint:disable=import-outside-toplevel
 
-    def __exit__(self, type, value, traceback):
-        return False
+        for workspace_name in workspace_names:
+            changes = 0
+            try:
+                for object_type, iter_pages in (('Host', iter_hosts),
+                                                ('Service', iter_services),
+                                                (None, iter_all_vulns)):
+                    for rows in _changed_pages(iter_pages, workspace_name, since):
+                        for row in rows:
+                            change = catch_up_change(row, since, object_type)
+                            if change is not None:
+                                self._route(workspace_name, json.dumps(change))
+                                changes += 1
+            except Exception as ex:
+                logger.error('Could not get the changes of %s missed while disconnected: %s',
+                             workspace_name, ex)
+            logger.info('%d changes of %s missed while disconnected', changes, workspace_name)
 
-    def __next__(self):
-        return self
+    def _route(self, workspace_name, message):
+        with self._streams_lock:
+            if workspace_name is None and len(self._streams) == 1:
+                # a server which doesn't say the workspace of its changes
+                workspace_name = next(iter(self._streams))
+            streams = list(self._streams.get(workspace_name, ()))
+        if not streams:
+            logger.debug('Change of a workspace not joined: %r', message)
+        for stream in streams:
+            stream._put(message)
 
-    def __iter__(self):
+    def on_message(self, *args):
+        message = args[-1]
+        logger.debug('New message {0}'.format(message))
+        self.last_change_at = time()
         try:
-            data = json.loads(self.changes_queue.get_nowait())
-        except Empty:
+            workspace_name = json.loads(message).get('workspace')
+        except (ValueError, TypeError, AttributeError):
+            workspace_name = None
+        self._route(workspace_name, message)
+
+    def on_error(self, *args):
+        logger.error('Websocket connection error: {0}'.format(args[-1]))
+
+    def on_close(self, *args):
+        self.connected = False
+
+
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+def shared_connection(server_url):
+    """The WebsocketsConnection to server_url shared by the changes streams
+    of all the workspaces. It stays open while no workspace is joined, so
+    switching workspaces doesn't reconnect."""
+    with _CONNECTIONS_LOCK:
+        connection = _CONNECTIONS.get(server_url)
+        if connection is None or connection.stopped:
+            connection = _CONNECTIONS[server_url] = WebsocketsConnection(server_url)
+        return connection
+
+
+class WebsocketsChangesStream(ChangesStream):
+    """The changes of a workspace, as they arrive through connection (a
+    WebsocketsConnection). Without one, the stream opens its own
+    connection to server_url and closes it when it stops."""
+
+    def __init__(self, workspace_name, server_url=None, connection=None, **params):
+        super(WebsocketsChangesStream, self).__init__()
+        self.workspace_name = workspace_name
+        self._own_connection = connection is None
+        if connection is None:
+            connection = WebsocketsConnection(server_url)
+        self.connection = connection
+        self._base_url = connection._base_url
+        self._subscribed = False
+        connection.join(self)
+
+    @property
+    def connected(self):
+        return self.connection.connected
+
+    @property
+    def reconnections(self):
+        return self.connection.reconnections
+
+    def _put(self, message):
+        super(WebsocketsChangesStream, self)._put(message)
+        if self._subscribed:
+            self.connection.schedule(self)
+
+    def subscribe(self, callback, linger=None):
+        """Like ChangesStream.subscribe, but the callbacks are called from
+        the dispatcher thread of the connection, shared by its streams"""
+        with self._subscribers_lock:
+            if linger is not None:
+                self.linger = linger
+            self._subscribers.append(callback)
+            self._subscribed = True
+        self.connection.subscribe(self)
+
+    def stop(self):
+        if self._stop:
             return
-        yield data
+        self.connection.leave(self)
+        if self._own_connection:
+            self.connection.stop()
+        super(WebsocketsChangesStream, self).stop()
 
     def _get_object_type_and_name_from_change(self, change):
         try:
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import threading
+from collections import OrderedDict
+from time import time
+
+# both kinds of vulns share the same ids, and a change may name either
+_SIGNATURE_FAMILIES = {'VulnerabilityWeb': 'Vulnerability'}
+
+
+class _Write:
+    __slots__ = ('pending', 'rev', 'expires')
+
+    def __init__(self, pending, rev, expires):
+        self.pending = pending
+        self.rev = rev
+        self.expires = expires
+
+
+class EchoFilter:
+    """Remembers the objects this client wrote, so their changes coming
+    back in the changes stream (the echo of our own writes) can be skipped.
+
+    Each write lets one change of the object be skipped, during ttl seconds
+    after it. If both the write and the change have a revision, they must
+    match. Each workspace keeps at most max_entries objects, the ones
+    written the longest ago are forgotten first.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._workspaces = {}
+        self._lock = threading.Lock()
+        self.echoes = 0
+
+    @staticmethod
+    def _key(class_signature, obj_id):
+        return _SIGNATURE_FAMILIES.get(class_signature, class_signature), str(obj_id)
+
+    def remember(self, workspace_name, class_signature, obj_id, rev=None):
+        """A write of the object was sent to the server"""
+        if obj_id is None:
+            return
+        key = self._key(class_signature, obj_id)
+        with self._lock:
+            writes = self._workspaces.setdefault(workspace_name, OrderedDict())
+            write = writes.get(key)
+            if write is None or write.expires < time():
+                writes[key] = _Write(1, rev, time() + self.ttl)
+            else:
+                write.pending += 1
+                write.rev = rev
+                write.expires = time() + self.ttl
+            writes.move_to_end(key)
+            while len(writes) > self.max_entries:
+                writes.popitem(last=False)
+
+    def forget(self, workspace_name, class_signature, obj_id):
+        """Undo a remember, because the write failed"""
+        key = self._key(class_signature, obj_id)
+        with self._lock:
+            writes = self._workspaces.get(workspace_name)
+            write = writes.get(key) if writes is not None else None
+            if write is not None:
+                write.pending -= 1
+                if write.pending <= 0:
+                    del writes[key]
+
+    def is_echo(self, workspace_name, change):
+        """Return True if change (a change of the changes stream) is the echo
+        of a write of ours. Each write is only the echo of one change."""
+        key = self._key(change.get('type'), change.get('id'))
+        with self._lock:
+            writes = self._workspaces.get(workspace_name)
+            write = writes.get(key) if writes is not None else None
+            if write is None:
+                return False
+            if write.expires < time():
+                del writes[key]
+                return False
+            rev = change.get('rev')
+            if rev is not None and write.rev is not None and rev != write.rev:
+                return False
+            write.pending -= 1
+            if write.pending <= 0:
+                del writes[key]
+            self.echoes += 1
+            return True
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(writes) for writes in self._workspaces.values())
+
+    def clear(self, workspace_name=None):
+        with self._lock:
+            if workspace_name is None:
+                self._workspaces.clear()
+            else:
+                self._workspaces.pop(workspace_name, None)
+
+
+# I'm Py3
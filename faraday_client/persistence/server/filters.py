@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Faraday Penetration Test IDE
+# Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+# See the file 'doc/LICENSE' for the license information
+
+
+"""Filter expressions for the models.get_* functions.
+
+Expressions are built from the attributes of F and combined with & (and),
+| (or) and ~ (not):
+
+    where = F.severity.in_(['high', 'critical']) & (F.status == 'open')
+    vulns = models.get_all_vulns(workspace_name, where=where)
+
+Mind the parenthesis: in python & binds tighter than ==.
+
+The server only knows how to filter a table by equality of some of its
+columns, so the parts of the expression that can be written that way are
+sent to it as query parameters (see Filter.server_params) and the whole
+expression is evaluated again with the objects the server answered.
+"""
+from __future__ import absolute_import
+
+import itertools
+import operator
+import re
+
+# an in_ on a server column is sent as a request for each value,
+# no expression sends more requests than this
+MAX_SERVER_REQUESTS = 10
+
+
+class Filter:
+    """The base of all the filter expressions"""
+
+    def matches(self, obj):
+        raise NotImplementedError
+
+    def server_params(self, columns):
+        """Return a list of query parameters dictionaries. Between all of
+        them, the server answers (at least) every object matching the filter.
+
+        columns maps the attributes of the objects to the parameters the
+        server knows how to filter by equality. Each of its values is a
+        tuple (param_name, to_server) where to_server translates the value
+        of the object to the one the server expects.
+        """
+        return [{}]
+
+    def fields(self):
+        """Return the set of the attributes used by the filter"""
+        return set()
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Comparison(Filter):
+
+    def __init__(self, field, compare, value, description):
+        self.field = field
+        self.compare = compare
+        self.value = value
+        self.description = description
+
+    def matches(self, obj):
+        try:
+            return bool(self.compare(getattr(obj, self.field, None), self.value))
+        except TypeError:
+            return False
+
+    def fields(self):
+        return {self.field}
+
+    def __repr__(self):
+        return 'F.{0} {1} {2!r}'.format(self.field, self.description, self.value)
+
+
+class Equal(Comparison):
+    """Comparisons the server can do, if it has a column for the field"""
+
+    def __init__(self, field, compare, value, description, server_values):
+        Comparison.__init__(self, field, compare, value, description)
+        self.server_values = server_values
+
+    def server_params(self, columns):
+        if self.field not in columns or len(self.server_values) > MAX_SERVER_REQUESTS:
+            return [{}]
+        param_name, to_server = columns[self.field]
+        return [{param_name: to_server(value)} for value in self.server_values]
+
+
+class And(Filter):
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def matches(self, obj):
+        return self.left.matches(obj) and self.right.matches(obj)
+
+    def server_params(self, columns):
+        params_list = []
+        for left, right in itertools.product(self.left.server_params(columns),
+                                             self.right.server_params(columns)):
+            if any(left[name] != value for name, value in right.items() if name in left):
+                # nothing can match both
+                continue
+            params = dict(left, **right)
+            if params not in params_list:
+                params_list.append(params)
+        if len(params_list) > MAX_SERVER_REQUESTS:
+            return [{}]
+        return params_list
+
+    def fields(self):
+        return self.left.fields() | self.right.fields()
+
+    def __repr__(self):
+        return '({0!r} & {1!r})'.format(self.left, self.right)
+
+
+class Or(Filter):
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def matches(self, obj):
+        return self.left.matches(obj) or self.right.matches(obj)
+
+    def server_params(self, columns):
+        params_list = self.left.server_params(columns)
+        for params in self.right.server_params(columns):
+            if params not in params_list:
+                params_list.append(params)
+        if {} in params_list or len(params_list) > MAX_SERVER_REQUESTS:
+            return [{}]
+        return params_list
+
+    def fields(self):
+        return self.left.fields() | self.right.fields()
+
+    def __repr__(self):
+        return '({0!r} | {1!r})'.format(self.left, self.right)
+
+
+class Not(Filter):
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def matches(self, obj):
+        return not self.expression.matches(obj)
+
+    def fields(self):
+        return self.expression.fields()
+
+    def __repr__(self):
+        return '~{0!r}'.format(self.expression)
+
+
+def _contains(attribute, value):
+    return attribute is not None and value in attribute
+
+
+def _matches_regex(attribute, regex):
+    return attribute is not None and regex.search(attribute) is not None
+
+
+class Field:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, value):
+        return Equal(self.name, operator.eq, value, '==', [value])
+
+    def __ne__(self, value):
+        return Comparison(self.name, operator.ne, value, '!=')
+
+    def __lt__(self, value):
+        return Comparison(self.name, operator.lt, value, '<')
+
+    def __le__(self, value):
+        return Comparison(self.name, operator.le, value, '<=')
+
+    def __gt__(self, value):
+        return Comparison(self.name, operator.gt, value, '>')
+
+    def __ge__(self, value):
+        return Comparison(self.name, operator.ge, value, '>=')
+
+    def in_(self, values):
+        values = list(values)
+        return Equal(self.name, lambda attribute, values: attribute in values,
+                     values, 'in', values)
+
+    def contains(self, value):
+        """For list attributes, like the ports of a service"""
+        return Equal(self.name, _contains, value, 'contains', [value])
+
+    def matches(self, regex):
+        """Like re.search"""
+        return Comparison(self.name, _matches_regex, re.compile(regex), 'matches')
+
+    # __eq__ is overloaded, fields can't be hashed
+    __hash__ = None
+
+
+class _Fields:
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Field(name)
+
+
+F = _Fields()
+
+
+def all_of(filters):
+    """Join the filters with &. None if there isn't any."""
+    filters = list(filters)
+    if not filters:
+        return None
+    expression = filters[0]
+    for other in filters[1:]:
+        expression = expression & other
+    return expression
+
+
+def any_of(filters):
+    """Join the filters with |. None if there isn't any."""
+    filters = list(filters)
+    if not filters:
+        return None
+    expression = filters[0]
+    for other in filters[1:]:
+        expression = expression | other
+    return expression
+
+
+# I'm Py3
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import logging
+import pickle
+import threading
+from concurrent import futures
+
+logger = logging.getLogger(__name__)
+
+# seconds resolve_id and getID wait for the server to answer,
+# as much as the old getID retries added up to
+ID_TIMEOUT = 12
+
+# python < 3.8 doesn't complain when a done future is set again
+_InvalidStateError = getattr(futures, 'InvalidStateError', RuntimeError)
+
+_PLACEHOLDER_LOCK = threading.Lock()
+_PLACEHOLDER_NUMBERS = itertools.count(1)
+
+
+class PlaceholderId(str):
+    """Stands for the id of an object the server didn't answer about yet.
+
+    It can be used as the parent id of other objects; resolve_id turns it
+    into the real id once the server answered.
+    """
+
+    def __new__(cls, future):
+        placeholder = str.__new__(cls, 'pending-{0}'.format(next(_PLACEHOLDER_NUMBERS)))
+        placeholder.future = future
+        return placeholder
+
+    def __reduce__(self):
+        # the future can't be pickled, send the real id if we have it
+        obj_id = resolve_id(self, timeout=0)
+        if obj_id is None:
+            raise pickle.PicklingError('{0} has no id yet, it can not be pickled'.format(self))
+        return str, (str(obj_id), )
+
+
+class IdFuture(futures.Future):
+    """The id an object gets when the server answers about it.
+
+    Being a concurrent.futures.Future, callers can block on result(timeout),
+    register callbacks with add_done_callback or await it with
+    asyncio.wrap_future. It also has the is_set and wait methods of the
+    Event it replaces.
+    """
+
+    def __init__(self):
+        futures.Future.__init__(self)
+        self._placeholder = None
+
+    @property
+    def placeholder(self):
+        """A PlaceholderId bound to this future"""
+        if self._placeholder is None:
+            with _PLACEHOLDER_LOCK:
+                if self._placeholder is None:
+                    self._placeholder = PlaceholderId(self)
+        return self._placeholder
+
+    def resolve(self, obj_id):
+        """Set the id, unless it was already set. Return True if it was set"""
+        if self.done():
+            return False
+        try:
+            self.set_result(obj_id)
+        except _InvalidStateError:
+            return False
+        return True
+
+    def fail(self, error):
+        """The object couldn't be saved, waiters get the error"""
+        if self.done():
+            return False
+        try:
+            self.set_exception(error)
+        except _InvalidStateError:
+            return False
+        return True
+
+    def is_set(self):
+        return self.done()
+
+    def wait(self, timeout=None):
+        return bool(futures.wait([self], timeout).done)
+
+
+def is_placeholder(obj_id):
+    return isinstance(obj_id, PlaceholderId)
+
+
+def wait_for_id(obj_id, timeout=ID_TIMEOUT):
+    """Like resolve_id, but raise the error the object couldn't be saved
+    with, or a futures.TimeoutError if the server didn't answer in time."""
+    if not is_placeholder(obj_id):
+        return obj_id
+    try:
+        return obj_id.future.result(timeout)
+    except futures.TimeoutError:
+        raise futures.TimeoutError('The server did not answer the id for {0}'.format(obj_id))
+
+
+def resolve_id(obj_id, timeout=ID_TIMEOUT):
+    """Return the real id for obj_id, waiting at most timeout seconds if it is
+    a placeholder. None if the object couldn't be saved in that time."""
+    try:
+        return wait_for_id(obj_id, timeout)
+    except futures.TimeoutError:
+        logger.info('The server did not answer the id for %s', obj_id)
+    except Exception as ex:
+        logger.info('The object of %s could not be saved: %s', obj_id, ex)
+    return None
+
+
+# I'm Py3
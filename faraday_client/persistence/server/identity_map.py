@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import threading
+from collections import OrderedDict
+from time import time
+
+
+class IdentityMap:
+    """A thread safe LRU cache of model objects, one for each workspace,
+    keyed by the class_signature and the id of the objects.
+
+    Each workspace keeps at most max_entries objects, and an object is
+    forgotten ttl seconds after it was put in the map, so changes made by
+    others are seen even if nobody tells us about them.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._workspaces = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(class_signature, obj_id):
+        # ids come as ints from the server and sometimes as strings from the
+        # plugins and the GUI
+        return class_signature, str(obj_id)
+
+    def get(self, workspace_name, class_signature, obj_id):
+        """Return the object or None if it isn't in the map (or expired)"""
+        key = self._key(class_signature, obj_id)
+        with self._lock:
+            objects = self._workspaces.get(workspace_name)
+            entry = objects.get(key) if objects is not None else None
+            if entry is None or entry[1] < time():
+                if entry is not None:
+                    del objects[key]
+                self.misses += 1
+                return None
+            objects.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, workspace_name, obj, obj_id=None):
+        """Keep obj in the map. obj_id is used if the object doesn't have
+        its id yet, as it happens while it is being saved."""
+        obj_id = obj_id if obj_id is not None else obj.id
+        if obj_id is None:
+            return
+        key = self._key(obj.class_signature, obj_id)
+        with self._lock:
+            objects = self._workspaces.setdefault(workspace_name, OrderedDict())
+            objects[key] = (obj, time() + self.ttl)
+            objects.move_to_end(key)
+            while len(objects) > self.max_entries:
+                objects.popitem(last=False)
+
+    def remove(self, workspace_name, class_signature, obj_id):
+        with self._lock:
+            objects = self._workspaces.get(workspace_name)
+            if objects is not None:
+                objects.pop(self._key(class_signature, obj_id), None)
+
+    def clear(self, workspace_name=None):
+        """Forget the objects of workspace_name, or of every workspace"""
+        with self._lock:
+            if workspace_name is None:
+                self._workspaces.clear()
+            else:
+                self._workspaces.pop(workspace_name, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': sum(len(objects) for objects in self._workspaces.values())}
+
+
+# I'm Py3
@@ -0,0 +1,325 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from faraday_client.config.constant import CONST_FARADAY_HOME_PATH
+from faraday_client.persistence.server import server
+from faraday_client.persistence.server.server_io_exceptions import ChangesStreamStoppedAbruptly
+
+logger = logging.getLogger(__name__)
+
+MIRRORS_PATH = os.path.join(CONST_FARADAY_HOME_PATH, 'mirrors')
+# seconds a mirror which isn't following the changes of its workspace
+# is used after a sync
+MIRROR_MAX_AGE = 300
+
+
+def _value(row):
+    return row.get('value', row)
+
+
+def _str_or_none(value):
+    return None if value is None else str(value)
+
+
+def _service_port(value):
+    if value.get('port') is not None:
+        return value['port']
+    ports = value.get('ports')
+    if isinstance(ports, (list, tuple)):
+        return ports[0] if ports else None
+    return ports
+
+
+# the columns of each table besides id and the row itself, and how to get
+# them from the value of a row. Reads can filter by them.
+MIRROR_COLUMNS = {
+    'hosts': {'ip': lambda value: value.get('ip', value.get('name')),
+              'name': lambda value: value.get('name'),
+              'os': lambda value: value.get('os')},
+    'services': {'host_id': lambda value: value.get('parent') or value.get('host_id'),
+                 'name': lambda value: value.get('name'),
+                 'port': _service_port,
+                 'protocol': lambda value: value.get('protocol'),
+                 'status': lambda value: value.get('status')},
+    'vulns': {'type': lambda value: value.get('type'),
+              'parent_id': lambda value: value.get('parent'),
+              'parent_type': lambda value: value.get('parent_type'),
+              'target': lambda value: value.get('target'),
+              'name': lambda value: value.get('name'),
+              'severity': lambda value: value.get('severity'),
+              'status': lambda value: value.get('status'),
+              'confirmed': lambda value: str(bool(value.get('confirmed'))).lower()},
+    'notes': {},
+    'credentials': {},
+}
+
+# the query params of the server each table can answer, and their column.
+# Reads with any other param are left to the server.
+MIRROR_PARAMS = {
+    'hosts': {'object_id': 'id', 'ip': 'ip', 'name': 'name', 'os': 'os'},
+    'services': {'object_id': 'id', 'host_id': 'host_id', 'name': 'name', 'port': 'port',
+                 'protocol': 'protocol', 'status': 'status'},
+    'vulns': {'object_id': 'id', 'type': 'type', 'target': 'target', 'name': 'name',
+              'severity': 'severity', 'status': 'status', 'confirmed': 'confirmed'},
+    'notes': {'id': 'id'},
+    'credentials': {'id': 'id'},
+}
+
+# the table of each type of object of the changes stream
+CHANGE_TYPE_TABLES = {
+    'Host': 'hosts',
+    'Service': 'services',
+    'Vulnerability': 'vulns',
+    'VulnerabilityWeb': 'vulns',
+    'Note': 'notes',
+    'Cred': 'credentials',
+}
+
+
+def _fetch_rows(table, workspace_name, obj_id):
+    """Ask the server for the current rows of an object"""
+    if table == 'hosts':
+        return server.get_hosts(workspace_name, object_id=obj_id)
+    if table == 'services':
+        return server.get_services(workspace_name, object_id=obj_id)
+    if table == 'vulns':
+        return server.get_all_vulns(workspace_name, object_id=obj_id)
+    if table == 'notes':
+        return server.get_notes(workspace_name, id=obj_id)
+    return server.get_credentials(workspace_name, id=obj_id)
+
+
+def _sync_pages(table, workspace_name, page_size):
+    """The rows of the whole table, a page at a time"""
+    if table == 'hosts':
+        return server.iter_hosts(workspace_name, page_size)
+    if table == 'services':
+        return server.iter_services(workspace_name, page_size)
+    if table == 'vulns':
+        return server.iter_all_vulns(workspace_name, page_size)
+    if table == 'notes':
+        return [server.get_notes(workspace_name)]
+    return [server.get_credentials(workspace_name)]
+
+
+def _as_list_row(row):
+    """The server sends the objects of a list as {'id', 'value': {...}} and
+    a single object as the value alone. Keep them all like the former, as
+    the models expect from lists."""
+    if 'value' in row:
+        return row
+    return {'_id': row.get('_id'), 'id': row.get('id'), 'value': row}
+
+
+def _row_id(row):
+    value = _value(row)
+    return value.get('id', row.get('id'))
+
+
+class WorkspaceMirror:
+    """A local copy of the hosts, services, vulns, notes and credentials of
+    a workspace, in a SQLite database in WAL mode, so reads don't block
+    while the changes are written.
+
+    sync() copies the workspace from the server and apply_changes() keeps
+    it current with the changes of the changes stream (follow() does it in
+    a thread). The rows are kept as the server sends them, query() returns
+    them as the server.get_* functions do.
+    """
+
+    def __init__(self, workspace_name, path=None):
+        self.workspace_name = workspace_name
+        if path is None:
+            if not os.path.isdir(MIRRORS_PATH):
+                os.makedirs(MIRRORS_PATH)
+            path = os.path.join(MIRRORS_PATH, '{0}.sqlite'.format(workspace_name))
+        self.path = path
+        self.synced_at = None
+        self.following = False
+        # a change couldn't be applied, the mirror waits for a sync
+        self._missed_changes = False
+        self._stream = None
+        self._write_lock = threading.RLock()
+        self._readers = threading.local()
+        self._connection = self._connect()
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+
+    def _reader(self):
+        """Each thread reads with its own connection, WAL lets them read
+        while another one writes. In memory databases can't be shared
+        between connections, those read with the one that writes."""
+        if self.path == ':memory:':
+            return self._connection
+        connection = getattr(self._readers, 'connection', None)
+        if connection is None:
+            connection = self._readers.connection = self._connect()
+        return connection
+
+    def _create_tables(self):
+        with self._write_lock:
+            for table, columns in MIRROR_COLUMNS.items():
+                column_names = ''.join(', {0} TEXT'.format(name) for name in columns)
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS {0} (id TEXT PRIMARY KEY, row TEXT{1})'.format(
+                        table, column_names))
+                for name in columns:
+                    self._connection.execute(
+                        'CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(table, name))
+
+    def close(self):
+        self.stop_following()
+        self._connection.close()
+
+    def is_fresh(self):
+        """Reads can be answered by the mirror: it was synced, didn't miss
+        any change, and is following the changes or was synced at most
+        MIRROR_MAX_AGE seconds ago."""
+        if self.synced_at is None or self._missed_changes:
+            return False
+        return self.following or time.time() - self.synced_at < MIRROR_MAX_AGE
+
+    def _insert_rows(self, table, rows):
+        columns = MIRROR_COLUMNS[table]
+        statement = 'INSERT OR REPLACE INTO {0} (id, row{1}) VALUES (?, ?{2})'.format(
+            table, ''.join(', ' + name for name in columns), ', ?' * len(columns))
+        values = []
+        for row in rows:
+            row = _as_list_row(row)
+            value = _value(row)
+            values.append([_str_or_none(_row_id(row)), json.dumps(row)] +
+                          [_str_or_none(get(value)) for get in columns.values()])
+        self._connection.executemany(statement, values)
+
+    def sync(self, page_size=server.DEFAULT_PAGE_SIZE):
+        """Copy the workspace from the server, replacing what the mirror
+        had. Readers see the old copy until the new one is complete."""
+        with self._write_lock:
+            synced_at = time.time()
+            self._connection.execute('BEGIN')
+            try:
+                for table in MIRROR_COLUMNS:
+                    self._connection.execute('DELETE FROM {0}'.format(table))
+                    for rows in _sync_pages(table, self.workspace_name, page_size):
+                        self._insert_rows(table, rows)
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+            self.synced_at = synced_at
+            self._missed_changes = False
+
+    def apply_change(self, change):
+        self.apply_changes([change])
+
+    def apply_changes(self, changes):
+        """Apply a batch of changes of the changes stream, in a transaction:
+        the objects created or updated are asked to the server, the ones
+        deleted are removed."""
+        new_rows = []
+        for change in changes:
+            table = CHANGE_TYPE_TABLES.get(change.get('type'))
+            obj_id = change.get('id')
+            if table is None or obj_id is None:
+                continue
+            try:
+                rows = [] if change.get('action') == 'DELETE' else _fetch_rows(
+                    table, self.workspace_name, obj_id)
+            except Exception as ex:
+                logger.info('Could not mirror the change of %s %s: %s', change.get('type'), obj_id, ex)
+                self._missed_changes = True
+                continue
+            new_rows.append((table, obj_id, rows))
+        if not new_rows:
+            return
+        with self._write_lock:
+            self._connection.execute('BEGIN')
+            try:
+                for table, obj_id, rows in new_rows:
+                    self._connection.execute('DELETE FROM {0} WHERE id = ?'.format(table), (str(obj_id), ))
+                    self._insert_rows(table, rows)
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def can_answer(self, table, params):
+        supported = MIRROR_PARAMS[table]
+        return all(name in supported or name == 'fields' or value is None
+                   for name, value in params.items())
+
+    def query(self, table, params):
+        """Return the rows of table matching params, as the server would,
+        None if the params can't be answered by the mirror. The fields
+        param is ignored, the whole rows are returned."""
+        if not self.can_answer(table, params):
+            return None
+        supported = MIRROR_PARAMS[table]
+        conditions = []
+        values = []
+        for name, value in sorted(params.items()):
+            if name in supported and value is not None:
+                conditions.append('{0} = ?'.format(supported[name]))
+                values.append(str(value))
+        statement = 'SELECT row FROM {0}'.format(table)
+        if conditions:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        rows = self._reader().execute(statement + ' ORDER BY rowid', values).fetchall()
+        return [json.loads(row) for row, in rows]
+
+    def count(self, table):
+        return self._reader().execute('SELECT count(*) FROM {0}'.format(table)).fetchone()[0]
+
+    def follow(self, changes_stream):
+        """Apply the changes of changes_stream in a daemon thread, until it
+        stops or stop_following() is called. While it does, the mirror
+        doesn't get old. The changes already waiting in the stream are
+        applied first: open it before sync() for none to be missed."""
+        self._stream = changes_stream
+        self.following = True
+
+        def apply_changes():
+            try:
+                while self._stream is changes_stream:
+                    changes = changes_stream.get_batch()
+                    if changes is None:
+                        break
+                    self.apply_changes(changes)
+            except ChangesStreamStoppedAbruptly:
+                logger.warning('The changes stream of %s stopped, its mirror will get old',
+                               self.workspace_name)
+            finally:
+                if self._stream is changes_stream:
+                    self.following = False
+
+        thread = threading.Thread(target=apply_changes, name='WorkspaceMirror')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop_following(self):
+        stream, self._stream = self._stream, None
+        self.following = False
+        if stream is not None:
+            stream.stop()
+
+
+# I'm Py3
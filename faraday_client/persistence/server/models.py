@@ -8,13 +8,24 @@ See the file 'doc/LICENSE' for the license information
 """
 from __future__ import absolute_import
 
+import copy
+import hashlib
 import logging
+import sys
 from time import time
 import traceback
-from threading import Lock, Condition, RLock, Event
+from threading import Lock, Condition, RLock
+from concurrent.futures import ThreadPoolExecutor
 from faraday_client.persistence.server import server
+from faraday_client.persistence.server.echo_filter import EchoFilter
+from faraday_client.persistence.server.filters import F  # noqa: F401 pylint:disable=unused-import
+from faraday_client.persistence.server.id_future import (IdFuture, ID_TIMEOUT, is_placeholder,
+                                                         resolve_id, wait_for_id)
+from faraday_client.persistence.server.identity_map import IdentityMap
+from faraday_client.persistence.server.mirror import WorkspaceMirror
 from faraday_client.persistence.server.server_io_exceptions import (WrongObjectSignature,
-                                                     CantAccessConfigurationWithoutTheClient)
+                                                     CantAccessConfigurationWithoutTheClient,
+                                                     CantCommunicateWithServerError)
 
 from faraday_client.persistence.server.utils import (force_unique,
                                       get_host_properties,
@@ -28,8 +39,9 @@ from faraday_client.persistence.server.utils import (force_unique,
 
 from faraday_client.model.diff import ModelObjectDiff, MergeSolver
 from faraday_client.model.conflict import ConflictUpdate
-from functools import wraps
+from functools import partial, wraps
 from difflib import Differ
+from collections import namedtuple
 
 
 FARADAY_UP = True
@@ -38,6 +50,21 @@ MERGE_STRATEGY = None  # you may change it the string 'NEW' to prefer new object
                        # the answer is: Faraday.
 logger = logging.getLogger(__name__)
 
+# the objects read from or written to the server, by workspace and id
+IDENTITY_MAP = IdentityMap(max_entries=10000, ttl=60)
+
+# the writes of this client, so the changes stream doesn't tell it back
+ECHO_FILTER = EchoFilter(max_entries=10000, ttl=30)
+
+# the WorkspaceMirror of each workspace, see enable_mirror
+MIRRORS = {}
+
+# objects get_objects_by_ids asks for at the same time, one by one
+BULK_FETCH_CONCURRENCY = 10
+
+# what get_hosts can prefetch
+PREFETCH_RELATIONSHIPS = ('services', 'vulns')
+
 
 def _conf():
     if FARADAY_UP:
@@ -54,26 +81,38 @@ def _get_merge_strategy():
         merge_strategy = MERGE_STRATEGY
     return merge_strategy
 
-_CHANGES_LOCK = Lock()
-
 
-def get_changes_lock():
-    return _CHANGES_LOCK
-
-_LOCAL_CHANGES_ID_TO_REV = {}
-
-
-def local_changes():
-    return _LOCAL_CHANGES_ID_TO_REV
+def _ignore_in_changes(func=None, class_signature=None):
+    """A decorator for the functions writing to the server, which take the
+    workspace name and the object written. The write is remembered in the
+    ECHO_FILTER, so its change in the changes stream can be skipped.
 
+    The delete functions take the id of the object, they are decorated
+    with @_ignore_in_changes(class_signature=...).
+    """
+    if func is None:
+        return partial(_ignore_in_changes, class_signature=class_signature)
 
-def _ignore_in_changes(func):
     @wraps(func)
-    def func_wrapper(*args, **kwargs):
-        with get_changes_lock():
-            json = func(*args, **kwargs)
-            if json.get('ok'):
-                _LOCAL_CHANGES_ID_TO_REV[json['id']] = json['rev']
+    def func_wrapper(workspace_name, obj, *args, **kwargs):
+        if class_signature is None:
+            # CommandRunInformation keeps its id in _id
+            signature, obj_id = obj.class_signature, getattr(obj, 'id', None)
+        else:
+            signature, obj_id = class_signature, obj
+        # updates and deletes are remembered before the request, as their
+        # change may arrive before the response
+        if obj_id is not None:
+            ECHO_FILTER.remember(workspace_name, signature, obj_id)
+        try:
+            json = func(workspace_name, obj, *args, **kwargs)
+        except Exception:
+            if obj_id is not None:
+                ECHO_FILTER.forget(workspace_name, signature, obj_id)
+            raise
+        if obj_id is None and isinstance(json, dict):
+            ECHO_FILTER.remember(workspace_name, signature, json.get('_id') or json.get('id'),
+                                 json.get('rev') or json.get('_rev'))
         return json
     return func_wrapper
 
@@ -108,12 +147,16 @@ def _flatten_dictionary(dictionary):
 
 
 def _get_faraday_ready_objects(workspace_name, faraday_ready_object_dictionaries,
-                               faraday_object_name):
+                               faraday_object_name, fields=None, lazy_batch=None):
     """Takes a workspace name, a faraday object ('hosts', 'vulns',
     or 'services') a row_name (the name of the row where
     the information about the objects live) and an arbitray number
     of params to customize to request.
 
+    If fields is given, the objects are created with only those fields
+    (see _Projection). If lazy_batch is given, the heavy fields missing in
+    the dictionaries are loaded through it when used.
+
     Return a list of faraday objects: either
     Host, Service, Vuln, VulnWeb, Credential or Command.
     """
@@ -126,20 +169,95 @@ def _get_faraday_ready_objects(workspace_name, faraday_ready_object_dictionaries
                        'commands': Command}
 
     appropiate_class = object_to_class[faraday_object_name]
+    if fields is not None:
+        appropiate_class = _projected_class(appropiate_class)
+    elif appropiate_class in _ROW_FILLERS:
+        return _build_objects(workspace_name, faraday_ready_object_dictionaries,
+                              appropiate_class, lazy_batch)
     faraday_objects = []
     if faraday_ready_object_dictionaries:
         for object_dictionary in faraday_ready_object_dictionaries:
             flattened_object_dictionary = _flatten_dictionary(object_dictionary)
-            faraday_objects.append(appropiate_class(flattened_object_dictionary, workspace_name))
+            if fields is not None:
+                # the server may ignore the fields param and send whole rows
+                flattened_object_dictionary = {field: value for field, value
+                                               in flattened_object_dictionary.items() if field in fields}
+            faraday_object = appropiate_class(flattened_object_dictionary, workspace_name)
+            if lazy_batch is not None:
+                lazy_batch.defer_missing_fields(faraday_object, flattened_object_dictionary)
+            faraday_objects.append(faraday_object)
+    return faraday_objects
+
+
+def _build_objects(workspace_name, rows, model_class, lazy_batch=None):
+    """The fast path of _get_faraday_ready_objects for the classes in
+    _ROW_FILLERS: the objects are created without calling their __init__
+    and filled straight from the rows of the server, without flattening them.
+
+    The objects are the same the __init__ of the models would create.
+    They are filled as instances of a subclass without the __setattr__ of
+    the models (there is no fingerprint to forget yet) and get their class
+    when done.
+    """
+    fillers = _ROW_FILLERS[model_class]
+    new_object = object.__new__
+    filling_class = _filling_class(model_class)
+    faraday_objects = []
+    for row in rows or ():
+        value = row.get('value', row)
+        # the same ids _flatten_dictionary and ModelBase.__init__ would give
+        server_id = row.get('_id') or None
+        if 'id' in value and value is not row:
+            obj_id = value['id']
+        elif row.get('id') or (value is row and 'id' in row):
+            obj_id = row['id']
+        else:
+            obj_id = server_id
+        obj = new_object(filling_class)
+        obj._workspace_name = workspace_name
+        obj._server_id = server_id or obj_id
+        obj.id = obj_id
+        obj.name = value.get('name')
+        obj.description = value.get('description', "")
+        obj.owned = value.get('owned', False)
+        obj.owner = _intern(value.get('owner', ''))
+        obj._lazy_metadata = value.get('metadata')
+        obj.parent_id = value.get('parent')
+        obj._updates = None
+        obj._id_future = None
+        obj._prefetched = None
+        obj._fingerprint = None
+        obj.parent_type = _intern(value.get('parent_type', None))
+        for fill in fillers:
+            fill(obj, value)
+        obj.__class__ = model_class
+        if lazy_batch is not None:
+            lazy_batch.defer_missing_fields(obj, value)
+        faraday_objects.append(obj)
     return faraday_objects
 
 
-def _get_faraday_ready_hosts(workspace_name, hosts_dictionaries):
+def _filling_class(model_class):
+    """Return the subclass of model_class _build_objects fills the objects
+    with, it has the same layout and sets the attributes directly."""
+    filling_class = _FILLING_CLASSES.get(model_class)
+    if filling_class is None:
+        filling_class = type(model_class.__name__, (model_class, ),
+                             {'__slots__': (), '__setattr__': object.__setattr__})
+        _FILLING_CLASSES[model_class] = filling_class
+    return filling_class
+
+
+_FILLING_CLASSES = {}
+
+
+def _get_faraday_ready_hosts(workspace_name, hosts_dictionaries, fields=None):
     """Return a list of Hosts created with the information found on hosts_dictionaries"""
-    return _get_faraday_ready_objects(workspace_name, hosts_dictionaries, 'hosts')
+    return _get_faraday_ready_objects(workspace_name, hosts_dictionaries, 'hosts', fields)
 
 
-def _get_faraday_ready_vulns(workspace_name, vulns_dictionaries, vulns_type=None):
+def _get_faraday_ready_vulns(workspace_name, vulns_dictionaries, vulns_type=None, fields=None,
+                             lazy_batch=None):
     """Return a list of Vuln or VulnWeb objects created with the information found on
     vulns_dictionaries.
 
@@ -147,18 +265,21 @@ def _get_faraday_ready_vulns(workspace_name, vulns_dictionaries, vulns_type=None
     Otherwise, vuln_type will be inferred for every vuln_dictionary.
     """
     if vulns_type:
-        return _get_faraday_ready_objects(workspace_name, vulns_dictionaries, vulns_type)
+        return _get_faraday_ready_objects(workspace_name, vulns_dictionaries, vulns_type, fields,
+                                          lazy_batch)
 
     vulns = [vuln for vuln in vulns_dictionaries if vuln['value']['type'] == 'Vulnerability']
     web_vulns = [w_vuln for w_vuln in vulns_dictionaries if w_vuln['value']['type'] == 'VulnerabilityWeb']
-    faraday_ready_vulns = _get_faraday_ready_objects(workspace_name, vulns, 'vulns')
-    faraday_ready_web_vulns = _get_faraday_ready_objects(workspace_name, web_vulns, 'vulns_web')
+    faraday_ready_vulns = _get_faraday_ready_objects(workspace_name, vulns, 'vulns', fields,
+                                                     lazy_batch)
+    faraday_ready_web_vulns = _get_faraday_ready_objects(workspace_name, web_vulns, 'vulns_web', fields,
+                                                         lazy_batch)
     return faraday_ready_vulns + faraday_ready_web_vulns
 
 
-def _get_faraday_ready_services(workspace_name, services_dictionaries):
+def _get_faraday_ready_services(workspace_name, services_dictionaries, fields=None):
     """Return a list of Services created with the information found on services_dictionaries"""
-    return _get_faraday_ready_objects(workspace_name, services_dictionaries, 'services')
+    return _get_faraday_ready_objects(workspace_name, services_dictionaries, 'services', fields)
 
 
 def _get_faraday_ready_credentials(workspace_name, credentials_dictionaries):
@@ -176,6 +297,60 @@ def _get_faraday_ready_commands(workspace_name, commands_dictionaries):
     return _get_faraday_ready_objects(workspace_name, commands_dictionaries, 'commands')
 
 
+def _cached_by_id(class_signature, id_param):
+    """A decorator for the get_<object> functions. When the object is asked
+    only by its id, it is looked for in the IDENTITY_MAP before asking the
+    server for it."""
+    def decorator(get_function):
+        @wraps(get_function)
+        def wrapper(workspace_name, obj_id=None, **params):
+            obj_id = resolve_id(params.pop(id_param, obj_id))
+            if obj_id is None or params:
+                return get_function(workspace_name, obj_id, **params)
+            obj = IDENTITY_MAP.get(workspace_name, class_signature, obj_id)
+            if obj is None:
+                obj = get_function(workspace_name, obj_id)
+                if obj is not None:
+                    IDENTITY_MAP.put(workspace_name, obj)
+            return obj
+        return wrapper
+    return decorator
+
+
+def forget_object(workspace_name, object_signature, object_id, parents=False):
+    """Remove the object from the IDENTITY_MAP, for example when someone
+    else changed it. If parents is True, its host and service are removed
+    too (see forget_parents)."""
+    if parents:
+        if object_signature in (Vuln.class_signature, VulnWeb.class_signature):
+            signatures = (Vuln.class_signature, VulnWeb.class_signature)
+        else:
+            signatures = (object_signature, )
+        for signature in signatures:
+            obj = IDENTITY_MAP.get(workspace_name, signature, object_id)
+            if obj is not None:
+                forget_parents(workspace_name, obj)
+    if object_signature in (Vuln.class_signature, VulnWeb.class_signature):
+        # both kinds of vulns share the same ids
+        IDENTITY_MAP.remove(workspace_name, Vuln.class_signature, object_id)
+        IDENTITY_MAP.remove(workspace_name, VulnWeb.class_signature, object_id)
+    else:
+        IDENTITY_MAP.remove(workspace_name, object_signature, object_id)
+
+
+def forget_parents(workspace_name, obj):
+    """Remove the host and service obj belongs to from the IDENTITY_MAP,
+    as their children and counts change when obj is created or deleted."""
+    parent_type = Host.class_signature if obj.class_signature == Service.class_signature else obj.parent_type
+    if obj.parent_id is None or parent_type not in (Host.class_signature, Service.class_signature):
+        return
+    if parent_type == Service.class_signature:
+        service = IDENTITY_MAP.get(workspace_name, parent_type, obj.parent_id)
+        if service is not None:
+            forget_parents(workspace_name, service)
+    IDENTITY_MAP.remove(workspace_name, parent_type, obj.parent_id)
+
+
 def get_changes_stream(workspace_name):
     """Take a workspace_name as a string.
     Return a couchDB change_stream with the changes relevant to the workspace
@@ -186,16 +361,233 @@ def get_changes_stream(workspace_name):
                                      heartbeat='1000')
 
 
-def get_hosts(workspace_name, **params):
+def enable_mirror(workspace_name, path=None, follow=True, page_size=server.DEFAULT_PAGE_SIZE):
+    """Copy the workspace to a local database (see mirror.WorkspaceMirror)
+    and answer the reads of its hosts, services, vulns, notes and credentials
+    from it while it is fresh. If follow is True the copy is kept current
+    with the changes stream of the workspace.
+
+    Return the WorkspaceMirror.
+    """
+    disable_mirror(workspace_name)
+    workspace_mirror = WorkspaceMirror(workspace_name, path)
+    # joined before the sync, so the changes made while it runs wait in
+    # the stream and are applied once it is done
+    changes_stream = get_changes_stream(workspace_name) if follow else None
+    try:
+        workspace_mirror.sync(page_size)
+    except BaseException:
+        if changes_stream is not None:
+            changes_stream.stop()
+        workspace_mirror.close()
+        raise
+    if changes_stream is not None:
+        workspace_mirror.follow(changes_stream)
+    MIRRORS[workspace_name] = workspace_mirror
+    return workspace_mirror
+
+
+def disable_mirror(workspace_name):
+    workspace_mirror = MIRRORS.pop(workspace_name, None)
+    if workspace_mirror is not None:
+        workspace_mirror.close()
+
+
+def _mirrored(table, get_dictionaries, **mirror_params):
+    """Wrap get_dictionaries(workspace_name, **params) so the rows come from
+    the mirror of the workspace, when there is one, it is fresh and it can
+    answer the params (plus mirror_params, for what get_dictionaries adds).
+    If the server can't be reached, a mirror which isn't fresh is read too.
+    """
+    def get_mirrored_dictionaries(workspace_name, **params):
+        workspace_mirror = MIRRORS.get(workspace_name)
+        if workspace_mirror is None:
+            return get_dictionaries(workspace_name, **params)
+        if workspace_mirror.is_fresh():
+            rows = workspace_mirror.query(table, dict(params, **mirror_params))
+            if rows is not None:
+                return rows
+        try:
+            return get_dictionaries(workspace_name, **params)
+        except CantCommunicateWithServerError:
+            rows = workspace_mirror.query(table, dict(params, **mirror_params))
+            if rows is None:
+                raise
+            logger.warning('Could not reach the server, reading the %s of %s from its mirror',
+                           table, workspace_name)
+            return rows
+    return get_mirrored_dictionaries
+
+
+def _as_is(value):
+    return value
+
+
+def _server_severity(severity):
+    return {'info': 'informational', 'med': 'medium'}.get(severity, severity)
+
+
+NOT_CLOSED_VULN_STATUSES = ('open', 're-opened', 'risk-accepted')
+
+# the attributes of the objects the server can filter by, see filters.Filter.server_params
+SERVER_FILTER_COLUMNS = {
+    'hosts': {'ip': ('ip', _as_is),
+              'name': ('name', _as_is),
+              'os': ('os', _as_is)},
+    'vulns': {'name': ('name', _as_is),
+              'severity': ('severity', _server_severity),
+              'status': ('status', _as_is),
+              'confirmed': ('confirmed', lambda confirmed: str(bool(confirmed)).lower())},
+    'services': {'name': ('name', _as_is),
+                 'ports': ('port', _as_is),
+                 'protocol': ('protocol', _as_is),
+                 'status': ('status', _as_is)},
+}
+
+
+# the fields every projected object has, see _Projection
+PROJECTION_REQUIRED_FIELDS = ('_id', 'id', 'parent', 'parent_type', 'type')
+
+# the lists of vulns leave out their big fields, they are requested the
+# first time something uses them (see _LazyFieldsBatch)
+LAZY_VULN_FIELDS = True
+# the server's name of each of those fields and the attribute it goes to
+VULN_HEAVY_FIELDS = {'data': 'data',
+                     'request': 'request',
+                     'response': 'response',
+                     '_attachments': 'attachments'}
+# every other field the Vuln and VulnWeb models use
+VULN_LIGHT_FIELDS = ('_id', 'id', 'type', 'name', 'desc', 'description', 'owned', 'owner',
+                     'metadata', 'parent', 'parent_type', 'severity', 'refs', 'confirmed',
+                     'resolution', 'status', 'policyviolations', 'external_id', 'path',
+                     'website', 'method', 'pname', 'params', 'query', 'hostnames', 'impact',
+                     'service', 'tags', 'target')
+# once this many vulns of the same list loaded their big fields, the next
+# LAZY_FIELDS_WINDOW vulns of the list waiting for them are requested too
+LAZY_FIELDS_BATCH_AFTER = 3
+LAZY_FIELDS_WINDOW = 50
+
+
+def _get_filtered_objects(workspace_name, get_dictionaries, get_objects,
+                          columns, where, fields, lazy_fields=False, **params):
+    """Get the dictionaries with get_dictionaries(workspace_name, **params)
+    and turn them into objects with get_objects.
+
+    If where (a filters.Filter) is given, the part of it the server
+    understands is sent as params and the objects are filtered with the rest.
+
+    If fields is given, only those fields (and the ones used by where) are
+    asked to the server and the objects are created with them.
+
+    If lazy_fields is True (for vulns) and LAZY_VULN_FIELDS is set, the
+    VULN_HEAVY_FIELDS are left out of lists and loaded when used.
+    """
+    if fields is not None:
+        fields = set(fields) | set(PROJECTION_REQUIRED_FIELDS)
+        if where is not None:
+            fields |= where.fields()
+        params['fields'] = ','.join(sorted(fields))
+        get_objects = partial(get_objects, fields=fields)
+    elif lazy_fields and LAZY_VULN_FIELDS and 'object_id' not in params:
+        batch = _LazyFieldsBatch(workspace_name, get_dictionaries)
+        light_fields = set(VULN_LIGHT_FIELDS)
+        if where is not None:
+            light_fields |= where.fields()
+        params['fields'] = ','.join(sorted(light_fields))
+        get_objects = partial(get_objects, lazy_batch=batch)
+    if where is None:
+        return _remember(workspace_name, fields,
+                         get_objects(workspace_name, get_dictionaries(workspace_name, **params)))
+    params_list = where.server_params(columns)
+    dictionaries = []
+    seen_ids = set()
+    for server_params in params_list:
+        for dictionary in get_dictionaries(workspace_name, **dict(params, **server_params)):
+            if len(params_list) > 1:
+                # an object may match more than one of the requests
+                if dictionary.get('id') in seen_ids:
+                    continue
+                seen_ids.add(dictionary.get('id'))
+            dictionaries.append(dictionary)
+    return _remember(workspace_name, fields,
+                     [obj for obj in get_objects(workspace_name, dictionaries) if where.matches(obj)])
+
+
+def _remember(workspace_name, fields, objects):
+    """Put the objects in the IDENTITY_MAP, unless they are projected"""
+    if fields is None:
+        for obj in objects:
+            IDENTITY_MAP.put(workspace_name, obj)
+    return objects
+
+
+def get_hosts(workspace_name, where=None, fields=None, prefetch=(), **params):
     """Take a workspace name and a arbitrary number of params to customize the
-    request.
+    request. where is an optional filter expression (see filters.F) and
+    fields an optional list of the only fields needed (see _Projection).
+    prefetch may name relationships ('services', 'vulns') loaded for all the
+    hosts at once (see _prefetch_host_children). The prefetched hosts are
+    copies only the caller has, the ones in the IDENTITY_MAP don't keep
+    the children.
 
     Return a list of Host objects.
     """
-    host_dictionaries = server.get_hosts(workspace_name, **params)
-    return _get_faraday_ready_hosts(workspace_name, host_dictionaries)
-
+    unknown = set(prefetch) - set(PREFETCH_RELATIONSHIPS)
+    if unknown:
+        raise ValueError('Can not prefetch {0}'.format(', '.join(sorted(unknown))))
+    hosts = _get_filtered_objects(workspace_name, _mirrored('hosts', server.get_hosts),
+                                  _get_faraday_ready_hosts,
+                                  SERVER_FILTER_COLUMNS['hosts'], where, fields, **params)
+    if prefetch:
+        hosts = [copy.copy(host) for host in hosts]
+        _prefetch_host_children(workspace_name, hosts, prefetch)
+    return hosts
+
+
+def _group_by_parent(objects):
+    children = {}
+    for obj in objects:
+        children.setdefault(str(obj.parent_id), []).append(obj)
+    return children
+
+
+def _prefetch_host_children(workspace_name, hosts, prefetch):
+    """Load the services and/or vulns of all the hosts and keep them in the
+    hosts (and services), so getServices and getVulns don't ask the server.
+
+    The children of each host are asked for, BULK_FETCH_CONCURRENCY hosts at
+    a time, never the ones of the whole workspace. The services keeping
+    their vulns are copies, like the hosts. The children are not updated
+    afterwards, get the hosts again to see changes.
+    """
+    if not hosts:
+        return
 
+    def get_children(host):
+        services = [copy.copy(service)
+                    for service in get_services(workspace_name, host_id=host._server_id)]
+        vulns = get_all_vulns(workspace_name, target=host.ip) if 'vulns' in prefetch else []
+        return services, vulns
+
+    with ThreadPoolExecutor(max_workers=min(BULK_FETCH_CONCURRENCY, len(hosts))) as executor:
+        children = list(executor.map(get_children, hosts))
+    for host, (services, vulns) in zip(hosts, children):
+        if 'services' in prefetch:
+            host._prefetch('services', services)
+        if 'vulns' not in prefetch:
+            continue
+        vulns_by_parent = {
+            parent_type: _group_by_parent(vuln for vuln in vulns if vuln.parent_type == parent_type)
+            for parent_type in ('Host', 'Service')}
+        host_vulns = list(vulns_by_parent['Host'].get(str(host.id), []))
+        for service in services:
+            service_vulns = vulns_by_parent['Service'].get(str(service.id), [])
+            service._prefetch('vulns', service_vulns)
+            host_vulns.extend(service_vulns)
+        host._prefetch('vulns', host_vulns)
+
+
+@_cached_by_id('Host', 'host_id')
 def get_host(workspace_name, host_id=None, **params):
     """Return the host by host_id. None if it can't be found."""
     hosts = get_hosts(workspace_name, object_id=host_id, **params)
@@ -207,71 +599,126 @@ def get_host(workspace_name, host_id=None, **params):
         return hosts.pop()
 
 
-def get_all_vulns(workspace_name, **params):
+def get_all_vulns(workspace_name, where=None, fields=None, **params):
     """Take a workspace name and a arbitrary number of params to customize the
-    request.
+    request. where is an optional filter expression (see filters.F) and
+    fields an optional list of the only fields needed (see _Projection).
 
     Return a list with Vuln and VulnWeb objects.
     """
-    vulns_dictionaries = server.get_all_vulns(workspace_name, **params)
-    return _get_faraday_ready_vulns(workspace_name, vulns_dictionaries)
+    return _get_filtered_objects(workspace_name, _mirrored('vulns', server.get_all_vulns),
+                                 _get_faraday_ready_vulns,
+                                 SERVER_FILTER_COLUMNS['vulns'], where, fields,
+                                 lazy_fields=True, **params)
 
 
-def get_vulns(workspace_name, **params):
+def get_vulns(workspace_name, where=None, fields=None, **params):
     """Take a workspace name and a arbitrary number of params to customize the
-    request.
+    request. where is an optional filter expression (see filters.F) and
+    fields an optional list of the only fields needed (see _Projection).
 
     Return a list of Vuln objects.
     """
-    vulns_dictionaries = server.get_vulns(workspace_name, **params)
-    return _get_faraday_ready_vulns(workspace_name, vulns_dictionaries, vulns_type='vulns')
+    return _get_filtered_objects(workspace_name,
+                                 _mirrored('vulns', server.get_vulns, type='Vulnerability'),
+                                 partial(_get_faraday_ready_vulns, vulns_type='vulns'),
+                                 SERVER_FILTER_COLUMNS['vulns'], where, fields,
+                                 lazy_fields=True, **params)
 
 
+@_cached_by_id('Vulnerability', 'vuln_id')
 def get_vuln(workspace_name, vuln_id=None, **params):
     """Return the Vuln of id vuln_id. None if not found."""
     return force_unique(get_vulns(workspace_name, object_id=vuln_id, **params))
 
 
-def get_web_vulns(workspace_name, **params):
+def get_web_vulns(workspace_name, where=None, fields=None, **params):
     """Take a workspace name and a arbitrary number of params to customize the
-    request.
+    request. where is an optional filter expression (see filters.F) and
+    fields an optional list of the only fields needed (see _Projection).
 
     Return a list of VulnWeb objects.
     """
-    vulns_web_dictionaries = server.get_web_vulns(workspace_name, **params)
-    return _get_faraday_ready_vulns(workspace_name, vulns_web_dictionaries, vulns_type='vulns_web')
+    return _get_filtered_objects(workspace_name,
+                                 _mirrored('vulns', server.get_web_vulns, type='VulnerabilityWeb'),
+                                 partial(_get_faraday_ready_vulns, vulns_type='vulns_web'),
+                                 SERVER_FILTER_COLUMNS['vulns'], where, fields,
+                                 lazy_fields=True, **params)
 
 
+@_cached_by_id('VulnerabilityWeb', 'vuln_id')
 def get_web_vuln(workspace_name, vuln_id=None, **params):
     """Return the WebVuln of id vuln_id. None if not found."""
     return force_unique(get_web_vulns(workspace_name, object_id=vuln_id, **params))
 
 
-def get_services(workspace_name, **params):
-    """Take a workspace name and a arbitrary number of params to customize the
-    request.
-
-    Return a list of Services objects
-    """
+def _get_services_dictionaries(workspace_name, **params):
     services_dictionary = server.get_services(workspace_name, **params)
     # List inside of list, use the inside list...
     if len(services_dictionary) > 0 and type(services_dictionary[0]) == list:
         services_dictionary = services_dictionary[0]
-    return _get_faraday_ready_services(workspace_name, services_dictionary)
+    return services_dictionary
 
 
+def get_services(workspace_name, where=None, fields=None, **params):
+    """Take a workspace name and a arbitrary number of params to customize the
+    request. where is an optional filter expression (see filters.F) and
+    fields an optional list of the only fields needed (see _Projection).
+
+    Return a list of Services objects
+    """
+    return _get_filtered_objects(workspace_name, _mirrored('services', _get_services_dictionaries),
+                                 _get_faraday_ready_services,
+                                 SERVER_FILTER_COLUMNS['services'], where, fields, **params)
+
+
+@_cached_by_id('Service', 'service_id')
 def get_service(workspace_name, service_id=None, **params):
     """Return the Service of id service_id. None if not found."""
     return force_unique(get_services(workspace_name, object_id=service_id, **params))
 
 
+def iter_hosts(workspace_name, page_size=server.DEFAULT_PAGE_SIZE, prefetch=True, **params):
+    """Like get_hosts, but the hosts are requested page_size at a time and
+    yielded as soon as each page arrives, so the whole workspace is never
+    kept in memory.
+
+    Return a generator of Host objects.
+    """
+    for host_dictionaries in server.iter_hosts(workspace_name, page_size, prefetch, **params):
+        for host in _get_faraday_ready_hosts(workspace_name, host_dictionaries):
+            yield host
+
+
+def iter_vulns(workspace_name, page_size=server.DEFAULT_PAGE_SIZE, prefetch=True, **params):
+    """Like get_all_vulns, but the vulns are requested page_size at a time
+    and yielded as soon as each page arrives.
+
+    Return a generator of Vuln and VulnWeb objects.
+    """
+    for vulns_dictionaries in server.iter_all_vulns(workspace_name, page_size, prefetch, **params):
+        for vuln in _get_faraday_ready_vulns(workspace_name, vulns_dictionaries):
+            yield vuln
+
+
+def iter_services(workspace_name, page_size=server.DEFAULT_PAGE_SIZE, prefetch=True, **params):
+    """Like get_services, but the services are requested page_size at a time
+    and yielded as soon as each page arrives.
+
+    Return a generator of Service objects.
+    """
+    for services_dictionaries in server.iter_services(workspace_name, page_size, prefetch, **params):
+        for service in _get_faraday_ready_services(workspace_name, services_dictionaries):
+            yield service
+
+
 def get_credentials(workspace_name, **params):
     """Take a workspace name and a arbitrary number of params to customize the
     request.
 
     Return a list of Credential objects
     """
-    credentials_dictionary = server.get_credentials(workspace_name, **params)
+    credentials_dictionary = _mirrored('credentials', server.get_credentials)(workspace_name, **params)
     return _get_faraday_ready_credentials(workspace_name, credentials_dictionary)
 
 
@@ -286,7 +733,7 @@ def get_notes(workspace_name, **params):
 
     Return a list of Note objects
     """
-    notes_dictionary = server.get_notes(workspace_name, **params)
+    notes_dictionary = _mirrored('notes', server.get_notes)(workspace_name, **params)
     return _get_faraday_ready_notes(workspace_name, notes_dictionary)
 
 
@@ -337,7 +784,35 @@ def get_object(workspace_name, object_signature, object_id):
     except KeyError:
         raise WrongObjectSignature(object_signature)
 
-    return appropiate_function(workspace_name, object_id)
+    return appropiate_function(workspace_name, resolve_id(object_id))
+
+
+def get_objects_by_ids(workspace_name, object_signature, object_ids):
+    """Get the objects of type object_signature with ids object_ids, with a
+    request for each of them, BULK_FETCH_CONCURRENCY at a time. The server
+    can't filter a list by many ids, and asking for the whole table to keep
+    a few objects would download all of it.
+
+    Return a dictionary of the objects found by the string of their id.
+    """
+    if object_signature not in (Host.class_signature, Vuln.class_signature, VulnWeb.class_signature,
+                                Service.class_signature, Credential.class_signature,
+                                Note.class_signature, Command.class_signature):
+        raise WrongObjectSignature(object_signature)
+    wanted_ids = {str(object_id): object_id for object_id in object_ids}
+    if not wanted_ids:
+        return {}
+
+    def get_one(object_id):
+        try:
+            return get_object(workspace_name, object_signature, object_id)
+        except Exception as ex:
+            logger.info('Could not get %s %s: %s', object_signature, object_id, ex)
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(BULK_FETCH_CONCURRENCY, len(wanted_ids))) as executor:
+        objects = executor.map(get_one, list(wanted_ids.values()))
+        return {str(obj.id): obj for obj in objects if obj is not None}
 
 
 def get_deleted_object_name_and_type(workspace_name, object_id):
@@ -503,6 +978,9 @@ def create_object(workspace_name, object_signature, obj, command_id):
     object_signature must be either 'Host', 'Vulnerability', 'VulnerabilityWeb',
     'Service', 'Cred', 'Note' or 'CommandRunInformation'.
     Will raise an WrongObjectSignature error if this condition is not met.
+
+    If the parent id of obj is a placeholder, the real one is waited for.
+    If the parent couldn't be saved, its error is raised and obj isn't sent.
     """
     object_to_func = {Host.class_signature: create_host,
                       Vuln.class_signature: create_vuln,
@@ -516,7 +994,14 @@ def create_object(workspace_name, object_signature, obj, command_id):
     except KeyError:
         raise WrongObjectSignature(object_signature)
 
-    return appropiate_function(workspace_name, obj, command_id)
+    parent_id = getattr(obj, 'parent_id', None)
+    if is_placeholder(parent_id):
+        # the parent was created with a placeholder id, wait for the real one
+        obj.setParent(wait_for_id(parent_id))
+    saved_raw_obj = appropiate_function(workspace_name, obj, command_id)
+    if isinstance(saved_raw_obj, dict):
+        IDENTITY_MAP.put(workspace_name, obj, saved_raw_obj.get('_id') or saved_raw_obj.get('id'))
+    return saved_raw_obj
 
 
 def update_object(workspace_name, object_signature, obj, command_id):
@@ -542,7 +1027,34 @@ def update_object(workspace_name, object_signature, obj, command_id):
     except KeyError:
         raise WrongObjectSignature(object_signature)
 
-    return appropiate_function(workspace_name, obj, command_id)
+    updated_raw_obj = appropiate_function(workspace_name, obj, command_id)
+    IDENTITY_MAP.put(workspace_name, obj)
+    return updated_raw_obj
+
+
+MergeResult = namedtuple('MergeResult', ['unchanged', 'merged', 'conflicts'])
+
+
+def merge_objects(pairs):
+    """Merge the new object of each (old_obj, new_obj) pair into the old one,
+    as old_obj.addUpdate(new_obj) does. Pairs with the same fingerprint are
+    skipped without comparing their attributes, and the merge strategy is
+    looked up once for all of them.
+
+    Return a MergeResult with three lists of old objects: the ones that
+    didn't change, the merged ones and the ones with conflicts (which have
+    a ConflictUpdate in getUpdates()).
+    """
+    merge_strategy = _get_merge_strategy()
+    result = MergeResult([], [], [])
+    for old_obj, new_obj in pairs:
+        if old_obj.same_content(new_obj):
+            result.unchanged.append(old_obj)
+        elif old_obj._merge(new_obj, merge_strategy):
+            result.conflicts.append(old_obj)
+        else:
+            result.merged.append(old_obj)
+    return result
 
 
 def create_workspace(workspace_name, description, start_date, finish_date,
@@ -594,7 +1106,7 @@ def get_vulns_number(workspace_name, **params):
 # maybe implement some kind of validation in the future?
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='Host')
 def delete_host(workspace_name, host_id):
     """Delete the host of id host_id on workspace workspace_name.
     Return the json response from the server.
@@ -602,7 +1114,7 @@ def delete_host(workspace_name, host_id):
     return server.delete_host(workspace_name, host_id)
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='Service')
 def delete_service(workspace_name, service_id):
     """Delete the service of id service_id on workspace workspace_name.
     Return the json response from the server.
@@ -610,7 +1122,7 @@ def delete_service(workspace_name, service_id):
     return server.delete_service(workspace_name, service_id)
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='Vulnerability')
 def delete_vuln(workspace_name, vuln_id):
     """Delete the vuln of id vuln_id on workspace workspace_name.
     Return the json response from the server.
@@ -618,7 +1130,7 @@ def delete_vuln(workspace_name, vuln_id):
     return server.delete_vuln(workspace_name, vuln_id)
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='Note')
 def delete_note(workspace_name, note_id):
     """Delete the note of id note_id on workspace workspace_name.
     Return the json response from the server.
@@ -626,7 +1138,7 @@ def delete_note(workspace_name, note_id):
     return server.delete_note(workspace_name, note_id)
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='Cred')
 def delete_credential(workspace_name, credential_id):
     """Delete the credential of id credential_id on workspace workspace_name.
     Return the json response from the server.
@@ -634,7 +1146,7 @@ def delete_credential(workspace_name, credential_id):
     return server.delete_credential(workspace_name, credential_id)
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='VulnerabilityWeb')
 def delete_vuln_web(workspace_name, vuln_id):
     """Delete the vulnweb of id vulnweb_id on workspace workspace_name.
     Return the json response from the server.
@@ -642,7 +1154,7 @@ def delete_vuln_web(workspace_name, vuln_id):
     return server.delete_vuln(workspace_name, vuln_id)
 
 
-@_ignore_in_changes
+@_ignore_in_changes(class_signature='CommandRunInformation')
 def delete_command(workspace_name, command_id):
     """Delete the command of id command_id on workspace workspace_name.
     Return the json response from the server.
@@ -669,7 +1181,29 @@ def delete_object(workspace_name, object_signature, obj_id):
     except KeyError:
         raise WrongObjectSignature(object_signature)
 
-    return appropiate_function(workspace_name, obj_id)
+    try:
+        return appropiate_function(workspace_name, obj_id)
+    finally:
+        forget_object(workspace_name, object_signature, obj_id)
+
+
+def delete_objects(workspace_name, object_signature, ids):
+    """Given a workspace name, an object_signature as string and an iterable
+    of ids, delete all those objects concurrently.
+
+    object_signature must be either 'Host', 'Vulnerability', 'VulnerabilityWeb',
+    'Service', 'Cred', 'Note' or 'CommandRunInformation'.
+    Will raise an WrongObjectSignature error if this condition is not met.
+
+    Return a dictionary with the ids that couldn't be deleted and the error
+    raised for each one of them.
+    """
+    ids = list(ids)
+    try:
+        return server.delete_objects(workspace_name, object_signature, ids)
+    finally:
+        for obj_id in ids:
+            forget_object(workspace_name, object_signature, obj_id)
 
 
 def delete_workspace(workspace_name):
@@ -701,6 +1235,37 @@ def check_server_url(url_to_test):
 # I think there are several # discrepancies between the models here,
 # those on the server and the parameters the apis specify,
 # and this leads to potential dissaster. Remember params?
+_LAZY_EVENT_LOCK = Lock()
+# the value of the lazy fields of the vulns until they are loaded
+_NOT_LOADED = object()
+# the names of the public attributes of each model class, see fingerprint
+_FINGERPRINT_ATTRIBUTES = {}
+# the attributes of the models which setting doesn't change the fingerprint
+_NOT_FINGERPRINTED = frozenset(('_fingerprint', '_updates', '_id_future', '_prefetched',
+                                '_workspace_name', '_full_object_loaded'))
+
+
+def _normalize(value):
+    """A hashable, order independent version of value for fingerprints"""
+    if callable(value):
+        value = value()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_normalize(item) for item in value), key=repr))
+    if isinstance(value, dict):
+        return tuple(sorted(((key, _normalize(item)) for key, item in value.items()), key=repr))
+    return value
+
+
+def _intern(value):
+    """Values like the os, the severity or the status are repeated in
+    thousands of objects, keep only one copy of each of them."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
 class ModelBase:
     """A model for all the Faraday Objects.
     There should be a one to one correspondance with the jsons the faraday
@@ -720,7 +1285,22 @@ class ModelBase:
     For example, we can't provide a sane default argument for ID, that should be
     given to us and indeed raise an exception if it wasn't. We can provide
     a default argument for 'description': if nothing came, assume empty string,
+
+    The attributes of the models are kept in __slots__, without a __dict__,
+    to save memory when loading big workspaces. The id future and the
+    updates list are only created when something uses them. The objects
+    without metadata share a default one (see getMetadata), their own is
+    only created if something changes _metadata.
+
+    New objects get their id when the server answers. Meanwhile callers can
+    block on getID(), register a callback or await the id_future, or use
+    getIDOrPlaceholder() as the parent id of other objects.
     """
+    # there is no __dict__, every attribute of the models is listed here
+    __slots__ = ('_workspace_name', '_server_id', 'id', 'name', 'description',
+                 'owned', 'owner', '_lazy_metadata', 'parent_id', 'parent_type',
+                 '_updates', '_id_future', '_prefetched', '_fingerprint')
+
     def __init__(self, obj, workspace_name):
         self._workspace_name = workspace_name
         self._server_id = obj.get('_id', None)
@@ -730,14 +1310,68 @@ class ModelBase:
         self.name = obj.get('name')
         self.description = obj.get('description', "")
         self.owned = obj.get('owned', False)
-        self.owner = obj.get('owner', '')
-        self._metadata = obj.get('metadata', Metadata(self.owner))
+        self.owner = _intern(obj.get('owner', ''))
+        self._lazy_metadata = obj.get('metadata')
         self.parent_id = obj.get('parent')
-        self.updates = []
-        self.id_available = Event()
-        if self.id is not None:
-            self.id_available.set()
-        self.parent_type = obj.get('parent_type', None)
+        self._updates = None
+        self._id_future = None
+        self._prefetched = None
+        self._fingerprint = None
+        self.parent_type = _intern(obj.get('parent_type', None))
+
+    @property
+    def _metadata(self):
+        if self._lazy_metadata is None:
+            self._lazy_metadata = Metadata(self.owner)
+        return self._lazy_metadata
+
+    def __setattr__(self, name, value):
+        # any change of the attributes, even from outside of the model
+        # (vuln.status = 'closed'), computes the fingerprint again
+        object.__setattr__(self, name, value)
+        if name not in _NOT_FINGERPRINTED:
+            object.__setattr__(self, '_fingerprint', None)
+
+    @_metadata.setter
+    def _metadata(self, metadata):
+        self._lazy_metadata = metadata
+
+    @property
+    def updates(self):
+        if self._updates is None:
+            self._updates = []
+        return self._updates
+
+    @updates.setter
+    def updates(self, updates):
+        self._updates = updates
+
+    @property
+    def id_future(self):
+        """An IdFuture resolved with the id of the object"""
+        if self._id_future is None:
+            with _LAZY_EVENT_LOCK:
+                if self._id_future is None:
+                    id_future = IdFuture()
+                    if self.id is not None:
+                        id_future.resolve(self.id)
+                    self._id_future = id_future
+        return self._id_future
+
+    # it used to be an Event, IdFuture has its is_set and wait methods
+    id_available = id_future
+
+    def _prefetch(self, relationship, children):
+        """Keep the children loaded by get_hosts(prefetch=...)"""
+        if self._prefetched is None:
+            self._prefetched = {}
+        self._prefetched[relationship] = children
+
+    def _get_prefetched(self, relationship):
+        """Return a copy of the prefetched children, None if they weren't"""
+        if self._prefetched is None or relationship not in self._prefetched:
+            return None
+        return list(self._prefetched[relationship])
 
     def getParentType(self):
         return self.parent_type
@@ -755,21 +1389,27 @@ class ModelBase:
         if id:
             self.id = id
             self._server_id = id
-            self.id_available.set()
-
-    def getID(self):
-        # getId will wait until the id is not None
-        timeout = 1
-        retries = 1
-        max_retries = 4
-        while retries <= max_retries and self.id is None:
-            if timeout >= 8:
-                logger.info('Retrying getID timeout {0}'.format(timeout))
-            self.id_available.wait(timeout=timeout)
-            timeout = timeout << retries - 1
-            retries += 1
+            self.id_future.resolve(id)
+
+    def failID(self, error):
+        """The object couldn't be saved, wake up whoever waits for its id"""
+        if self.id is None:
+            self.id_future.fail(error)
+
+    def getID(self, timeout=ID_TIMEOUT):
+        """Return the id, waiting at most timeout seconds for the server to
+        answer it. None if it didn't."""
+        if self.id is None and not self.id_future.wait(timeout):
+            logger.info('The server did not answer the id of %s', self.class_signature)
         return self.id
 
+    def getIDOrPlaceholder(self):
+        """Return the id, or a PlaceholderId that stands for it until the
+        server answers. It doesn't block."""
+        if self.id is not None:
+            return self.id
+        return self.id_future.placeholder
+
     @staticmethod
     def publicattrsrefs():
         return {'Description': 'description',
@@ -806,21 +1446,63 @@ class ModelBase:
         """
         return None
 
+    def fingerprint(self):
+        """Return a hash of the public attributes (see publicattrsrefs),
+        but the heavy fields of the vulns, which may not be loaded (see
+        same_content). Objects with the same attributes have the same
+        fingerprint, even in other processes.
+
+        It is cached until one of the attributes is set (see __setattr__).
+        """
+        if self._fingerprint is None:
+            attributes = _FINGERPRINT_ATTRIBUTES.get(type(self))
+            if attributes is None:
+                attributes = tuple(sorted(set(self.publicattrsrefs().values()) -
+                                          set(VULN_HEAVY_FIELDS.values())))
+                _FINGERPRINT_ATTRIBUTES[type(self)] = attributes
+            values = (self.class_signature, ) + tuple(
+                _normalize(getattr(self, attribute)) for attribute in attributes)
+            self._fingerprint = hashlib.blake2b(repr(values).encode('utf8'),
+                                                digest_size=16).hexdigest()
+        return self._fingerprint
+
+    def same_content(self, other):
+        """Whether other has the same public attributes. The heavy fields
+        of the vulns are only compared if both objects have them loaded,
+        so comparing doesn't request them."""
+        if self.fingerprint() != other.fingerprint():
+            return False
+        for attribute in VULN_HEAVY_FIELDS.values():
+            mine = getattr(self, '_lazy_' + attribute, _NOT_LOADED)
+            theirs = getattr(other, '_lazy_' + attribute, _NOT_LOADED)
+            if (mine is not _NOT_LOADED and theirs is not _NOT_LOADED
+                    and _normalize(mine) != _normalize(theirs)):
+                return False
+        return True
+
     def addUpdate(self, newModelObject, command_id):
+        return self._merge(newModelObject, _get_merge_strategy())
+
+    def _merge(self, newModelObject, merge_strategy):
+        """addUpdate with the merge strategy of the user, None if there
+        isn't one."""
         conflict = False
+        if self.same_content(newModelObject):
+            return conflict
         diff = ModelObjectDiff(self, newModelObject)
+        publicattrs = self.publicattrsrefs()
 
         for k, v in diff.getPropertiesDiff().items():
-            attribute = self.publicattrsrefs().get(k)
+            attribute = publicattrs.get(k)
             prop_update = self.propertyTieBreaker(attribute, *v)
             option_choosen = prop_update
 
             # if there's a strategy set by the user, apply it
-            if not isinstance(prop_update, tuple) or _get_merge_strategy():
+            if not isinstance(prop_update, tuple) or merge_strategy:
 
                 if isinstance(prop_update, tuple):
                     #Choose the new attribute based in merge strategy: old or new
-                    merge_solver = MergeSolver(_get_merge_strategy())
+                    merge_solver = MergeSolver(merge_strategy)
                     option_choosen = merge_solver.solve(prop_update[0], prop_update[1])
 
                 #Faraday have duplicated description field, so if we change
@@ -838,13 +1520,18 @@ class ModelBase:
         return conflict
 
     def getUpdates(self):
-        return self.updates
+        if self._updates is None:
+            return []
+        return self._updates
 
     def updateResolved(self, update):
         self.updates.remove(update)
 
     def needs_merge(self, new_obj):
-        return ModelObjectDiff(self, new_obj).existDiff()
+        if new_obj.class_signature != self.class_signature:
+            # ModelObjectDiff raises the error
+            return ModelObjectDiff(self, new_obj).existDiff()
+        return not self.same_content(new_obj)
 
     def getOwner(self):
         return self.owner
@@ -853,7 +1540,11 @@ class ModelBase:
     def getName(self):
         return self.name
     def getMetadata(self):
-        return self._metadata
+        """The metadata of the object. If it has none, the default one of
+        its owner, shared by all of them (set _metadata to change it)."""
+        if self._lazy_metadata is None:
+            return _default_metadata(self.owner)
+        return self._lazy_metadata
     def getDescription(self):
         return self.description
 
@@ -865,11 +1556,12 @@ class Host(ModelBase):
     a search the server is missing.
     """
     class_signature = 'Host'
+    __slots__ = ('default_gateway', 'os', 'vuln_amount', 'ip', 'hostnames', 'mac')
 
     def __init__(self, host, workspace_name):
         ModelBase.__init__(self, host, workspace_name)
         self.default_gateway = host.get('default_gateway')
-        self.os = host.get('os') if host.get('os') else 'unknown'
+        self.os = _intern(host.get('os')) if host.get('os') else 'unknown'
         self.vuln_amount = int(host.get('vulns', 0))
         self.ip = host.get('ip', self.name)
         self.hostnames = host.get('hostnames', []) if host.get('hostnames') else []
@@ -923,18 +1615,27 @@ class Host(ModelBase):
         """
         Get all vulns of this host.
         """
+        vulns = self._get_prefetched('vulns')
+        if vulns is not None:
+            return vulns
         return get_all_vulns(self._workspace_name, target=self.ip)
 
     def getServices(self):
         """
         Get all services of this host.
         """
+        services = self._get_prefetched('services')
+        if services is not None:
+            return services
         return get_services(self._workspace_name, host_id=self._server_id)
 
     def getService(self, service_id):
         """
         Get a specific service id of this host.
         """
+        for service in self._get_prefetched('services') or []:
+            if str(service.id) == str(service_id):
+                return service
         return get_service(self._workspace_name, hostid=self._server_id, service_id=service_id)
 
 class Service(ModelBase):
@@ -944,10 +1645,12 @@ class Service(ModelBase):
     a search the server is missing.
     """
     class_signature = 'Service'
+    __slots__ = ('protocol', 'ports', 'version', 'status', 'vuln_amount')
 
     def __init__(self, service, workspace_name):
         ModelBase.__init__(self, service, workspace_name)
-        self.protocol = service['protocol']
+        self.name = _intern(self.name)
+        self.protocol = _intern(service['protocol'])
         self.parent_id = service.get('parent') or service.get('host_id') or service.get('service_id')
         if type(service['ports']) == int:
             # the new api returns an integer in ports
@@ -955,8 +1658,8 @@ class Service(ModelBase):
         else:
             # plugin creates a list of strings with the ports
             self.ports = list(map(int, service['ports']))
-        self.version = service['version']
-        self.status = service['status']
+        self.version = _intern(service['version'])
+        self.status = _intern(service['status'])
         self.vuln_amount = int(service.get('vulns', 0))
 
     @staticmethod
@@ -1014,6 +1717,9 @@ class Service(ModelBase):
         """
         Get all vulns of this service.
         """
+        vulns = self._get_prefetched('vulns')
+        if vulns is not None:
+            return vulns
         return get_all_vulns(self._workspace_name, service_id=self._server_id)
 
 
@@ -1024,18 +1730,23 @@ class Vuln(ModelBase):
     a search the server is missing.
     """
     class_signature = 'Vulnerability'
+    __slots__ = ('desc', '_lazy_data', 'severity', 'refs', 'confirmed', 'resolution',
+                 'status', 'policyviolations', 'external_id', '_lazy_batch')
 
     def __init__(self, vuln, workspace_name):
         ModelBase.__init__(self, vuln, workspace_name)
+        # the same vulns are usually found in many hosts
+        self.name = _intern(self.name)
         # this next two lines are stupid but so is life so you should get used to it :)
         self.description = vuln['desc']
         self.desc = vuln['desc']
+        self._lazy_batch = None
         self.data = vuln.get('data')
         self.severity = self.standarize(vuln['severity'])
         self.refs = vuln.get('refs') or []
         self.confirmed = vuln.get('confirmed', False)
         self.resolution = vuln.get('resolution')
-        self.status = vuln.get('status', "opened")
+        self.status = _intern(vuln.get('status', "opened"))
         self.policyviolations = vuln.get('policyviolations', list())
         self.external_id = vuln.get('external_id')
 
@@ -1084,6 +1795,10 @@ class Vuln(ModelBase):
         return (prop1, prop2)
 
     def standarize(self, severity):
+        return _standarize_severity(severity)
+
+    @staticmethod
+    def _standarize(severity):
         # Transform all severities into lower strings
         severity = str(severity).lower()
         # If it has info, med, high, critical in it, standarized to it:
@@ -1135,6 +1850,21 @@ class Vuln(ModelBase):
     def getDesc(self):
         return self.desc
 
+    def _lazy_field(self, attribute):
+        value = getattr(self, '_lazy_' + attribute)
+        if value is _NOT_LOADED:
+            self._lazy_batch.load(self)
+            value = getattr(self, '_lazy_' + attribute)
+        return value
+
+    @property
+    def data(self):
+        return self._lazy_field('data')
+
+    @data.setter
+    def data(self, data):
+        self._lazy_data = data
+
     def getData(self):
         return self.data
 
@@ -1170,6 +1900,9 @@ class VulnWeb(Vuln):
     a search the server is missing.
     """
     class_signature = 'VulnerabilityWeb'
+    __slots__ = ('path', 'website', '_lazy_request', '_lazy_response', 'method', 'pname',
+                 'params', 'query', '_lazy_attachments', 'hostnames', 'impact',
+                 'service', 'tags', 'target', 'category', 'easeofresolution')
 
     def __init__(self, vuln_web, workspace_name):
         Vuln.__init__(self, vuln_web, workspace_name)
@@ -1247,6 +1980,30 @@ class VulnWeb(Vuln):
     def getWebsite(self):
         return self.website
 
+    @property
+    def request(self):
+        return self._lazy_field('request')
+
+    @request.setter
+    def request(self, request):
+        self._lazy_request = request
+
+    @property
+    def response(self):
+        return self._lazy_field('response')
+
+    @response.setter
+    def response(self, response):
+        self._lazy_response = response
+
+    @property
+    def attachments(self):
+        return self._lazy_field('attachments')
+
+    @attachments.setter
+    def attachments(self, attachments):
+        self._lazy_attachments = attachments
+
     def getRequest(self):
         return self.request
 
@@ -1356,8 +2113,255 @@ class VulnWeb(Vuln):
         else:
             return None
 
+
+def _standarize_severity(severity):
+    """Vuln.standarize, remembering the few severities the vulns have"""
+    try:
+        return _STANDARD_SEVERITIES[severity]
+    except KeyError:
+        standard_severity = Vuln._standarize(severity)
+        if len(_STANDARD_SEVERITIES) < 1000:
+            _STANDARD_SEVERITIES[severity] = standard_severity
+        return standard_severity
+    except TypeError:
+        # not hashable
+        return Vuln._standarize(severity)
+
+
+_STANDARD_SEVERITIES = {}
+
+
+# the _fill_* functions do what the __init__ of each model does after
+# ModelBase.__init__, for _build_objects
+def _fill_host(host, value):
+    host.default_gateway = value.get('default_gateway')
+    os = value.get('os')
+    host.os = _intern(os) if os else 'unknown'
+    host.vuln_amount = int(value.get('vulns', 0))
+    host.ip = value.get('ip', host.name)
+    host.hostnames = value.get('hostnames') or []
+    host.mac = value.get('mac') or ''
+
+
+def _fill_service(service, value):
+    service.name = _intern(service.name)
+    service.protocol = _intern(value['protocol'])
+    service.parent_id = value.get('parent') or value.get('host_id') or value.get('service_id')
+    ports = value['ports']
+    service.ports = [ports] if type(ports) == int else list(map(int, ports))
+    service.version = _intern(value['version'])
+    service.status = _intern(value['status'])
+    service.vuln_amount = int(value.get('vulns', 0))
+
+
+def _fill_vuln(vuln, value):
+    vuln.name = _intern(vuln.name)
+    vuln.description = vuln.desc = value['desc']
+    vuln._lazy_batch = None
+    vuln._lazy_data = value.get('data')
+    vuln.severity = _standarize_severity(value['severity'])
+    vuln.refs = value.get('refs') or []
+    vuln.confirmed = value.get('confirmed', False)
+    vuln.resolution = value.get('resolution')
+    vuln.status = _intern(value.get('status', "opened"))
+    vuln.policyviolations = value.get('policyviolations', list())
+    vuln.external_id = value.get('external_id')
+
+
+def _fill_vuln_web(vuln_web, value):
+    vuln_web.path = value.get('path')
+    vuln_web.website = value.get('website')
+    vuln_web._lazy_request = value.get('request')
+    vuln_web._lazy_response = value.get('response')
+    vuln_web.method = value.get('method') or ''
+    vuln_web.pname = value.get('pname')
+    vuln_web.params = value.get('params') or ''
+    vuln_web.query = value.get('query')
+    vuln_web._lazy_attachments = value.get('_attachments')
+    vuln_web.hostnames = value.get('hostnames')
+    vuln_web.impact = value.get('impact')
+    vuln_web.service = value.get('service')
+    vuln_web.tags = value.get('tags', list())
+    vuln_web.target = value.get('target')
+    vuln_web.parent_type = 'Service'
+
+
+_ROW_FILLERS = {
+    Host: (_fill_host, ),
+    Service: (_fill_service, ),
+    Vuln: (_fill_vuln, ),
+    VulnWeb: (_fill_vuln, _fill_vuln_web),
+}
+
+
+class _Projection:
+    """A mixin for the objects created with only some of their fields, see
+    the fields parameter of get_hosts, get_services and the get_*vulns
+    functions.
+
+    The first time an attribute the object doesn't have is used, the whole
+    object is requested to the server and the attributes the projected one
+    is missing are copied from it.
+    """
+
+    def __init__(self, obj, workspace_name):
+        self._workspace_name = workspace_name
+        self._full_object_loaded = False
+        self._server_id = obj.get('_id', None)
+        self.id = obj.get('id', self._server_id)
+        if not self._server_id:
+            self._server_id = self.id
+        self.parent_id = obj.get('parent')
+        self.parent_type = obj.get('parent_type', None)
+        self._updates = None
+        self._id_future = None
+        self._prefetched = None
+        self._fingerprint = None
+        for field, value in obj.items():
+            if field not in ('_id', 'id', 'parent', 'parent_type'):
+                self._set_projected_field(field, value)
+
+    def _set_projected_field(self, field, value):
+        # the same transformations the __init__ of the models do
+        if field in ('desc', 'description'):
+            self.description = self.desc = value
+        elif field == 'severity':
+            self.severity = self.standarize(value)
+        elif field == 'ports':
+            self.ports = [value] if type(value) == int else list(map(int, value))
+        elif field == 'vulns':
+            self.vuln_amount = int(value)
+        elif field == 'metadata':
+            self._lazy_metadata = value
+        elif field in ('host_id', 'service_id'):
+            self.parent_id = self.parent_id or value
+        else:
+            setattr(self, field, value)
+
+    def __getattr__(self, name):
+        # only called for attributes the object doesn't have
+        if name.startswith('__') or self.__dict__.get('_full_object_loaded', True):
+            raise AttributeError(name)
+        self._full_object_loaded = True
+        logger.debug('Getting the full %s %s for %s', self.class_signature, self.id, name)
+        full_object = _FULL_OBJECT_GETTERS[self.class_signature](self._workspace_name, self.id)
+        if full_object is not None:
+            for attribute in _slots_of(type(full_object)):
+                try:
+                    # object.__getattribute__ doesn't fall back to __getattr__
+                    object.__getattribute__(self, attribute)
+                except AttributeError:
+                    try:
+                        setattr(self, attribute, object.__getattribute__(full_object, attribute))
+                    except AttributeError:
+                        pass
+        return getattr(self, name)
+
+
+def _slots_of(model_class):
+    """Return the names of the attributes kept in the __slots__ of model_class"""
+    return [attribute
+            for klass in model_class.__mro__
+            for attribute in klass.__dict__.get('__slots__', ())
+            if attribute not in ('__dict__', '__weakref__')]
+
+
+_FULL_OBJECT_GETTERS = {
+    'Host': get_host,
+    'Service': get_service,
+    'Vulnerability': get_vuln,
+    'VulnerabilityWeb': get_web_vuln,
+}
+_PROJECTED_CLASSES = {}
+
+
+def _projected_class(model_class):
+    """Return a subclass of model_class to create projected objects"""
+    if model_class not in _PROJECTED_CLASSES:
+        _PROJECTED_CLASSES[model_class] = type('Projected' + model_class.__name__,
+                                               (_Projection, model_class), {})
+    return _PROJECTED_CLASSES[model_class]
+
+
+class _LazyFieldsBatch:
+    """The vulns of a list read without their VULN_HEAVY_FIELDS.
+
+    When one of them uses a missing field, its fields are requested with
+    get_dictionaries(workspace_name, object_id=...). Once LAZY_FIELDS_BATCH_AFTER
+    of them did it, the ones of the next LAZY_FIELDS_WINDOW vulns of the list
+    still waiting for them are requested too, BULK_FETCH_CONCURRENCY at a
+    time. The rest of the list is never loaded at once.
+    """
+
+    def __init__(self, workspace_name, get_dictionaries):
+        self.workspace_name = workspace_name
+        self.get_dictionaries = get_dictionaries
+        self.pending = {}
+        self.loads = 0
+        self._lock = Lock()
+
+    def defer_missing_fields(self, vuln, dictionary):
+        missing = [attribute for field, attribute in VULN_HEAVY_FIELDS.items()
+                   if field not in dictionary and hasattr(type(vuln), '_lazy_' + attribute)]
+        if not missing:
+            return
+        for attribute in missing:
+            setattr(vuln, '_lazy_' + attribute, _NOT_LOADED)
+        vuln._lazy_batch = self
+        self.pending[str(vuln.id)] = vuln
+
+    def load(self, vuln):
+        with self._lock:
+            if not self._is_missing_fields(vuln):
+                # loaded by another thread while we waited
+                return
+            self.loads += 1
+            vuln_ids = [vuln.id]
+            if self.loads >= LAZY_FIELDS_BATCH_AFTER:
+                pending_ids = list(self.pending)
+                position = pending_ids.index(str(vuln.id)) if str(vuln.id) in pending_ids else -1
+                # the vulns after this one in the list are likely used next
+                window = pending_ids[position + 1:] + pending_ids[:max(position, 0)]
+                vuln_ids += [self.pending[obj_id].id for obj_id in window[:LAZY_FIELDS_WINDOW - 1]]
+            if len(vuln_ids) == 1:
+                dictionaries = self.get_dictionaries(self.workspace_name, object_id=vuln.id)
+            else:
+                logger.debug('Getting the heavy fields of %d vulns', len(vuln_ids))
+                with ThreadPoolExecutor(max_workers=min(BULK_FETCH_CONCURRENCY, len(vuln_ids))) as executor:
+                    dictionaries = [dictionary for dictionaries in executor.map(self._get_one, vuln_ids)
+                                    for dictionary in dictionaries]
+            heavy_fields = {}
+            for dictionary in dictionaries:
+                dictionary = _flatten_dictionary(dictionary)
+                heavy_fields[str(dictionary.get('id'))] = dictionary
+            # if the server didn't answer about vuln its fields are left empty
+            self._set_fields(vuln, heavy_fields.get(str(vuln.id), {}))
+            for obj_id, dictionary in heavy_fields.items():
+                if obj_id in self.pending:
+                    self._set_fields(self.pending[obj_id], dictionary)
+
+    def _get_one(self, vuln_id):
+        try:
+            return self.get_dictionaries(self.workspace_name, object_id=vuln_id)
+        except Exception as ex:
+            logger.info('Could not get the heavy fields of vuln %s: %s', vuln_id, ex)
+            return []
+
+    @staticmethod
+    def _is_missing_fields(vuln):
+        return any(getattr(vuln, '_lazy_' + attribute, None) is _NOT_LOADED
+                   for attribute in VULN_HEAVY_FIELDS.values())
+
+    def _set_fields(self, vuln, dictionary):
+        for field, attribute in VULN_HEAVY_FIELDS.items():
+            if getattr(vuln, '_lazy_' + attribute, None) is _NOT_LOADED:
+                setattr(vuln, '_lazy_' + attribute, dictionary.get(field))
+        self.pending.pop(str(vuln.id), None)
+
+
 class Note(ModelBase):
     class_signature = 'Note'
+    __slots__ = ('text', 'object_id', 'object_type')
 
     def __init__(self, note, workspace_name):
         ModelBase.__init__(self, note, workspace_name)
@@ -1388,6 +2392,7 @@ class Note(ModelBase):
 
 class Credential(ModelBase):
     class_signature = "Cred"
+    __slots__ = ('username', 'password')
 
     def __init__(self, credential, workspace_name):
         ModelBase.__init__(self, credential, workspace_name)
@@ -1413,18 +2418,21 @@ class Credential(ModelBase):
 
 class Command:
     class_signature = 'CommandRunInformation'
+    __slots__ = ('_workspace_name', 'id', 'command', 'duration', 'hostname', 'ip',
+                 'itime', 'params', 'user', 'workspace', 'import_source')
+
     def __init__(self, command, workspace_name):
         self._workspace_name = workspace_name
         self.id = command.get('id', None) or command.get('_id', None)
         self.command = command['command']
         self.duration = command['duration']
-        self.hostname = command['hostname']
-        self.ip = command['ip']
+        self.hostname = _intern(command['hostname'])
+        self.ip = _intern(command['ip'])
         self.itime = command['itime']
         self.params = command['params']
-        self.user = command['user']
-        self.workspace = command['workspace']
-        self.import_source = command['import_source']
+        self.user = _intern(command['user'])
+        self.workspace = _intern(command['workspace'])
+        self.import_source = _intern(command['import_source'])
 
     def getID(self):
         return self.id
@@ -1587,4 +2595,28 @@ class Metadata:
         return "No model controller call"
 
 
+class _DefaultMetadata(Metadata):
+    """The metadata of the objects which don't have their own, one for each
+    owner shared by all its objects. It can't be changed."""
+
+    def __init__(self, user):
+        self.__dict__.update(vars(Metadata(user)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('The default metadata is shared, set the _metadata of the object')
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+
+_DEFAULT_METADATA = {}
+
+
+def _default_metadata(owner):
+    metadata = _DEFAULT_METADATA.get(owner)
+    if metadata is None:
+        metadata = _DEFAULT_METADATA.setdefault(owner, _DefaultMetadata(owner))
+    return metadata
+
+
 # I'm Py3
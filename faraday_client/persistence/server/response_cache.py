@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import copy
+import threading
+from collections import OrderedDict
+from time import time
+
+
+class CachedResponse:
+    __slots__ = ('data', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, data, etag, last_modified, expires):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def is_fresh(self):
+        return time() < self.expires
+
+    def conditional_headers(self):
+        """Return the headers needed to ask the server if the response
+        changed since we got it."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """A thread safe LRU cache of parsed json responses, keyed by url and
+    query params.
+
+    Entries are fresh for ttl seconds. Stale entries are kept (until evicted)
+    so their ETag and Last-Modified headers can be used to revalidate them.
+
+    Every invalidation bumps the generation. A response requested before an
+    invalidation may predate the change which caused it, so put and refresh
+    ignore it when given the generation read before the request.
+    """
+
+    def __init__(self, max_entries=128, ttl=10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.generation = 0
+
+    @staticmethod
+    def key(url, params):
+        return url, tuple(sorted((name, str(value)) for name, value in params.items()))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_data(self, entry):
+        """Return a copy of the cached data, so callers can't modify
+        the cached one."""
+        return copy.deepcopy(entry.data)
+
+    def count(self, counter):
+        """Increment one of the hits, revalidations or misses counters"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def put(self, key, data, etag=None, last_modified=None, generation=None):
+        """Cache a copy of data, so the caller can keep and modify its own."""
+        data = copy.deepcopy(data)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = CachedResponse(data, etag, last_modified, time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, entry, generation=None):
+        """The server told us the entry didn't change, it is fresh again"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            entry.expires = time() + self.ttl
+
+    def invalidate(self):
+        """Mark every entry as stale. They can still be revalidated."""
+        with self._lock:
+            self.generation += 1
+            for entry in self._entries.values():
+                entry.expires = 0
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'revalidations': self.revalidations,
+                    'misses': self.misses,
+                    'entries': len(self._entries)}
+
+
+# I'm Py3
@@ -23,9 +23,12 @@ Warning:
     be always unique.
 """
 from __future__ import absolute_import
+import re
 import sys
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from time import sleep
 
 import urllib.parse as urlparse
@@ -38,14 +41,19 @@ import requests
 
 from faraday_client import __version__ as f_version
 from faraday_client.persistence.server.utils import force_unique
+from faraday_client.persistence.server.session import get_session
+from faraday_client.persistence.server.response_cache import ResponseCache
+from faraday_client.persistence.server.single_flight import SingleFlight
 from faraday_client.persistence.server.server_io_exceptions import (WrongObjectSignature,
                                                                     CantCommunicateWithServerError,
                                                                     ConflictInDatabase,
                                                                     ResourceDoesNotExist,
+                                                                    ServerRequestException,
                                                                     Unauthorized)
 
 from faraday_client.persistence.server.changes_stream import (
-    WebsocketsChangesStream
+    WebsocketsChangesStream,
+    shared_connection
 )
 from faraday_client.persistence.server.exceptions import Required2FAError
 
@@ -60,6 +68,15 @@ FARADAY_UPLOAD_REPORTS_OVERWRITE_SERVER_URL = None
 SERVER_URL = "http://127.0.0.1:5985"
 AUTH_USER = ""
 AUTH_PASS = ""
+DEFAULT_PAGE_SIZE = 500
+DELETE_CONCURRENCY = 10
+DELETE_BATCH_SIZE = 100
+# only the workspaces list, a workspace (with its summary) and the server info
+# are cached, objects are always requested to the server
+CACHEABLE_URL_REGEX = re.compile(r'/_api/v2/(info|ws|ws/[^/]+)/?$')
+RESPONSE_CACHE = ResponseCache(max_entries=128, ttl=10)
+# identical GETs made at the same time share one request
+SINGLE_FLIGHT = SingleFlight()
 OBJECT_TYPE_END_POINT_MAPPER = {
     'CommandRunInformation': 'commands',
     'Host': 'hosts',
@@ -227,17 +244,79 @@ def _get(request_url, **params):
     """Get from the request_url. Takes an arbitrary number of parameters
     to customize the request_url if necessary.
 
+    If the same url is already being requested (with the same params) by
+    another thread, no new request is made, the response of that one is
+    used instead (see SINGLE_FLIGHT).
+
+    Responses of the workspace metadata urls (see CACHEABLE_URL_REGEX) are
+    kept in RESPONSE_CACHE: they are returned from memory while fresh and
+    revalidated with If-None-Match/If-Modified-Since when stale.
+
     Will raise a CantCommunicateWithServerError if requests cant stablish
     connection to server or if response is not equal to 200.
 
     Return a dictionary with the information in the json.
     """
-    return _parse_json(_unsafe_io_with_server(requests.get,
-                                              [200],
-                                              request_url,
-                                              params=params))
+    return SINGLE_FLIGHT.do(RESPONSE_CACHE.key(request_url, params),
+                            _get_from_server, request_url, params)
+
+
+def _get_from_server(request_url, params):
+    if not CACHEABLE_URL_REGEX.search(request_url):
+        return _parse_json(_unsafe_io_with_server(get_session().get,
+                                                  [200],
+                                                  request_url,
+                                                  params=params))
+    cache_key = RESPONSE_CACHE.key(request_url, params)
+    generation = RESPONSE_CACHE.generation
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None and cached.is_fresh():
+        RESPONSE_CACHE.count('hits')
+        return RESPONSE_CACHE.get_data(cached)
+    headers = cached.conditional_headers() if cached is not None else {}
+    answer = _unsafe_io_with_server(get_session().get,
+                                    [200, 304] if headers else [200],
+                                    request_url,
+                                    params=params,
+                                    headers=headers)
+    if answer.status_code == 304:
+        RESPONSE_CACHE.count('revalidations')
+        RESPONSE_CACHE.refresh(cached, generation)
+        return RESPONSE_CACHE.get_data(cached)
+    RESPONSE_CACHE.count('misses')
+    response = _parse_json(answer)
+    RESPONSE_CACHE.put(cache_key, response,
+                       answer.headers.get('ETag'),
+                       answer.headers.get('Last-Modified'),
+                       generation)
+    return response
+
+
+def invalidate_response_cache():
+    """Tell the cache the client changed something in the server, so it
+    must revalidate every cached response before using it again.
+    GETs already in flight may have been answered before the change, so
+    they won't be shared with the GETs made from now on."""
+    RESPONSE_CACHE.invalidate()
+    SINGLE_FLIGHT.forget()
+
+
+def _invalidates_response_cache(func):
+    """A decorator for the functions which write to the server. The cache is
+    invalidated after the request, even if it failed, so no one can cache
+    a response from before the write."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            invalidate_response_cache()
+
+    return wrapper
 
 
+@_invalidates_response_cache
 def _put(post_url, expected_response=201, **params):
     """Put to the post_url. If update is True, try to get the object
     revision first so as to update the object in Couch. You can
@@ -251,19 +330,21 @@ def _put(post_url, expected_response=201, **params):
     Return a dictionary with the response from couchdb, which looks like this:
     {u'id': u'61', u'ok': True, u'rev': u'1-967a00dff5e02add41819138abb3284d'}
     """
-    return _parse_json(_unsafe_io_with_server(requests.put,
+    return _parse_json(_unsafe_io_with_server(get_session().put,
                                               [expected_response],
                                               post_url,
                                               json=params))
 
 
+@_invalidates_response_cache
 def _post(post_url, update=False, expected_response=201, **params):
-    return _parse_json(_unsafe_io_with_server(requests.post,
+    return _parse_json(_unsafe_io_with_server(get_session().post,
                                               [expected_response],
                                               post_url,
                                               json=params))
 
 
+@_invalidates_response_cache
 def _delete(delete_url, database=False):
     """Deletes the object on delete_url. If you're deleting a database,
     specify the database parameter to True"""
@@ -271,12 +352,21 @@ def _delete(delete_url, database=False):
     if not database:
         last_rev = _get(delete_url)['_rev']
         params = {'rev': last_rev}
-    return _parse_json(_unsafe_io_with_server(requests.delete,
+    return _parse_json(_unsafe_io_with_server(get_session().delete,
                                               [200, 204],
                                               delete_url,
                                               params=params))
 
 
+@_invalidates_response_cache
+def _delete_without_rev(delete_url):
+    """Deletes the object on delete_url. Unlike _delete, it doesn't ask for
+    the object revision first, which the v2 api doesn't need."""
+    return _parse_json(_unsafe_io_with_server(get_session().delete,
+                                              [200, 204],
+                                              delete_url))
+
+
 def _get_raw_hosts(workspace_name, **params):
     """Take a workspace_name and an arbitrary number of params and return
     a dictionary with the hosts table."""
@@ -395,6 +485,133 @@ def _get_faraday_ready_dictionaries(workspace_name, faraday_object_name,
     return faraday_ready_dictionaries
 
 
+def _get_page_rows(raw_page, faraday_object_row_name):
+    """Return the list of objects of a page, the server sends some tables
+    as a dictionary and some others as a plain list."""
+    if isinstance(raw_page, list):
+        return raw_page
+    return raw_page.get(faraday_object_row_name, [])
+
+
+def _get_page_total(raw_page):
+    """Return the number of objects of the whole table, if the server tells
+    it with the page. None if it doesn't."""
+    if isinstance(raw_page, dict):
+        for name in ('count', 'total_rows'):
+            if isinstance(raw_page.get(name), int):
+                return raw_page[name]
+    return None
+
+
+def _first_row_id(rows):
+    if not rows:
+        return None
+    row = rows[0]
+    return row.get('id', row.get('_id')) if isinstance(row, dict) else row
+
+
+def _iter_faraday_ready_pages(workspace_name, faraday_object_name,
+                              faraday_object_row_name, page_size=DEFAULT_PAGE_SIZE,
+                              prefetch=True, **params):
+    """Like _get_faraday_ready_dictionaries, but instead of downloading
+    the whole table at once, return a generator which yields lists with
+    at most page_size dictionaries each.
+
+    If prefetch is True the next page is requested in a background thread
+    while the caller processes the current one.
+
+    It stops after a page shorter than page_size, once the total of rows
+    the server tells with the pages was yielded, or when a page starts
+    with the same row as the previous one (a server which ignores the
+    page params sends the whole table each time).
+    """
+    object_to_func = {'hosts': _get_raw_hosts,
+                      'vulns': _get_raw_vulns,
+                      'services': _get_raw_services}
+    appropiate_function = object_to_func[faraday_object_name]
+
+    def get_page(page_number):
+        raw_page = appropiate_function(workspace_name, page=page_number,
+                                       page_size=page_size, **params)
+        return _get_page_rows(raw_page, faraday_object_row_name), _get_page_total(raw_page)
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page_number = 1
+        rows, total = get_page(page_number)
+        rows_yielded = 0
+        previous_first_id = None
+        while True:
+            first_id = _first_row_id(rows)
+            if page_number > 1 and first_id is not None and first_id == previous_first_id:
+                return
+            previous_first_id = first_id
+            # a page bigger than page_size means the server does not
+            # paginate this table, so we already have all of it
+            rows_yielded += len(rows)
+            is_last_page = len(rows) != page_size or (total is not None and rows_yielded >= total)
+            next_page = None
+            if prefetch and not is_last_page:
+                next_page = executor.submit(get_page, page_number + 1)
+            if rows:
+                yield rows
+            if is_last_page:
+                return
+            page_number += 1
+            rows, total = next_page.result() if next_page else get_page(page_number)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
+
+
+def iter_hosts(workspace_name, page_size=DEFAULT_PAGE_SIZE, prefetch=True, **params):
+    """Get hosts from the server, one page at a time.
+
+    Args:
+        workspace_name (str): the workspace from which to get the hosts.
+        page_size (int): how many hosts to ask for in each request.
+        prefetch (bool): request the next page while the current one is used.
+        **params: any of valid request parameters for the server.
+
+    Returns:
+        A generator of lists of dictionaries with the hosts matching the query.
+    """
+    return _iter_faraday_ready_pages(workspace_name, 'hosts', 'rows',
+                                     page_size, prefetch, **params)
+
+
+def iter_all_vulns(workspace_name, page_size=DEFAULT_PAGE_SIZE, prefetch=True, **params):
+    """Get vulns, both normal and web, from the server, one page at a time.
+
+    Args:
+        workspace_name (str): the workspace from which to get the vulns.
+        page_size (int): how many vulns to ask for in each request.
+        prefetch (bool): request the next page while the current one is used.
+        **params: any of valid request parameters for the server.
+
+    Returns:
+        A generator of lists of dictionaries with the vulns matching the query.
+    """
+    return _iter_faraday_ready_pages(workspace_name, 'vulns', 'vulnerabilities',
+                                     page_size, prefetch, **params)
+
+
+def iter_services(workspace_name, page_size=DEFAULT_PAGE_SIZE, prefetch=True, **params):
+    """Get services from the server, one page at a time.
+
+    Args:
+        workspace_name (str): the workspace from which to get the services.
+        page_size (int): how many services to ask for in each request.
+        prefetch (bool): request the next page while the current one is used.
+        **params: any of valid request parameters for the server.
+
+    Returns:
+        A generator of lists of dictionaries with the services matching the query.
+    """
+    return _iter_faraday_ready_pages(workspace_name, 'services', 'services',
+                                     page_size, prefetch, **params)
+
+
 def get_hosts(workspace_name, **params):
     """Get hosts from the server.
 
@@ -552,7 +769,7 @@ def get_report_docx(workspace_name, report_object_id):
         report_object_id,
         filename)
 
-    return _unsafe_io_with_server(requests.get, 200, request_url)
+    return _unsafe_io_with_server(get_session().get, 200, request_url)
 
 
 def get_report_count_vulns(workspace_name, confirmed=False, tags=[]):
@@ -607,7 +824,9 @@ def get_objects(workspace_name, object_signature, **params):
 
 
 def _websockets_changes(workspace_name, **extra_params):
-    return WebsocketsChangesStream(workspace_name, _get_base_server_url(), **extra_params)
+    # the workspaces share one websocket
+    return WebsocketsChangesStream(workspace_name, connection=shared_connection(_get_base_server_url()),
+                                   **extra_params)
 
 
 # cha cha cha chaaaanges!
@@ -654,7 +873,7 @@ def get_object_before_last_revision(workspace_name, object_id):
     """
     get_url = _create_couch_get_url(workspace_name, object_id)
 
-    response = _unsafe_io_with_server(requests.get, [200], get_url,
+    response = _unsafe_io_with_server(get_session().get, [200], get_url,
                                       params={'revs': 'true', 'open_revs': 'all'})
     try:
         valid_json_response = _clean_up_stupid_couch_response(response.text)
@@ -1658,6 +1877,47 @@ def delete_command(workspace_name, command_id):
     return _delete_from_server(workspace_name, 'Command', command_id)
 
 
+def delete_objects(workspace_name, object_type, object_ids):
+    """Delete many objects of the same type, DELETE_CONCURRENCY at a time.
+
+    Args:
+        workspace_name (str): the workspace where the objects are.
+        object_type (str): must be either 'Host', 'Vulnerability',
+            'VulnerabilityWeb', 'Service', 'Cred', 'Note' or
+            'CommandRunInformation'.
+        object_ids (iterable): the ids of the objects to delete.
+
+    Returns:
+        A dictionary with the ids which couldn't be deleted as keys and the
+        exception raised when trying to delete them as values. It will be
+        empty if every object was deleted.
+
+    Raises:
+        WrongObjectSignature: if the object_type didn't match a faraday object.
+    """
+    if object_type not in OBJECT_TYPE_END_POINT_MAPPER:
+        raise WrongObjectSignature(object_type)
+
+    def delete_one(object_id):
+        delete_url = _create_server_delete_url(workspace_name, object_type, object_id)
+        try:
+            _delete_without_rev(delete_url)
+        except ServerRequestException as ex:
+            return object_id, ex
+        return object_id, None
+
+    failed = {}
+    object_ids = list(object_ids)
+    with ThreadPoolExecutor(max_workers=DELETE_CONCURRENCY) as executor:
+        for start in range(0, len(object_ids), DELETE_BATCH_SIZE):
+            batch = object_ids[start:start + DELETE_BATCH_SIZE]
+            for object_id, error in executor.map(delete_one, batch):
+                if error is not None:
+                    logger.debug('Could not delete %s %s: %s', object_type, object_id, error)
+                    failed[object_id] = error
+    return failed
+
+
 def delete_workspace(workspace_name):
     """Delete the couch database of id workspace_name"""
     db_url = _create_server_db_url(workspace_name)
@@ -1678,7 +1938,7 @@ def login_user(uri, uname, upass, u2fa_token=None):
     auth = {"email": uname, "password": upass}
     headers = {'User-Agent': f'faraday-client/{f_version}'}
     try:
-        resp = requests.post(urlparse.urljoin(uri, "/_api/login"), json=auth, headers=headers)
+        resp = get_session().post(urlparse.urljoin(uri, "/_api/login"), json=auth, headers=headers)
         if resp.status_code == 401:
             return None
         elif resp.status_code == 202:
@@ -1687,7 +1947,7 @@ def login_user(uri, uname, upass, u2fa_token=None):
             else:
 
                 json_2fa = {"secret": u2fa_token}
-                resp_2fa = requests.post(urlparse.urljoin(uri, "/_api/confirmation"), json=json_2fa, headers=headers,
+                resp_2fa = get_session().post(urlparse.urljoin(uri, "/_api/confirmation"), json=json_2fa, headers=headers,
                                          cookies=resp.cookies)
                 if resp_2fa.status_code == 200:
                     return resp_2fa.cookies
@@ -1711,7 +1971,7 @@ def login_user(uri, uname, upass, u2fa_token=None):
 
 def is_authenticated(uri, cookies):
     try:
-        resp = requests.get(urlparse.urljoin(uri, "/_api/session"), cookies=cookies, timeout=1)
+        resp = get_session().get(urlparse.urljoin(uri, "/_api/session"), cookies=cookies, timeout=1)
         if resp.status_code not in [401, 403]:
             user_info = resp.json()
             return bool(user_info.get('username', {}))
@@ -1738,7 +1998,7 @@ def check_server_url(url_to_test):
 
 def get_user_info():
     try:
-        resp = requests.get(urlparse.urljoin(_get_base_server_url(), "/_api/session"),
+        resp = get_session().get(urlparse.urljoin(_get_base_server_url(), "/_api/session"),
                             cookies=_conf().getFaradaySessionCookies(), timeout=1)
         if (resp.status_code != 401) and (resp.status_code != 403):
             return resp.json()
@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from faraday_client import __version__ as f_version
+
+logger = logging.getLogger(__name__)
+
+# NOTE: tune these before the first request, or call configure() afterwards
+POOL_CONNECTIONS = 10  # how many different hosts we keep pools for
+POOL_MAXSIZE = 20  # how many keep-alive connections per host, at least aio.MAX_CONCURRENCY
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+TIMEOUT = (10, 120)  # (connect, read) seconds
+# the uploads of plugin results (bulk_create) may take the server much longer
+# to answer, they pass this timeout instead of the default one
+UPLOAD_TIMEOUT = (10, 3600)
+# only retry verbs which can be safely repeated. POST is never retried since
+# the server could have created the object before the connection dropped.
+IDEMPOTENT_METHODS = frozenset(['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS'])
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_ADAPTER_LOCK = threading.Lock()
+_ADAPTER = None
+_ADAPTER_GENERATION = 0
+_THREAD_LOCAL = threading.local()
+
+
+def _build_retry():
+    retry_kwargs = {'total': MAX_RETRIES,
+                    'connect': MAX_RETRIES,
+                    'read': MAX_RETRIES,
+                    'backoff_factor': BACKOFF_FACTOR,
+                    'status_forcelist': RETRY_STATUS_CODES,
+                    'raise_on_status': False}
+    try:
+        return Retry(allowed_methods=IDEMPOTENT_METHODS, **retry_kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=IDEMPOTENT_METHODS, **retry_kwargs)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """An HTTPAdapter which keeps its connection pools alive between requests,
+    applies a default timeout and counts how many TCP connections were opened
+    versus how many requests were sent through them.
+    """
+
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self._requests_sent = 0
+        self._closed_pools_connections = 0
+        super(PooledHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        # keep the connections count of the pools evicted by the pool manager
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def count_and_dispose(pool):
+            with self._stats_lock:
+                self._closed_pools_connections += pool.num_connections
+            if dispose:
+                dispose(pool)
+        pools.dispose_func = count_and_dispose
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        with self._stats_lock:
+            self._requests_sent += 1
+        return super(PooledHTTPAdapter, self).send(request, timeout=timeout, **kwargs)
+
+    def stats(self):
+        pools = self.poolmanager.pools
+        with pools.lock:
+            live_pools = [pools[key] for key in pools.keys()]
+        with self._stats_lock:
+            opened = self._closed_pools_connections
+            opened += sum(pool.num_connections for pool in live_pools)
+            sent = self._requests_sent
+        return {'requests': sent,
+                'connections_opened': opened,
+                'connections_reused': max(sent - opened, 0)}
+
+
+def _create_adapter():
+    return PooledHTTPAdapter(timeout=TIMEOUT,
+                             pool_connections=POOL_CONNECTIONS,
+                             pool_maxsize=POOL_MAXSIZE,
+                             max_retries=_build_retry())
+
+
+def _get_adapter():
+    global _ADAPTER
+    with _ADAPTER_LOCK:
+        if _ADAPTER is None:
+            _ADAPTER = _create_adapter()
+        return _ADAPTER, _ADAPTER_GENERATION
+
+
+def _new_session(adapter):
+    session = requests.Session()
+    session.headers['User-Agent'] = 'faraday-client/{0}'.format(f_version)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """Return a requests.Session which shares its connection pool with
+    every other session returned by this function.
+
+    Sessions are per thread (so cookie jars and headers are never shared
+    between threads) but all of them are mounted on the same adapter, so
+    keep-alive connections are reused across the whole client.
+    """
+    adapter, generation = _get_adapter()
+    session = getattr(_THREAD_LOCAL, 'session', None)
+    if session is None or _THREAD_LOCAL.generation != generation:
+        session = _new_session(adapter)
+        _THREAD_LOCAL.session = session
+        _THREAD_LOCAL.generation = generation
+    return session
+
+
+def new_session():
+    """Return a new requests.Session, only for the caller, on the shared
+    connection pool. For the callers which log in: the cookies they get
+    aren't sent by the sessions of get_session."""
+    adapter, _ = _get_adapter()
+    return _new_session(adapter)
+
+
+def configure(pool_connections=None, pool_maxsize=None, max_retries=None,
+              backoff_factor=None, timeout=None, upload_timeout=None):
+    """Change the pool settings. Open connections are closed and the
+    sessions of every thread will be recreated on their next use."""
+    global POOL_CONNECTIONS, POOL_MAXSIZE, MAX_RETRIES, BACKOFF_FACTOR, TIMEOUT, UPLOAD_TIMEOUT
+    if pool_connections is not None:
+        POOL_CONNECTIONS = pool_connections
+    if pool_maxsize is not None:
+        POOL_MAXSIZE = pool_maxsize
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    if backoff_factor is not None:
+        BACKOFF_FACTOR = backoff_factor
+    if timeout is not None:
+        TIMEOUT = timeout
+    if upload_timeout is not None:
+        UPLOAD_TIMEOUT = upload_timeout
+    close()
+
+
+def close():
+    """Close every pooled connection and reset the counters."""
+    global _ADAPTER, _ADAPTER_GENERATION
+    with _ADAPTER_LOCK:
+        if _ADAPTER is not None:
+            _ADAPTER.close()
+        _ADAPTER = None
+        _ADAPTER_GENERATION += 1
+
+
+def stats():
+    """Return a dictionary with the amount of requests sent and the
+    amount of connections opened and reused to send them."""
+    adapter, _ = _get_adapter()
+    return adapter.stats()
+
+
+# I'm Py3
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Faraday Penetration Test IDE
+Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+"""
+from __future__ import absolute_import
+
+import copy
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs a function only once for all the threads asking for the same key
+    at the same time. The first thread calls it, the others wait for it and
+    get a copy of its result (or its exception).
+
+    Once the call finishes the key is forgotten, so results are never reused
+    by calls made afterwards.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.collapsed += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = function(*args, **kwargs)
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+        # the waiters copy the result, it must not change under them
+        return copy.deepcopy(call.result) if shared else call.result
+
+    def forget(self):
+        """Calls in flight keep running, but the ones made from now on
+        won't wait for them."""
+        with self._lock:
+            self._calls.clear()
+
+    def stats(self):
+        return {'calls': self.calls,
+                'collapsed': self.collapsed,
+                'in_flight': len(self._calls)}
+
+
+# I'm Py3
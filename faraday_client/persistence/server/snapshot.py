@@ -0,0 +1,494 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Faraday Penetration Test IDE
+# Copyright (C) 2016  Infobyte LLC (http://www.infobytesec.com/)
+# See the file 'doc/LICENSE' for the license information
+
+
+"""A read only, columnar copy of the hosts, services and vulns of a
+workspace, for scripts that go over the whole workspace:
+
+    snapshot = WorkspaceSnapshot.load(workspace_name)
+    snapshot.hosts.group_count('os')
+    snapshot.vulns.where(severity=['high', 'critical'], status='open').count()
+    snapshot.services.where(port=[80, 443]).values('host_id')
+
+Each table keeps a column for each attribute. Integer columns are arrays,
+the rest are dictionary encoded: every distinct value is kept once and the
+column is an array with the code of the value of each row. Filters and
+counts work on those arrays instead of on model objects, and the columns
+in INDEXED_COLUMNS have an index from their values to their rows.
+
+The rows matching a filter are kept as a bitmap: a python int with the bit
+of each matching row set, so the conditions of where() are combined with
+& and | and counted without a loop over the rows. Encoded columns with at
+most BITMAP_MAX_CODES values have the bitmap of each of them precomputed.
+When an indexed condition matches only a few rows, those rows are checked
+against the other conditions instead.
+"""
+from __future__ import absolute_import
+
+from array import array
+from collections import Counter
+from itertools import compress
+
+from faraday_client.persistence.server import models, server
+
+HOST_COLUMNS = {
+    'id': lambda host: host.id,
+    'name': lambda host: host.name,
+    'ip': lambda host: host.ip,
+    'os': lambda host: host.os,
+    'mac': lambda host: host.mac,
+    'owned': lambda host: host.owned,
+    'vuln_amount': lambda host: host.vuln_amount,
+}
+
+SERVICE_COLUMNS = {
+    'id': lambda service: service.id,
+    'host_id': lambda service: service.parent_id,
+    'name': lambda service: service.name,
+    'protocol': lambda service: service.protocol,
+    # the server gives a single port for each service
+    'port': lambda service: service.ports[0] if service.ports else None,
+    'status': lambda service: service.status,
+    'version': lambda service: service.version,
+    'vuln_amount': lambda service: service.vuln_amount,
+}
+
+VULN_COLUMNS = {
+    'id': lambda vuln: vuln.id,
+    'type': lambda vuln: vuln.class_signature,
+    'name': lambda vuln: vuln.name,
+    'severity': lambda vuln: vuln.severity,
+    'status': lambda vuln: vuln.status,
+    'confirmed': lambda vuln: vuln.confirmed,
+    'parent_id': lambda vuln: vuln.parent_id,
+    'parent_type': lambda vuln: vuln.parent_type,
+}
+
+INDEXED_COLUMNS = {
+    'hosts': ('id', 'ip', 'os'),
+    'services': ('id', 'host_id', 'port', 'name'),
+    'vulns': ('id', 'parent_id', 'severity', 'status'),
+}
+
+
+# encoded columns with more distinct values than this don't keep a bitmap
+# for each of them, they are made from the index when needed
+BITMAP_MAX_CODES = 256
+# where() checks the rows of an indexed condition one by one, instead of
+# using bitmaps, if they are fewer than this fraction of the table
+SPARSE_ROWS_FRACTION = 1 / 32
+
+# 0 and 1 bytes to the '0' and '1' digits and back, see _mask_bitmap
+_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_FROM_DIGITS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def _rows_array(rows=()):
+    return array('l', rows)
+
+
+def _mask_bitmap(mask):
+    """The bitmap of a bytes-like mask with a 1 byte for each row set"""
+    if not mask:
+        return 0
+    return int(bytes(mask).translate(_TO_DIGITS)[::-1], 2)
+
+
+def _rows_bitmap(rows, length):
+    mask = bytearray(length)
+    for row in rows:
+        mask[row] = 1
+    return _mask_bitmap(mask)
+
+
+def _bitmap_rows(bitmap):
+    """The rows set in bitmap, in order"""
+    if not bitmap:
+        return _rows_array()
+    mask = format(bitmap, 'b')[::-1].encode('ascii').translate(_FROM_DIGITS)
+    return _rows_array(compress(range(len(mask)), mask))
+
+
+def _bitmap_count(bitmap):
+    return bin(bitmap).count('1')
+
+
+class _Column:
+    """What the columns share: the rows of each value, built when first
+    needed (see build_index), and the bitmap of the rows of some values."""
+
+    _index = None
+
+    def index(self):
+        if self._index is None:
+            self._index = self.build_index()
+        return self._index
+
+    def bitmap(self, values):
+        """The bitmap of the rows with any of the values"""
+        index = self.index()
+        rows_of_values = [index.get(EncodedColumn._key(value), ()) for value in values]
+        if len(rows_of_values) == 1:
+            rows = rows_of_values[0]
+        else:
+            rows = [row for rows in rows_of_values for row in rows]
+        return _rows_bitmap(rows, len(self))
+
+
+class IntColumn(_Column):
+    """A column of integers kept in an array"""
+
+    def __init__(self, values):
+        self.data = array('q', values)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, row):
+        return self.data[row]
+
+    def filter(self, rows, values):
+        """The rows, of the given ones, with any of the values"""
+        wanted = set(values)
+        data = self.data
+        return [row for row in rows if data[row] in wanted]
+
+    def counts(self, rows=None):
+        if rows is None:
+            return dict(Counter(self.data))
+        data = self.data
+        return dict(Counter(data[row] for row in rows))
+
+    def build_index(self):
+        index = {}
+        for row, value in enumerate(self.data):
+            index.setdefault(value, _rows_array()).append(row)
+        return index
+
+
+class EncodedColumn(_Column):
+    """A dictionary encoded column. dictionary has each distinct value once,
+    codes the position in dictionary of the value of each row.
+
+    code_bitmaps has the bitmap of the rows of each code, if there are at
+    most BITMAP_MAX_CODES of them (None if not)."""
+
+    def __init__(self, values):
+        self.dictionary = []
+        self._codes_by_value = {}
+        self.codes = array('l')
+        for value in values:
+            self.codes.append(self._encode(value))
+        self.code_bitmaps = None
+        if len(self.dictionary) <= BITMAP_MAX_CODES:
+            # a byte per row, each code is turned into the 1 bytes of a mask
+            code_bytes = bytes(iter(self.codes))
+            zeros = bytes(256)
+            self.code_bitmaps = [
+                _mask_bitmap(code_bytes.translate(zeros[:code] + b'\x01' + zeros[code + 1:]))
+                for code in range(len(self.dictionary))]
+
+    def _encode(self, value):
+        key = self._key(value)
+        code = self._codes_by_value.get(key)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self._codes_by_value[key] = code
+        return code
+
+    @staticmethod
+    def _key(value):
+        # lists can't be dictionary keys
+        return tuple(value) if isinstance(value, list) else value
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.dictionary[self.codes[row]]
+
+    def code_of(self, value):
+        return self._codes_by_value.get(self._key(value))
+
+    def filter(self, rows, values):
+        wanted = {self.code_of(value) for value in values} - {None}
+        codes = self.codes
+        return [row for row in rows if codes[row] in wanted]
+
+    def bitmap(self, values):
+        if self.code_bitmaps is None:
+            return _Column.bitmap(self, values)
+        bitmap = 0
+        for value in values:
+            code = self.code_of(value)
+            if code is not None:
+                bitmap |= self.code_bitmaps[code]
+        return bitmap
+
+    def bitmap_counts(self, bitmap):
+        """Like counts, for the rows of bitmap. None if there are too many
+        codes to count them this way."""
+        if self.code_bitmaps is None:
+            return None
+        counts = {}
+        for value, code_bitmap in zip(self.dictionary, self.code_bitmaps):
+            count = _bitmap_count(bitmap & code_bitmap)
+            if count:
+                counts[value] = count
+        return counts
+
+    def counts(self, rows=None):
+        if rows is None:
+            code_counts = Counter(self.codes)
+        else:
+            codes = self.codes
+            code_counts = Counter(codes[row] for row in rows)
+        return {self.dictionary[code]: count for code, count in code_counts.items()}
+
+    def build_index(self):
+        rows_by_code = [_rows_array() for _ in self.dictionary]
+        for row, code in enumerate(self.codes):
+            rows_by_code[code].append(row)
+        return {self._key(value): rows for value, rows in zip(self.dictionary, rows_by_code)}
+
+
+def make_column(values):
+    """Return an IntColumn if every value is an int, an EncodedColumn if not"""
+    values = list(values)
+    if all(type(value) is int for value in values):
+        try:
+            return IntColumn(values)
+        except OverflowError:
+            pass
+    return EncodedColumn(values)
+
+
+def _as_values(value):
+    """where() takes a value or a list, tuple or set of values"""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return value
+    return [value]
+
+
+class Selection:
+    """Some of the rows of a table, as returned by Table.where. Selections of
+    the same table can be combined with & and |.
+
+    It is made with either the rows or their bitmap, the other one is
+    computed when used."""
+
+    def __init__(self, table, rows=None, bitmap=None):
+        self.table = table
+        self._rows = rows
+        self._bitmap = bitmap
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = _bitmap_rows(self._bitmap)
+        return self._rows
+
+    @property
+    def bitmap(self):
+        if self._bitmap is None:
+            self._bitmap = _rows_bitmap(self._rows, len(self.table))
+        return self._bitmap
+
+    def __len__(self):
+        return self.count()
+
+    def count(self):
+        if self._rows is None:
+            return _bitmap_count(self._bitmap)
+        return len(self._rows)
+
+    def where(self, **conditions):
+        return self.table.where(_within=self, **conditions)
+
+    def filter(self, rows):
+        """The rows, of the given ones, in the selection"""
+        if self._rows is not None:
+            selected = set(self._rows)
+            return [row for row in rows if row in selected]
+        bitmap = self._bitmap
+        return [row for row in rows if bitmap >> row & 1]
+
+    def values(self, column_name):
+        column = self.table.columns[column_name]
+        return [column[row] for row in self.rows]
+
+    def group_count(self, column_name):
+        column = self.table.columns[column_name]
+        if self._bitmap is not None and isinstance(column, EncodedColumn):
+            counts = column.bitmap_counts(self._bitmap)
+            if counts is not None:
+                return counts
+        return column.counts(self.rows)
+
+    def records(self):
+        return [self.table.record(row) for row in self.rows]
+
+    def __and__(self, other):
+        return Selection(self.table, bitmap=self.bitmap & other.bitmap)
+
+    def __or__(self, other):
+        return Selection(self.table, bitmap=self.bitmap | other.bitmap)
+
+
+class Table:
+    """Rows of values kept by column"""
+
+    def __init__(self, columns, indexed_columns=()):
+        self.columns = columns
+        self._length = len(next(iter(columns.values()))) if columns else 0
+        self.indexes = {name: columns[name].index() for name in indexed_columns}
+
+    @classmethod
+    def from_objects(cls, objects, getters, indexed_columns=()):
+        """Build the table from model objects. getters maps each column name
+        to a function returning its value for an object."""
+        values = {name: [] for name in getters}
+        for obj in objects:
+            for name, getter in getters.items():
+                values[name].append(getter(obj))
+        return cls({name: make_column(column_values) for name, column_values in values.items()},
+                   indexed_columns)
+
+    def __len__(self):
+        return self._length
+
+    def record(self, row):
+        return {name: column[row] for name, column in self.columns.items()}
+
+    def lookup(self, column_name, value):
+        """Return the rows where column_name is value, using its index"""
+        index = self.indexes[column_name]
+        return index.get(EncodedColumn._key(value), _rows_array())
+
+    def get(self, column_name, value):
+        """Return the record of the first row where column_name is value,
+        None if there isn't any. Meant for the id."""
+        rows = self.lookup(column_name, value)
+        return self.record(rows[0]) if rows else None
+
+    def where(self, _within=None, **conditions):
+        """Return a Selection of the rows where each column is the value given
+        for it, or one of them if a list of values is given.
+
+        The bitmaps of the rows matching each condition are intersected,
+        unless an indexed condition (or _within, the selection where() was
+        called on) has few rows: then the rest are checked on them."""
+        conditions = {name: _as_values(value) for name, value in conditions.items()}
+        rows, used = self._fewest_rows(_within, conditions)
+        if rows is not None:
+            for name, values in conditions.items():
+                if name != used:
+                    rows = self.columns[name].filter(rows, values)
+            if _within is not None and used is not None:
+                rows = _within.filter(rows)
+            return Selection(self, _rows_array(rows))
+        bitmap = None if _within is None else _within.bitmap
+        for name, values in conditions.items():
+            matching = self.columns[name].bitmap(values)
+            bitmap = matching if bitmap is None else bitmap & matching
+        if bitmap is None:
+            return self.all()
+        return Selection(self, bitmap=bitmap)
+
+    def _fewest_rows(self, within, conditions):
+        """Return the rows of the indexed condition (or of within) matching
+        the fewest of them, and the name of its column (None for within),
+        if they are few enough to check the other conditions row by row.
+        (None, None) if not."""
+        limit = self._length * SPARSE_ROWS_FRACTION
+        fewest, fewest_name = None, None
+        if within is not None and within._rows is not None and len(within._rows) <= limit:
+            fewest = within._rows
+        for name, values in conditions.items():
+            index = self.indexes.get(name)
+            if index is None:
+                continue
+            rows_of_values = [index.get(EncodedColumn._key(value), ()) for value in values]
+            size = sum(len(rows) for rows in rows_of_values)
+            if size <= limit and (fewest is None or size < len(fewest)):
+                if len(rows_of_values) == 1:
+                    fewest = rows_of_values[0]
+                else:
+                    # the rows of each value are sorted, this merges them
+                    fewest = sorted(row for rows in rows_of_values for row in rows)
+                fewest_name = name
+        return fewest, fewest_name
+
+    def all(self):
+        return Selection(self, _rows_array(range(self._length)))
+
+    def count(self, **conditions):
+        if not conditions:
+            return self._length
+        return self.where(**conditions).count()
+
+    def values(self, column_name):
+        column = self.columns[column_name]
+        return [column[row] for row in range(self._length)]
+
+    def group_count(self, column_name, **conditions):
+        """Return a dictionary of the number of rows of each value of
+        column_name, only counting the rows matching conditions."""
+        if not conditions:
+            return self.columns[column_name].counts()
+        return self.where(**conditions).group_count(column_name)
+
+
+class WorkspaceSnapshot:
+    """The hosts, services and vulns tables of a workspace, as they were when
+    it was loaded. It isn't updated, load another one to see changes."""
+
+    def __init__(self, workspace_name, hosts, services, vulns):
+        self.workspace_name = workspace_name
+        self.hosts = hosts
+        self.services = services
+        self.vulns = vulns
+
+    @classmethod
+    def from_objects(cls, workspace_name, hosts, services, vulns):
+        return cls(workspace_name,
+                   Table.from_objects(hosts, HOST_COLUMNS, INDEXED_COLUMNS['hosts']),
+                   Table.from_objects(services, SERVICE_COLUMNS, INDEXED_COLUMNS['services']),
+                   Table.from_objects(vulns, VULN_COLUMNS, INDEXED_COLUMNS['vulns']))
+
+    @classmethod
+    def load(cls, workspace_name, tables=('hosts', 'services', 'vulns'),
+             page_size=server.DEFAULT_PAGE_SIZE):
+        """Read the workspace from the server, a page at a time. The model
+        objects are only kept until their values are in the columns.
+
+        Only the tables named in tables are read, the rest are left empty.
+        """
+        def read(table_name, iter_objects):
+            if table_name not in tables:
+                return []
+            return iter_objects(workspace_name, page_size)
+
+        return cls.from_objects(workspace_name,
+                                read('hosts', models.iter_hosts),
+                                read('services', models.iter_services),
+                                read('vulns', models.iter_vulns))
+
+    def services_of(self, host_id):
+        return Selection(self.services, self.services.lookup('host_id', host_id))
+
+    def vulns_of(self, parent_id, parent_type=None):
+        """Hosts and services may share ids, give parent_type ('Host' or
+        'Service') to tell them apart."""
+        selection = Selection(self.vulns, self.vulns.lookup('parent_id', parent_id))
+        if parent_type is not None:
+            selection = selection.where(parent_type=parent_type)
+        return selection
+
+
+# I'm Py3
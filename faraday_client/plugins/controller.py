@@ -4,9 +4,9 @@ Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
 See the file 'doc/LICENSE' for the license information
 
 """
+import gzip
 import json
 
-import requests
 from past.builtins import basestring
 from builtins import range
 
@@ -18,7 +18,13 @@ from threading import Thread
 from multiprocessing import JoinableQueue, Process
 
 from faraday_client.config.configuration import getInstanceConfiguration
-from faraday_client.persistence.server.server import _conf, _get_base_server_url
+from faraday_client.persistence.server.server import (
+    _conf,
+    _get_base_server_url,
+    invalidate_response_cache,
+)
+from faraday_client.persistence.server import session
+from faraday_client.persistence.server.session import get_session
 from faraday_client.plugins.plugin import PluginProcess
 import faraday_client.model.api
 from faraday_client.model.commands_history import CommandRunInformation
@@ -32,10 +38,30 @@ from faraday_client.start_client import (
     CONST_FARADAY_HOME_PATH,
 )
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 CONF = getInstanceConfiguration()
 
 logger = logging.getLogger(__name__)
 
+# The plugins give us their results already serialized, they are sent to the
+# server as they are, without parsing and serializing them again.
+# Set SEND_DATA_VALIDATE to check they are valid json before sending them
+# (with orjson if it is installed) and SEND_DATA_GZIP to compress them, the
+# server must accept gzip Content-Encoding for that.
+SEND_DATA_VALIDATE = False
+SEND_DATA_GZIP = False
+SEND_DATA_GZIP_LEVEL = 1
+
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 class PluginController(Thread):
     """
@@ -131,20 +157,41 @@ class PluginController(Thread):
         command_id = command.getID()
         data = command.toDict()
         data['tool'] = data['command']
-        data.pop('id_available')
-        res = requests.put(
+        data.pop('id_future')
+        res = get_session().put(
             f'{base_url}/_api/v2/ws/{command.workspace}/commands/{command_id}/',
             json=data,
             cookies=cookies)
         logger.info(f'Sent command duration {res.status_code}')
 
     def send_data(self, workspace, data):
+        """
+            Send the json of a plugin result (str or bytes) to bulk_create.
+            It is used as the body of the request, it isn't parsed unless
+            SEND_DATA_VALIDATE is set.
+
+        :return: True if the server created the objects
+        """
+        body = data.encode('utf8') if isinstance(data, str) else data
+        if SEND_DATA_VALIDATE:
+            try:
+                _loads(body)
+            except ValueError as ex:
+                logger.error('Plugin result is not valid json: {0}'.format(ex))
+                return False
+        headers = {'Content-Type': 'application/json'}
+        if SEND_DATA_GZIP:
+            body = gzip.compress(body, compresslevel=SEND_DATA_GZIP_LEVEL)
+            headers['Content-Encoding'] = 'gzip'
         cookies = _conf().getFaradaySessionCookies()
         base_url = _get_base_server_url()
-        res = requests.post(
+        res = get_session().post(
             f'{base_url}/_api/v2/ws/{workspace}/bulk_create/',
             cookies=cookies,
-            json=json.loads(data))
+            data=body,
+            headers=headers,
+            timeout=session.UPLOAD_TIMEOUT)
+        invalidate_response_cache()
         if res.status_code != 201:
             logger.error('Server responded with status code {0}. API response was {1}'.format(res.status_code, res.text))
             return False
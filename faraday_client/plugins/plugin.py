@@ -180,7 +180,7 @@ class PluginBase:
             mac=mac)
         host_obj._metadata.creatoserverr = self.id
         self.__addPendingAction(Modelactions.ADDHOST, host_obj)
-        return host_obj.getID()
+        return host_obj.getIDOrPlaceholder()
 
     @deprecation.deprecated(deprecated_in="3.0", removed_in="3.5",
                             current_version=f_client_version,
@@ -239,7 +239,7 @@ class PluginBase:
 
         serv_obj._metadata.creator = self.id
         self.__addPendingAction(Modelactions.ADDSERVICEHOST, serv_obj)
-        return serv_obj.getID()
+        return serv_obj.getIDOrPlaceholder()
 
     def createAndAddServiceToHost(self, host_id, name,
                                        protocol="tcp?", ports=None,
@@ -263,7 +263,7 @@ class PluginBase:
 
         serv_obj._metadata.creator = self.id
         self.__addPendingAction(Modelactions.ADDSERVICEHOST, serv_obj)
-        return serv_obj.getID()
+        return serv_obj.getIDOrPlaceholder()
 
     def createAndAddVulnToHost(self, host_id, name, desc="", ref=None,
                                severity="", resolution="", data="", external_id=None):
@@ -278,7 +278,7 @@ class PluginBase:
 
         vuln_obj._metadata.creator = self.id
         self.__addPendingAction(Modelactions.ADDVULNHOST, vuln_obj)
-        return vuln_obj.getID()
+        return vuln_obj.getIDOrPlaceholder()
 
     @deprecation.deprecated(deprecated_in="3.0", removed_in="3.5",
                             current_version=f_client_version,
@@ -297,7 +297,7 @@ class PluginBase:
 
         vuln_obj._metadata.creator = self.id
         self.__addPendingAction(Modelactions.ADDVULNHOST, vuln_obj)
-        return vuln_obj.getID()
+        return vuln_obj.getIDOrPlaceholder()
 
     def createAndAddVulnToService(self, host_id, service_id, name, desc="",
                                   ref=None, severity="", resolution="", data="", external_id=None):
@@ -313,7 +313,7 @@ class PluginBase:
         vuln_obj._metadata.creator = self.id
 
         self.__addPendingAction(Modelactions.ADDVULNSRV, vuln_obj)
-        return vuln_obj.getID()
+        return vuln_obj.getIDOrPlaceholder()
 
     def createAndAddVulnWebToService(self, host_id, service_id, name, desc="",
                                      ref=None, severity="", resolution="",
@@ -334,7 +334,7 @@ class PluginBase:
 
         vulnweb_obj._metadata.creator = self.id
         self.__addPendingAction(Modelactions.ADDVULNWEBSRV, vulnweb_obj)
-        return vulnweb_obj.getID()
+        return vulnweb_obj.getIDOrPlaceholder()
 
     def createAndAddNoteToHost(self, host_id, name, text):
         return None
@@ -361,7 +361,7 @@ class PluginBase:
 
         cred_obj._metadata.creator = self.id
         self.__addPendingAction(Modelactions.ADDCREDSRV, cred_obj)
-        return cred_obj.getID()
+        return cred_obj.getIDOrPlaceholder()
 
     def log(self, msg, level='INFO'):
         self.__addPendingAction(Modelactions.LOG, msg, level)
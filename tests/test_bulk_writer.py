@@ -0,0 +1,137 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import itertools
+import threading
+import unittest
+from unittest.mock import patch
+
+from faraday_client.managers.bulk_writer import BulkWriter
+from faraday_client.managers.mapper_manager import MapperManager
+from faraday_client.persistence.server import models
+from faraday_client.persistence.server.server_io_exceptions import ConflictInDatabase
+
+models.FARADAY_UP = False
+
+
+def new_host(ip):
+    return models.Host({'ip': ip, 'name': ip}, 'a_ws')
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        ids = itertools.count(1)
+        self.create_object_patch = patch(
+            'faraday_client.managers.bulk_writer.create_object',
+            side_effect=lambda ws, signature, obj, command_id: {'id': next(ids)})
+        self.create_object = self.create_object_patch.start()
+
+    def tearDown(self):
+        self.create_object_patch.stop()
+
+    def test_ids_are_resolved_on_flush(self):
+        writer = BulkWriter(max_batch_size=100, max_delay=60)
+        hosts = [new_host('10.0.0.{0}'.format(i)) for i in range(5)]
+        for host in hosts:
+            writer.add('a_ws', host)
+        self.assertTrue(all(host.id is None for host in hosts))
+        writer.flush(wait=True)
+        self.assertEqual(sorted(host.getID() for host in hosts), [1, 2, 3, 4, 5])
+        self.assertTrue(all(host.id_available.is_set() for host in hosts))
+        self.assertEqual(writer.batches_sent, 1)
+        writer.close()
+
+    def test_batch_size_threshold(self):
+        writer = BulkWriter(max_batch_size=2, max_delay=60)
+        hosts = [new_host('10.0.0.{0}'.format(i)) for i in range(4)]
+        for host in hosts:
+            writer.add('a_ws', host)
+        # no flush needed, the batches are full
+        self.assertIsNotNone(hosts[-1].getID())
+        writer.close()
+        self.assertEqual(writer.batches_sent, 2)
+
+    def test_delay_threshold(self):
+        writer = BulkWriter(max_batch_size=100, max_delay=0.01)
+        host = new_host('10.0.0.1')
+        writer.add('a_ws', host)
+        self.assertTrue(host.id_available.wait(timeout=2))
+        writer.close()
+
+    def test_callback_gets_errors(self):
+        results = []
+        conflict = ConflictInDatabase(None)
+        self.create_object.side_effect = conflict
+        writer = BulkWriter()
+        host = new_host('10.0.0.1')
+        writer.add('a_ws', host, callback=lambda *args: results.append(args))
+        writer.close()
+        self.assertEqual(results, [(host, None, conflict)])
+
+    def test_children_wait_for_the_placeholder_of_their_parent(self):
+        # the real create_object resolves the placeholder parent ids
+        self.create_object_patch.stop()
+        writer = BulkWriter(max_batch_size=100, max_delay=60)
+        host = new_host('10.0.0.1')
+        service = models.Service({'name': 'ssh', 'protocol': 'tcp', 'ports': [22],
+                                  'version': '', 'status': 'open',
+                                  'parent': host.getIDOrPlaceholder()}, 'a_ws')
+        with patch('faraday_client.persistence.server.server.create_host',
+                   return_value={'id': 1}), \
+                patch('faraday_client.persistence.server.server.create_service',
+                      return_value={'id': 2}) as create_service:
+            writer.add('a_ws', host)
+            writer.add('a_ws', service)
+            writer.close()
+        self.create_object_patch.start()
+        self.assertEqual(service.getID(), 2)
+        self.assertEqual(create_service.call_args[1]['parent'], 1)
+
+    def test_objects_of_a_batch_are_sent_at_the_same_time(self):
+        # the real create_object, down to the server calls
+        self.create_object_patch.stop()
+        ids = itertools.count(1)
+        # only passed if both requests are waiting on it at once
+        both_sent = threading.Barrier(2, timeout=5)
+
+        def create_host(*args, **kwargs):
+            both_sent.wait()
+            return {'id': next(ids)}
+
+        writer = BulkWriter(max_batch_size=100, max_delay=60, max_workers=2)
+        hosts = [new_host('10.0.0.1'), new_host('10.0.0.2')]
+        with patch('faraday_client.persistence.server.server.create_host', side_effect=create_host):
+            for host in hosts:
+                writer.add('a_ws', host)
+            writer.close()
+        self.create_object_patch.start()
+        self.assertEqual(sorted(host.getID(timeout=0) for host in hosts), [1, 2])
+        self.assertFalse(both_sent.broken)
+
+    def test_failed_objects_fail_their_id_future(self):
+        self.create_object.side_effect = RuntimeError('the server is down')
+        writer = BulkWriter()
+        host = new_host('10.0.0.1')
+        writer.add('a_ws', host)
+        writer.close()
+        self.assertIsInstance(host.id_future.exception(timeout=0), RuntimeError)
+        self.assertIsNone(host.getID())
+
+    def test_mapper_manager_without_bulk_writer_saves_now(self):
+        results = []
+        mapper_manager = MapperManager()
+        mapper_manager.createMappers('a_ws')
+        host = new_host('10.0.0.1')
+        with patch('faraday_client.managers.mapper_manager.create_object', return_value={'id': 7}):
+            mapper_manager.save_later(host, callback=lambda *args: results.append(args))
+        self.assertEqual(host.getID(), 7)
+        self.assertEqual(results, [(host, 7, None)])
+
+
+# I'm Py3
@@ -0,0 +1,249 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from faraday_client.persistence.server import changes_stream, server
+from faraday_client.persistence.server.changes_stream import (ChangesStream, WebsocketsChangesStream,
+                                                              WebsocketsConnection, catch_up_change,
+                                                              coalesce_changes, reconnect_delay)
+from faraday_client.persistence.server.server_io_exceptions import CantCommunicateWithServerError
+
+
+def change(obj_id, action='CREATE', workspace=None):
+    message = {'action': action, 'id': obj_id, 'type': 'Host', 'name': 'h'}
+    if workspace is not None:
+        message['workspace'] = workspace
+    return json.dumps(message)
+
+
+class ChangesStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = ChangesStream()
+
+    def tearDown(self):
+        self.stream.stop()
+
+    def test_get_batch_drains_the_queue(self):
+        for obj_id in range(1200):
+            self.stream._put(change(obj_id))
+        self.stream._put('not json')
+        batches = [self.stream.get_batch(max_size=500) for _ in range(3)]
+        self.assertEqual([len(batch) for batch in batches], [500, 500, 200])
+        self.assertEqual(batches[0][0]['id'], 0)
+        self.assertEqual(self.stream.get_batch(timeout=0.01), [])
+        metrics = self.stream.metrics.snapshot()
+        self.assertEqual((metrics['received'], metrics['dispatched'], metrics['dropped']),
+                         (1201, 1200, 1))
+        self.assertEqual(metrics['pending'], 0)
+        self.assertEqual(metrics['batches'], 3)
+
+    def test_get_batch_blocks_until_a_change_or_stop(self):
+        threading.Timer(0.05, self.stream._put, [change(1)]).start()
+        self.assertEqual([c['id'] for c in self.stream.get_batch(timeout=5)], [1])
+        threading.Timer(0.05, self.stream.stop).start()
+        self.assertIsNone(self.stream.get_batch(timeout=5))
+
+    def test_subscribers_get_the_changes_in_batches(self):
+        received = []
+        done = threading.Event()
+
+        def subscriber(changes):
+            received.append(len(changes))
+            if sum(received) == 5000:
+                done.set()
+
+        started = time.time()
+        for obj_id in range(5000):
+            self.stream._put(change(obj_id))
+        self.stream.subscribe(subscriber)
+        self.assertTrue(done.wait(5))
+        self.assertLess(time.time() - started, 5)
+        self.assertLessEqual(len(received), 10)
+        metrics = self.stream.metrics.snapshot()
+        self.assertGreater(metrics['throughput'], 1000)
+        self.assertLess(metrics['max_lag'], 5)
+
+    def test_linger_waits_for_more_changes(self):
+        self.stream._put(change(1))
+        threading.Timer(0.05, self.stream._put, [change(2)]).start()
+        self.assertEqual([c['id'] for c in self.stream.get_batch(linger=2, max_size=2)], [1, 2])
+
+    def test_coalesce_changes(self):
+        changes = [json.loads(change(obj_id, action)) for obj_id, action in
+                   [(1, 'CREATE'), (2, 'UPDATE'), (1, 'UPDATE'), (3, 'CREATE'),
+                    (2, 'UPDATE'), (3, 'DELETE'), (4, 'UPDATE'), (4, 'DELETE')]]
+        changes[2]['name'] = 'renamed'
+        coalesced = coalesce_changes(changes)
+        self.assertEqual([(c['id'], c['action']) for c in coalesced],
+                         [(1, 'CREATE'), (2, 'UPDATE'), (3, 'DELETE'), (4, 'DELETE')])
+        self.assertEqual(coalesced[0]['name'], 'renamed')
+        self.assertEqual(changes[0]['action'], 'CREATE')
+
+    def test_iterating_does_not_wait(self):
+        self.stream._put(change(1))
+        self.stream._put(change(2))
+        self.assertEqual([c['id'] for c in self.stream], [1, 2])
+        self.assertEqual(list(self.stream), [])
+
+
+class FakeWebSocketApp:
+    """Drops the connection the first two times it is run"""
+
+    instances = []
+
+    def __init__(self, url, on_message, on_error, on_open, on_close):
+        self.on_message = on_message
+        self.on_open = on_open
+        self.sent = []
+        self.closed = threading.Event()
+        self.instances.append(self)
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+        self.on_message(self, change(len(self.instances), 'UPDATE'))
+        if len(self.instances) > 2:
+            self.closed.wait()
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def close(self):
+        self.closed.set()
+
+
+class WebsocketsChangesStreamTest(unittest.TestCase):
+
+    def test_reconnect_delay(self):
+        self.assertTrue(0.5 <= reconnect_delay(0) <= 1)
+        self.assertTrue(4 <= reconnect_delay(3) <= 8)
+        self.assertTrue(30 <= reconnect_delay(20) <= 60)
+
+    def test_catch_up_change(self):
+        def row(create_time, update_time):
+            return {'id': 1, 'value': {'name': 'h', 'metadata': {'create_time': create_time,
+                                                                 'update_time': update_time}}}
+
+        self.assertIsNone(catch_up_change(row(10, 20), 100, 'Host'))
+        self.assertEqual(catch_up_change(row(10, 200), 100, 'Host'),
+                         {'action': 'UPDATE', 'id': 1, 'type': 'Host', 'name': 'h'})
+        self.assertEqual(catch_up_change(row(150000, 200000), 100, 'Host')['action'], 'CREATE')
+
+    def test_reconnects_and_catches_up(self):
+        FakeWebSocketApp.instances = []
+        tokens = iter(range(100))
+        old_host = {'id': 7, 'value': {'name': 'old', 'metadata': {'update_time': 1000}}}
+        new_host = {'id': 8, 'value': {'name': 'new', 'metadata': {'create_time': 1000,
+                                                                   'update_time': time.time()}}}
+        with patch.object(changes_stream.websocket, 'WebSocketApp', FakeWebSocketApp), \
+                patch.object(changes_stream, 'RECONNECT_BASE_DELAY', 0.01), \
+                patch.object(server, '_post', side_effect=lambda *args, **kwargs: {'token': next(tokens)}), \
+                patch.object(server, 'iter_hosts',
+                             side_effect=lambda ws, **params: iter([[old_host, new_host]])) as iter_hosts, \
+                patch.object(server, 'iter_services', return_value=iter([])), \
+                patch.object(server, 'iter_all_vulns', return_value=iter([])):
+            stream = WebsocketsChangesStream('a_ws', 'http://127.0.0.1:5985')
+            received = []
+            deadline = time.time() + 5
+            while time.time() < deadline and len(received) < 5:
+                received.extend(stream.get_batch(timeout=0.1))
+            stream.stop()
+        self.assertEqual(stream.reconnections, 2)
+        self.assertEqual([fake.sent[0]['token'] for fake in FakeWebSocketApp.instances], [0, 1, 2])
+        self.assertEqual(sorted(c['id'] for c in received), [1, 2, 3, 8, 8])
+        self.assertEqual([c['action'] for c in received if c['id'] == 8], ['UPDATE', 'UPDATE'])
+        # the server was asked only for the objects changed since then
+        self.assertIn(changes_stream.CATCH_UP_SINCE_PARAM, iter_hosts.call_args[1])
+
+    def test_catch_up_reads_everything_if_the_server_can_not_filter(self):
+        def iter_hosts(workspace_name, **params):
+            if params:
+                raise CantCommunicateWithServerError('get', 'url', params, None)
+            yield [{'id': 7}]
+
+        pages = changes_stream._changed_pages(iter_hosts, 'a_ws', 1000)
+        self.assertEqual(list(pages), [[{'id': 7}]])
+        self.assertEqual(list(changes_stream._changed_pages(lambda ws, **params: iter([]), 'a_ws', 1000)),
+                         [])
+
+
+class OpenWebSocketApp(FakeWebSocketApp):
+    """Stays connected until closed"""
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+        self.closed.wait()
+
+
+class WebsocketsConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        OpenWebSocketApp.instances = []
+        self.patches = [patch.object(changes_stream.websocket, 'WebSocketApp', OpenWebSocketApp),
+                        patch.object(server, '_post', return_value={'token': 't'})]
+        for started in self.patches:
+            started.start()
+        self.connection = WebsocketsConnection('http://127.0.0.1:5985')
+
+    def tearDown(self):
+        self.connection.stop()
+        for started in self.patches:
+            started.stop()
+
+    def wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_workspaces_share_the_websocket(self):
+        streams = [WebsocketsChangesStream('ws_{0}'.format(number), connection=self.connection)
+                   for number in range(30)]
+        other_stream = WebsocketsChangesStream('ws_0', connection=self.connection)
+        received = {}
+        done = threading.Event()
+
+        def subscriber(changes):
+            for each in changes:
+                received.setdefault(each['workspace'], []).append(each['id'])
+            if sum(map(len, received.values())) == 60:
+                done.set()
+
+        threads = threading.active_count()
+        for stream in streams:
+            stream.subscribe(subscriber)
+        self.assertLessEqual(threading.active_count(), threads + 1)
+
+        fake = OpenWebSocketApp.instances[0]
+        self.wait_for(lambda: len(fake.sent) == 30)
+        self.assertEqual(len(OpenWebSocketApp.instances), 1)
+        self.assertEqual(sorted(message['workspace'] for message in fake.sent),
+                         sorted(stream.workspace_name for stream in streams))
+        for obj_id in range(2):
+            for stream in streams:
+                self.connection.on_message(fake, change(obj_id, workspace=stream.workspace_name))
+        self.connection.on_message(fake, change(5, workspace='not_joined'))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received['ws_7'], [0, 1])
+        self.assertEqual([each['id'] for each in other_stream.get_batch()], [0, 1])
+
+        # the workspace is left when no stream uses it anymore
+        streams[0].stop()
+        self.assertEqual(len(fake.sent), 30)
+        other_stream.stop()
+        self.assertEqual(fake.sent[-1], {'action': 'LEAVE_WORKSPACE', 'workspace': 'ws_0'})
+        self.connection.on_message(fake, change(9, workspace='ws_0'))
+        self.assertFalse(fake.closed.is_set())
+
+
+# I'm Py3
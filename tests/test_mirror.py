@@ -0,0 +1,144 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from faraday_client.persistence.server import mirror, models, server
+from faraday_client.persistence.server.changes_stream import ChangesStream
+from faraday_client.persistence.server.server_io_exceptions import CantCommunicateWithServerError
+
+models.FARADAY_UP = False
+
+WS = 'a_ws'
+
+
+def host_row(host_id, ip, os_name='Linux'):
+    return {'id': host_id, 'key': host_id, 'value': {'_id': host_id, 'ip': ip, 'name': ip, 'os': os_name}}
+
+
+def service_row(service_id, host_id, port):
+    return {'id': service_id, 'value': {'name': 'ssh', 'protocol': 'tcp', 'ports': [port],
+                                        'version': '', 'status': 'open', 'parent': host_id}}
+
+
+def vuln_row(vuln_id, parent_id, severity, vuln_type='Vulnerability'):
+    return {'id': vuln_id, 'value': {'name': 'v', 'desc': '', 'severity': severity, 'type': vuln_type,
+                                     'parent': parent_id, 'parent_type': 'Host',
+                                     'target': '10.0.0.1'}}
+
+
+class WorkspaceMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mirror = mirror.WorkspaceMirror(WS, os.path.join(self.directory, 'ws.sqlite'))
+        self.pages = {
+            'iter_hosts': [[host_row(1, '10.0.0.1'), host_row(2, '10.0.0.2', 'Windows')],
+                           [host_row(3, '10.0.0.3')]],
+            'iter_services': [[service_row(5, 1, 22), service_row(6, 2, 80)]],
+            'iter_all_vulns': [[vuln_row(8, 1, 'high'), vuln_row(9, 1, 'low', 'VulnerabilityWeb')]],
+        }
+        self.patches = [patch.object(server, name, return_value=pages)
+                        for name, pages in self.pages.items()]
+        self.patches += [patch.object(server, 'get_notes', return_value=[]),
+                         patch.object(server, 'get_credentials', return_value=[])]
+        for started in self.patches:
+            started.start()
+        self.mirror.sync()
+
+    def tearDown(self):
+        for started in self.patches:
+            started.stop()
+        models.MIRRORS.pop(WS, None)
+        self.mirror.close()
+        shutil.rmtree(self.directory)
+
+    def test_sync_and_query(self):
+        self.assertTrue(self.mirror.is_fresh())
+        self.assertEqual(self.mirror.count('hosts'), 3)
+        self.assertEqual(self.mirror.query('hosts', {'os': 'Linux'}),
+                         [host_row(1, '10.0.0.1'), host_row(3, '10.0.0.3')])
+        self.assertEqual([row['id'] for row in self.mirror.query('services', {'host_id': 2})], [6])
+        self.assertEqual([row['id'] for row in self.mirror.query('vulns', {'object_id': '9'})], [9])
+        self.assertEqual(self.mirror.query('hosts', {'object_id': None, 'fields': 'ip'}),
+                         self.mirror.query('hosts', {}))
+        self.assertIsNone(self.mirror.query('hosts', {'sort': 'ip'}))
+
+    def test_models_read_from_the_mirror(self):
+        models.MIRRORS[WS] = self.mirror
+        with patch.object(server, 'get_hosts') as get_hosts, \
+                patch.object(server, 'get_all_vulns') as get_all_vulns:
+            hosts = models.get_hosts(WS, where=models.F.os == 'Windows')
+            self.assertEqual([host.ip for host in hosts], ['10.0.0.2'])
+            self.assertEqual([vuln.id for vuln in models.get_web_vulns(WS)], [9])
+            self.assertEqual([vuln.id for vuln in models.get_vulns(WS, severity='high')], [8])
+        self.assertFalse(get_hosts.called or get_all_vulns.called)
+
+    def test_stale_mirror_is_read_when_the_server_fails(self):
+        models.MIRRORS[WS] = self.mirror
+        self.mirror.synced_at -= mirror.MIRROR_MAX_AGE
+        self.assertFalse(self.mirror.is_fresh())
+        error = CantCommunicateWithServerError(None, 'url', {}, None)
+        with patch.object(server, 'get_services', side_effect=error) as get_services:
+            services = models.get_services(WS)
+        self.assertTrue(get_services.called)
+        self.assertEqual([service.id for service in services], [5, 6])
+
+    def test_changes_made_during_the_sync_are_applied(self):
+        stream = ChangesStream()
+        new_host = {'_id': 4, 'id': 4, 'ip': '10.0.0.4', 'name': '10.0.0.4', 'os': 'BSD'}
+
+        joined = []
+
+        def get_changes_stream(ws):
+            joined.append(ws)
+            return stream
+
+        def iter_hosts(ws, page_size):
+            # someone adds a host while the sync runs, only the clients
+            # which joined the workspace hear about it
+            if joined:
+                stream._put(json.dumps({'action': 'CREATE', 'type': 'Host', 'id': 4}))
+            return self.pages['iter_hosts']
+
+        with patch.object(models, 'get_changes_stream', side_effect=get_changes_stream), \
+                patch.object(server, 'iter_hosts', side_effect=iter_hosts), \
+                patch.object(server, 'get_hosts', return_value=[new_host]):
+            workspace_mirror = models.enable_mirror(WS, os.path.join(self.directory, 'enabled.sqlite'))
+            deadline = time.time() + 5
+            while time.time() < deadline and not workspace_mirror.query('hosts', {'os': 'BSD'}):
+                time.sleep(0.01)
+        self.assertEqual(workspace_mirror.query('hosts', {'os': 'BSD'})[0]['value']['ip'], '10.0.0.4')
+        self.assertEqual(workspace_mirror.count('hosts'), 4)
+        models.disable_mirror(WS)
+        self.assertTrue(stream._stop)
+
+    def test_apply_changes(self):
+        with patch.object(server, 'get_hosts', return_value=[{'_id': 4, 'id': 4, 'ip': '10.0.0.4',
+                                                               'name': '10.0.0.4', 'os': 'BSD'}]):
+            self.mirror.apply_change({'action': 'CREATE', 'type': 'Host', 'id': 4})
+        self.assertEqual(self.mirror.query('hosts', {'os': 'BSD'})[0]['value']['ip'], '10.0.0.4')
+
+        self.mirror.apply_change({'action': 'DELETE', 'type': 'Vulnerability', 'id': 8})
+        self.assertEqual([row['id'] for row in self.mirror.query('vulns', {})], [9])
+
+        with patch.object(server, 'get_services', side_effect=CantCommunicateWithServerError(
+                None, 'url', {}, None)):
+            self.mirror.apply_change({'action': 'UPDATE', 'type': 'Service', 'id': 5})
+        self.assertFalse(self.mirror.is_fresh())
+        self.mirror.sync()
+        self.assertTrue(self.mirror.is_fresh())
+
+
+# I'm Py3
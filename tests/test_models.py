@@ -6,10 +6,17 @@ See the file 'doc/LICENSE' for the license information
 '''
 from __future__ import absolute_import
 
+import os
 import unittest
 import json
+import pickle
+import sys
+import time
 from faraday_client.persistence.server import models
-from unittest.mock import patch
+from faraday_client.persistence.server.filters import F
+from faraday_client.persistence.server.id_future import is_placeholder, resolve_id
+from faraday_client.persistence.server.identity_map import IdentityMap
+from unittest.mock import Mock, patch
 
 HOST_JSON_STRING = '{"_id":1,"id":"08d3b6545ec70897daf05cd471f4166a8e605c00","key":"08d3b6545ec70897daf05cd471f4166a8e605c00","value":{"_id":"08d3b6545ec70897daf05cd471f4166a8e605c00","_rev":"1-a12368dc03d557c337e833f8090db568","default_gateway":["192.168.20.1","00:1d:aa:c9:83:e8"],"description":"","metadata":{"create_time":1475852074.455225,"creator":"","owner":"","update_action":0,"update_controller_action":"ModelControler._processAction ModelControler.newHost","update_time":1475852074.455226,"update_user":""},"name":"10.31.112.29","os":"Microsoft Windows Server 2008 R2 Standard Service Pack 1","owned":"false","owner":"","services":12,"vulns":43}}'
 
@@ -26,6 +33,10 @@ NOTE_JSON_STRING = '{"_id":1,"id":"08d3b6545ec70897daf05cd471f4166a8e605c00.0294
 models.FARADAY_UP = False
 models.MERGE_STRATEGY = None  # this is the default :)
 
+class PlainObject:
+    """What the models would be without __slots__"""
+
+
 class ModelsTest(unittest.TestCase):
 
     def setUp(self):
@@ -38,13 +49,42 @@ class ModelsTest(unittest.TestCase):
         self.a_note_dictionary = json.loads(NOTE_JSON_STRING)
 
         self.maxDiff = None  # show the diff when test run no matter how big
+        models.IDENTITY_MAP.clear()
 
     def test_ignore_in_changes(self):
-        def server_io(): return {'ok': True, 'rev': 1, 'id': 2}
+        def server_io(workspace_name, obj): return {'ok': True, 'rev': 1, 'id': 2}
         decorated = models._ignore_in_changes(server_io)
-        with patch.dict(models._LOCAL_CHANGES_ID_TO_REV, clear=True):
-            json = decorated()
-            self.assertEqual(models._LOCAL_CHANGES_ID_TO_REV[json['id']], json['rev'])
+        with patch.object(models, 'ECHO_FILTER', models.EchoFilter()) as echo_filter:
+            decorated(self.ws, models.Host({'ip': '10.0.0.1', 'name': '10.0.0.1'}, self.ws))
+            self.assertTrue(echo_filter.is_echo(self.ws, {'action': 'CREATE', 'type': 'Host', 'id': 2}))
+            self.assertFalse(echo_filter.is_echo(self.ws, {'action': 'UPDATE', 'type': 'Host', 'id': 2}))
+
+            delete = models._ignore_in_changes(lambda workspace_name, obj_id: {},
+                                               class_signature='VulnerabilityWeb')
+            delete(self.ws, 5)
+            self.assertTrue(echo_filter.is_echo(self.ws, {'action': 'DELETE', 'type': 'Vulnerability',
+                                                          'id': '5'}))
+
+            failing = models._ignore_in_changes(Mock(side_effect=ValueError), class_signature='Host')
+            with self.assertRaises(ValueError):
+                failing(self.ws, 3)
+            self.assertEqual(len(echo_filter), 0)
+
+    def test_echo_filter_is_bounded_and_expires(self):
+        echo_filter = models.EchoFilter(max_entries=3, ttl=30)
+        for host_id in range(10):
+            echo_filter.remember(self.ws, 'Host', host_id)
+        self.assertEqual(len(echo_filter), 3)
+        self.assertFalse(echo_filter.is_echo(self.ws, {'type': 'Host', 'id': 0}))
+        echo_filter.remember(self.ws, 'Host', 9)
+        self.assertTrue(echo_filter.is_echo(self.ws, {'type': 'Host', 'id': 9}))
+        self.assertTrue(echo_filter.is_echo(self.ws, {'type': 'Host', 'id': 9}))
+        self.assertFalse(echo_filter.is_echo(self.ws, {'type': 'Host', 'id': 9}))
+        echo_filter.remember(self.ws, 'Host', 1, rev='2-a')
+        self.assertFalse(echo_filter.is_echo(self.ws, {'type': 'Host', 'id': 1, 'rev': '3-b'}))
+        echo_filter.ttl = -1
+        echo_filter.remember(self.ws, 'Host', 20)
+        self.assertFalse(echo_filter.is_echo(self.ws, {'type': 'Host', 'id': 20}))
 
     def test_flatten_dictionary(self):
         flattened_host_dictionary = models._flatten_dictionary(self.a_host_dictionary)
@@ -81,5 +121,460 @@ class ModelsTest(unittest.TestCase):
         self.assertTrue(all([isinstance(v, models.Vuln) for v in vulns]))
         self.assertTrue(all([isinstance(v, models.VulnWeb) for v in vulns_web]))
 
+    def test_iter_vulns(self):
+        pages = [[self.a_vuln_dictionary, self.a_vuln_web_dictionary], [self.a_vuln_dictionary]]
+        with patch('faraday_client.persistence.server.server.iter_all_vulns', return_value=iter(pages)):
+            vulns = models.iter_vulns(self.ws, page_size=2)
+            self.assertIsInstance(next(vulns), models.Vuln)
+            self.assertIsInstance(next(vulns), models.VulnWeb)
+            self.assertEqual(len(list(vulns)), 1)
+
+
+    def test_filter_server_params(self):
+        columns = models.SERVER_FILTER_COLUMNS['vulns']
+        where = F.severity.in_(['high', 'med']) & (F.status == 'open') & F.name.matches('ssl')
+        self.assertEqual(where.server_params(columns),
+                         [{'severity': 'high', 'status': 'open'},
+                          {'severity': 'medium', 'status': 'open'}])
+        self.assertEqual(((F.status == 'open') | (F.name != 'x')).server_params(columns), [{}])
+        self.assertEqual(((F.status == 'open') & (F.status == 'closed')).server_params(columns), [])
+
+    def test_get_all_vulns_where(self):
+        info_vuln = self.a_vuln_dictionary
+        web_vuln = self.a_vuln_web_dictionary
+
+        def get_all_vulns(workspace_name, **params):
+            return [vuln for vuln in [info_vuln, web_vuln]
+                    if params.get('severity') in (None, 'informational')]
+
+        with patch('faraday_client.persistence.server.server.get_all_vulns',
+                   side_effect=get_all_vulns) as get_all_vulns_mock:
+            vulns = models.get_all_vulns(self.ws, where=(F.severity == 'info') & F.name.matches('^Service'))
+        # the heavy fields are left out of the list
+        get_all_vulns_mock.assert_called_once_with(self.ws, severity='informational',
+                                                   fields=','.join(sorted(models.VULN_LIGHT_FIELDS)))
+        self.assertEqual([vuln.name for vuln in vulns], ['Service Detection'])
+
+
+    def test_projected_vulns_get_the_full_vuln_when_needed(self):
+        projected_vuln = {'id': 8, 'value': {'name': 'Ethernet Card Manufacturer Detection',
+                                             'severity': 'informational',
+                                             'type': 'Vulnerability'}}
+        with patch('faraday_client.persistence.server.server.get_all_vulns',
+                   return_value=[projected_vuln]) as get_all_vulns_mock:
+            vulns = models.get_all_vulns(self.ws, fields=['name', 'severity'])
+        self.assertEqual(get_all_vulns_mock.call_args[1]['fields'],
+                         '_id,id,name,parent,parent_type,severity,type')
+        vuln, = vulns
+        self.assertIsInstance(vuln, models.Vuln)
+        self.assertEqual(vuln.severity, 'info')
+        self.assertNotIn('refs', vars(vuln))
+
+        full_vuln = models.Vuln(models._flatten_dictionary(self.a_vuln_dictionary), self.ws)
+        with patch.dict(models._FULL_OBJECT_GETTERS, {'Vulnerability': lambda ws, vuln_id: full_vuln}):
+            self.assertEqual(vuln.resolution, 'n/a')
+            self.assertEqual(vuln.id, 8)
+            with self.assertRaises(AttributeError):
+                vuln.not_an_attribute
+
+
+    def test_projection_of_a_server_ignoring_fields(self):
+        with patch('faraday_client.persistence.server.server.get_all_vulns',
+                   return_value=[self.a_vuln_dictionary]):
+            vuln, = models.get_all_vulns(self.ws, fields=['name', 'severity'])
+        self.assertEqual(vuln.name, 'Ethernet Card Manufacturer Detection')
+        self.assertEqual(vuln.severity, 'info')
+        for field in ('request', 'response', '_attachments', 'tags', 'refs', 'desc', 'resolution'):
+            self.assertNotIn(field, vars(vuln))
+        self.assertLessEqual(set(vars(vuln)) - {'name', 'severity', 'type'},
+                             {'_workspace_name', '_full_object_loaded', '_server_id', 'id', 'parent_id',
+                              'parent_type', '_updates', '_id_future', '_prefetched', '_fingerprint'})
+
+    def test_lazy_heavy_vuln_web_fields(self):
+        def web_vuln(vuln_id, **heavy_fields):
+            dictionary = json.loads(VULN_WEB_JSON_STRING)
+            dictionary['id'] = vuln_id
+            for field in models.VULN_HEAVY_FIELDS:
+                dictionary['value'].pop(field, None)
+            dictionary['value'].update(heavy_fields)
+            return dictionary
+
+        def get_web_vulns(workspace_name, **params):
+            if 'fields' in params:
+                return [web_vuln(vuln_id) for vuln_id in range(1, 6)]
+            heavy_vulns = [web_vuln(vuln_id, request='GET /{0}'.format(vuln_id), response='200')
+                           for vuln_id in range(1, 6)]
+            if 'object_id' in params:
+                return [vuln for vuln in heavy_vulns if vuln['id'] == params['object_id']]
+            return heavy_vulns
+
+        with patch('faraday_client.persistence.server.server.get_web_vulns',
+                   side_effect=get_web_vulns) as get_web_vulns_mock:
+            vulns = models.get_web_vulns(self.ws)
+            self.assertEqual(get_web_vulns_mock.call_count, 1)
+            self.assertIs(vulns[0]._lazy_request, models._NOT_LOADED)
+            self.assertEqual(vulns[0].getRequest(), 'GET /1')
+            self.assertEqual(vulns[0].getResponse(), '200')
+            self.assertIsNone(vulns[0].getData())
+            self.assertEqual(get_web_vulns_mock.call_count, 2)
+            self.assertEqual(vulns[1].getRequest(), 'GET /2')
+            # the third one gets the rest of the list too
+            self.assertEqual(vulns[2].getRequest(), 'GET /3')
+            self.assertEqual([vuln.getRequest() for vuln in vulns[3:]], ['GET /4', 'GET /5'])
+            self.assertEqual(get_web_vulns_mock.call_count, 6)
+
+    def test_lazy_fields_batch_loads_a_bounded_window(self):
+        def web_vuln(vuln_id, status, **heavy_fields):
+            dictionary = json.loads(VULN_WEB_JSON_STRING)
+            dictionary['id'] = vuln_id
+            dictionary['value']['status'] = status
+            for field in models.VULN_HEAVY_FIELDS:
+                dictionary['value'].pop(field, None)
+            dictionary['value'].update(heavy_fields)
+            return dictionary
+
+        def get_web_vulns(workspace_name, **params):
+            if 'object_id' in params:
+                return [web_vuln(params['object_id'], 'open', data='data {0}'.format(params['object_id']))]
+            return [web_vuln(vuln_id, 'open' if vuln_id % 2 else 'closed') for vuln_id in range(1, 401)]
+
+        with patch('faraday_client.persistence.server.server.get_web_vulns',
+                   side_effect=get_web_vulns) as get_web_vulns_mock:
+            vulns = models.get_web_vulns(self.ws, where=F.status.in_(['open', 'closed']))
+            self.assertEqual(len(vulns), 400)
+            for vuln in vulns[:3]:
+                vuln.getData()
+            self.assertEqual(vulns[3].getData(), 'data {0}'.format(vulns[3].id))
+        list_requests = [call[1] for call in get_web_vulns_mock.call_args_list if 'object_id' not in call[1]]
+        # the lists with the light fields, never with the heavy ones
+        self.assertTrue(all('fields' in params for params in list_requests))
+        loaded = [vuln for vuln in vulns if not models._LazyFieldsBatch._is_missing_fields(vuln)]
+        self.assertEqual(len(loaded), 2 + models.LAZY_FIELDS_WINDOW)
+
+    def _slot_values(self, obj):
+        values = {}
+        for attribute in models._slots_of(type(obj)):
+            try:
+                values[attribute] = object.__getattribute__(obj, attribute)
+            except AttributeError:
+                pass
+        return values
+
+    def test_bulk_construction_builds_the_same_objects(self):
+        rows = [(self.a_host_dictionary, models.Host, 'hosts'),
+                (self.a_service_dictionary, models.Service, 'services'),
+                (self.a_vuln_dictionary, models.Vuln, 'vulns'),
+                (self.a_vuln_web_dictionary, models.VulnWeb, 'vulns_web'),
+                # rows without the value wrapper, or without ids
+                ({'id': 3, 'ip': '10.0.0.1', 'os': None}, models.Host, 'hosts'),
+                ({'value': {'name': 'ssh', 'protocol': 'tcp', 'ports': ['22'],
+                            'version': '', 'status': 'open'}}, models.Service, 'services')]
+        for row, model_class, object_name in rows:
+            built, = models._get_faraday_ready_objects(self.ws, [row], object_name)
+            initialized = model_class(models._flatten_dictionary(row), self.ws)
+            self.assertIs(type(built), model_class)
+            self.assertEqual(self._slot_values(built), self._slot_values(initialized), object_name)
+
+    @unittest.skipUnless(os.environ.get('FARADAY_BENCHMARKS'), 'set FARADAY_BENCHMARKS=1 to run the benchmarks')
+    def test_bulk_construction_benchmark(self):
+        """How many objects per second are built from the rows of the
+        server. Only run on demand, the times depend on the machine."""
+        for dictionary, object_name in [(self.a_host_dictionary, 'hosts'),
+                                        (self.a_service_dictionary, 'services'),
+                                        (self.a_vuln_dictionary, 'vulns')]:
+            rows = [dict(dictionary, id=object_id) for object_id in range(5000)]
+            start = time.perf_counter()
+            objects = models._get_faraday_ready_objects(self.ws, rows, object_name)
+            objects_per_second = len(objects) / (time.perf_counter() - start)
+            print('{0}: {1:.0f} objects/second'.format(object_name, objects_per_second))
+
+    def test_fingerprints(self):
+        host = models.Host({'id': 1, 'ip': '10.0.0.1', 'name': '10.0.0.1', 'hostnames': ['a']}, self.ws)
+        same_host = models.Host({'id': 2, 'ip': '10.0.0.1', 'name': '10.0.0.1', 'hostnames': ['a']}, self.ws)
+        self.assertEqual(host.fingerprint(), same_host.fingerprint())
+        self.assertFalse(host.needs_merge(same_host))
+        same_host.updateAttributes(os='Linux')
+        self.assertNotEqual(host.fingerprint(), same_host.fingerprint())
+        self.assertTrue(host.needs_merge(same_host))
+        same_host.updateAttributes(os='unknown')
+        self.assertEqual(host.fingerprint(), same_host.fingerprint())
+        # as the scripts do
+        same_host.os = 'Windows'
+        self.assertNotEqual(host.fingerprint(), same_host.fingerprint())
+        self.assertTrue(host.needs_merge(same_host))
+
+    def test_comparing_vulns_does_not_load_their_heavy_fields(self):
+        lazy_batch = Mock()
+        light = dict(self.a_vuln_dictionary['value'], id=8)
+        del light['data']
+        vuln = models._get_faraday_ready_objects(self.ws, [light], 'vulns', lazy_batch=lazy_batch)[0]
+        lazy_batch.defer_missing_fields.assert_called_once()
+        vuln._lazy_data = models._NOT_LOADED
+        vuln._lazy_batch = lazy_batch
+        same_vuln = models.Vuln(dict(light, data='a lot of data'), self.ws)
+        self.assertFalse(vuln.needs_merge(same_vuln))
+        self.assertFalse(lazy_batch.load.called)
+        # both loaded, they are compared
+        vuln._lazy_data = 'other data'
+        self.assertTrue(vuln.needs_merge(same_vuln))
+
+    def test_merge_objects(self):
+        def service(**attributes):
+            return models.Service(dict({'name': 'ssh', 'protocol': 'tcp', 'ports': [22],
+                                        'version': 'unknown', 'status': 'open'}, **attributes),
+                                  self.ws)
+
+        unchanged = (service(), service())
+        merged = (service(), service(version='OpenSSH 7.4'))
+        conflicting = (service(status='open'), service(status='closed'))
+        result = models.merge_objects([unchanged, merged, conflicting])
+        self.assertEqual(result.unchanged, [unchanged[0]])
+        self.assertEqual(result.merged, [merged[0]])
+        self.assertEqual(merged[0].version, 'OpenSSH 7.4')
+        self.assertEqual(result.conflicts, [conflicting[0]])
+        self.assertEqual(len(conflicting[0].getUpdates()), 1)
+        self.assertEqual(conflicting[0].status, 'open')
+
+        conflicting = (service(status='open'), service(status='closed'))
+        with patch.object(models, 'MERGE_STRATEGY', 'new'):
+            result = models.merge_objects([conflicting])
+        self.assertEqual(result.merged, [conflicting[0]])
+        self.assertEqual(conflicting[0].status, 'closed')
+
+    def test_get_objects_by_ids(self):
+        def host(host_id):
+            return {'id': host_id, 'value': {'ip': '10.0.0.{0}'.format(host_id), 'name': 'h'}}
+
+        running = []
+        most_running = []
+
+        def get_hosts(ws, object_id=None, **params):
+            running.append(object_id)
+            most_running.append(len(running))
+            time.sleep(0.001)
+            running.remove(object_id)
+            return [host(object_id)] if object_id < 40 else []
+
+        with patch('faraday_client.persistence.server.server.get_hosts',
+                   side_effect=get_hosts) as get_hosts_mock:
+            hosts = models.get_objects_by_ids(self.ws, 'Host', list(range(10, 40)) + [99])
+        # never the whole table, a request for each id
+        self.assertTrue(all(call[1].get('object_id') is not None for call in get_hosts_mock.call_args_list))
+        self.assertEqual(get_hosts_mock.call_count, 31)
+        self.assertLessEqual(max(most_running), models.BULK_FETCH_CONCURRENCY)
+        self.assertEqual(sorted(hosts), sorted(str(host_id) for host_id in range(10, 40)))
+
+        with patch('faraday_client.persistence.server.server.get_hosts',
+                   side_effect=lambda ws, object_id=None: [host(object_id)]) as get_hosts:
+            hosts = models.get_objects_by_ids(self.ws, 'Host', [101, 102, 101])
+        self.assertEqual(get_hosts.call_count, 2)
+        self.assertEqual(hosts['102'].ip, '10.0.0.102')
+
+    def test_memory_per_object(self):
+        """The models keep their attributes in __slots__ and have no
+        __dict__, each object is smaller than one of a plain class with
+        the same attributes"""
+        for object_name, dictionary in (('hosts', self.a_host_dictionary),
+                                        ('services', self.a_service_dictionary),
+                                        ('vulns', self.a_vuln_dictionary)):
+            obj, = models._get_faraday_ready_objects(self.ws, [dictionary], object_name)
+            self.assertFalse(hasattr(obj, '__dict__'), object_name)
+            plain = PlainObject()
+            for attribute, value in self._slot_values(obj).items():
+                setattr(plain, attribute, value)
+            plain_size = sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+            self.assertLess(sys.getsizeof(obj), plain_size * 2 / 3, object_name)
+
+    def test_objects_without_metadata_share_the_default_one(self):
+        hosts = [models.Host({'ip': '10.0.0.{0}'.format(number), 'owner': 'me'}, self.ws)
+                 for number in range(2)]
+        self.assertIs(hosts[0].getMetadata(), hosts[1].getMetadata())
+        self.assertEqual(hosts[0].getMetadata().toDict()['owner'], 'me')
+        self.assertIsNone(hosts[0]._lazy_metadata)
+        with self.assertRaises(AttributeError):
+            hosts[0].getMetadata().creator = 'plugin'
+        # as the plugins do
+        hosts[0]._metadata.creator = 'plugin'
+        self.assertEqual(hosts[0].getMetadata().creator, 'plugin')
+        self.assertEqual(hosts[1].getMetadata().creator, 'me')
+
+    def test_lazy_id_available(self):
+        host = models.Host({'ip': '10.0.0.1'}, self.ws)
+        self.assertFalse(hasattr(host, '__dict__'))
+        self.assertFalse(host.id_available.is_set())
+        host.setID(3)
+        self.assertTrue(host.id_available.is_set())
+        self.assertEqual(host.getUpdates(), [])
+        self.assertIsInstance(host.getMetadata(), models.Metadata)
+
+
+    def test_identity_map(self):
+        with patch('faraday_client.persistence.server.server.get_hosts',
+                   return_value=[self.a_host_dictionary]) as get_hosts_mock:
+            host = models.get_object(self.ws, 'Host', self.a_host_dictionary['id'])
+            self.assertIs(models.get_host(self.ws, host_id=host.id), host)
+            self.assertEqual(get_hosts_mock.call_count, 1)
+
+            models.forget_object(self.ws, 'Host', host.id)
+            self.assertIsNot(models.get_host(self.ws, host.id), host)
+            self.assertEqual(get_hosts_mock.call_count, 2)
+
+    def test_saved_objects_are_in_the_identity_map(self):
+        service = models.Service({'name': 'ssh', 'protocol': 'tcp', 'ports': [22],
+                                  'version': '', 'status': 'open', 'parent': 1}, self.ws)
+        with patch('faraday_client.persistence.server.server.create_service',
+                   return_value={'id': 5}):
+            models.create_object(self.ws, 'Service', service, None)
+        self.assertIs(models.get_service(self.ws, 5), service)
+        self.assertIsNone(models.IDENTITY_MAP.get('another_ws', 'Service', 5))
+
+        with patch('faraday_client.persistence.server.server.delete_service'):
+            models.delete_object(self.ws, 'Service', 5)
+        self.assertIsNone(models.IDENTITY_MAP.get(self.ws, 'Service', 5))
+
+    def test_identity_map_bounds(self):
+        identity_map = IdentityMap(max_entries=2, ttl=60)
+        hosts = [models.Host({'id': host_id, 'ip': '10.0.0.1'}, self.ws) for host_id in range(3)]
+        for host in hosts:
+            identity_map.put(self.ws, host)
+        self.assertIsNone(identity_map.get(self.ws, 'Host', 0))
+        self.assertIs(identity_map.get(self.ws, 'Host', '2'), hosts[2])
+        identity_map.ttl = -1
+        identity_map.put(self.ws, hosts[0])
+        self.assertIsNone(identity_map.get(self.ws, 'Host', 0))
+
+    def test_prefetch_host_children(self):
+        def host(host_id):
+            return {'id': host_id, 'value': {'ip': '10.0.0.{0}'.format(host_id), 'name': 'h'}}
+
+        def service(service_id, host_id):
+            return {'id': service_id, 'value': {'name': 'ssh', 'protocol': 'tcp', 'ports': 22,
+                                                'version': '', 'status': 'open', 'host_id': host_id}}
+
+        def vuln(vuln_id, parent_id, parent_type, host_id):
+            return {'id': vuln_id, 'value': {'name': 'v', 'desc': '', 'severity': 'high',
+                                             'type': 'Vulnerability', 'parent': parent_id,
+                                             'parent_type': parent_type,
+                                             'target': '10.0.0.{0}'.format(host_id)}}
+
+        services = [service(5, 1), service(6, 2)]
+        vulns = [vuln(8, 1, 'Host', 1), vuln(9, 5, 'Service', 1), vuln(10, 2, 'Host', 2)]
+
+        def services_of(workspace_name, host_id, **params):
+            return [row for row in services if row['value']['host_id'] == host_id]
+
+        def vulns_of(workspace_name, target, **params):
+            return [row for row in vulns if row['value']['target'] == target]
+
+        with patch('faraday_client.persistence.server.server.get_hosts',
+                   return_value=[host(1), host(2)]), \
+                patch('faraday_client.persistence.server.server.get_services',
+                      side_effect=services_of) as get_services, \
+                patch('faraday_client.persistence.server.server.get_all_vulns',
+                      side_effect=vulns_of) as get_all_vulns:
+            hosts = models.get_hosts(self.ws, prefetch=('services', 'vulns'))
+            self.assertEqual([service.id for service in hosts[0].getServices()], [5])
+            self.assertEqual([vuln.id for vuln in hosts[0].getVulns()], [8, 9])
+            self.assertEqual([vuln.id for vuln in hosts[0].getService(5).getVulns()], [9])
+            self.assertEqual([vuln.id for vuln in hosts[1].getVulns()], [10])
+            self.assertEqual(hosts[1].getServices()[0].getVulns(), [])
+        # only the children of the hosts are asked for
+        self.assertEqual(sorted(call[1]['host_id'] for call in get_services.call_args_list), [1, 2])
+        self.assertEqual(sorted(call[1]['target'] for call in get_all_vulns.call_args_list),
+                         ['10.0.0.1', '10.0.0.2'])
+
+        with self.assertRaises(ValueError):
+            models.get_hosts(self.ws, prefetch=['notes'])
+
+    def test_cached_host_does_not_keep_prefetched_children(self):
+        host = {'id': 1, 'value': {'ip': '10.0.0.1', 'name': 'h'}}
+
+        def vuln(vuln_id):
+            return {'id': vuln_id, 'value': {'name': 'v', 'desc': '', 'severity': 'high',
+                                             'type': 'Vulnerability', 'parent': 1,
+                                             'parent_type': 'Host', 'target': '10.0.0.1'}}
+
+        with patch('faraday_client.persistence.server.server.get_hosts', return_value=[host]), \
+                patch('faraday_client.persistence.server.server.get_services', return_value=[]), \
+                patch('faraday_client.persistence.server.server.get_all_vulns',
+                      return_value=[vuln(8)]):
+            prefetched_host, = models.get_hosts(self.ws, prefetch=('vulns', ))
+        with patch('faraday_client.persistence.server.server.get_all_vulns',
+                   return_value=[vuln(8), vuln(9)]) as get_all_vulns:
+            cached_host = models.get_host(self.ws, 1)
+            self.assertEqual([vuln.id for vuln in cached_host.getVulns()], [8, 9])
+            # the caller which prefetched keeps its children
+            self.assertIsNot(cached_host, prefetched_host)
+            self.assertEqual([vuln.id for vuln in prefetched_host.getVulns()], [8])
+        self.assertEqual(get_all_vulns.call_count, 1)
+
+        # creating or deleting a child forgets its parents
+        service = models.Service({'name': 'ssh', 'protocol': 'tcp', 'ports': [22], 'version': '',
+                                  'status': 'open', 'parent': 1}, self.ws)
+        service.id = 5
+        models.IDENTITY_MAP.put(self.ws, service)
+        vuln_of_service = models.Vuln({'name': 'v', 'desc': '', 'severity': 'high', 'parent': 5,
+                                       'parent_type': 'Service'}, self.ws)
+        models.forget_parents(self.ws, vuln_of_service)
+        self.assertIsNone(models.IDENTITY_MAP.get(self.ws, 'Service', 5))
+        self.assertIsNone(models.IDENTITY_MAP.get(self.ws, 'Host', 1))
+
+        models.IDENTITY_MAP.put(self.ws, cached_host)
+        models.IDENTITY_MAP.put(self.ws, service)
+        models.forget_object(self.ws, 'Service', 5, parents=True)
+        self.assertIsNone(models.IDENTITY_MAP.get(self.ws, 'Host', 1))
+
+    def test_placeholder_ids(self):
+        host = models.Host({'ip': '10.0.0.1'}, self.ws)
+        resolved = []
+        host.id_future.add_done_callback(lambda future: resolved.append(future.result()))
+        placeholder = host.getIDOrPlaceholder()
+        self.assertTrue(is_placeholder(placeholder))
+        self.assertIs(host.getIDOrPlaceholder(), placeholder)
+        self.assertIsNone(resolve_id(placeholder, timeout=0))
+        host.setID(3)
+        self.assertEqual(resolved, [3])
+        self.assertEqual(resolve_id(placeholder), 3)
+        self.assertEqual(host.getIDOrPlaceholder(), 3)
+
+    def test_failed_save_wakes_up_get_id(self):
+        host = models.Host({'ip': '10.0.0.1'}, self.ws)
+        host.failID(RuntimeError('the server is down'))
+        self.assertIsNone(host.getID(timeout=60))
+        self.assertIsNone(resolve_id(host.getIDOrPlaceholder(), timeout=60))
+
+    def test_placeholder_parent_is_resolved_on_save(self):
+        host = models.Host({'ip': '10.0.0.1'}, self.ws)
+        service = models.Service({'name': 'ssh', 'protocol': 'tcp', 'ports': [22],
+                                  'version': '', 'status': 'open',
+                                  'parent': host.getIDOrPlaceholder()}, self.ws)
+        host.setID(4)
+        with patch('faraday_client.persistence.server.server.create_service',
+                   return_value={'id': 5}) as create_service:
+            models.create_object(self.ws, 'Service', service, None)
+        self.assertEqual(service.getParent(), 4)
+        self.assertEqual(create_service.call_args[1]['parent'], 4)
+
+    def test_children_of_a_failed_parent_are_not_saved(self):
+        host = models.Host({'ip': '10.0.0.1'}, self.ws)
+        service = models.Service({'name': 'ssh', 'protocol': 'tcp', 'ports': [22],
+                                  'version': '', 'status': 'open',
+                                  'parent': host.getIDOrPlaceholder()}, self.ws)
+        error = RuntimeError('the server is down')
+        host.failID(error)
+        with patch('faraday_client.persistence.server.server.create_service') as create_service:
+            with self.assertRaises(RuntimeError) as raised:
+                models.create_object(self.ws, 'Service', service, None)
+        self.assertIs(raised.exception, error)
+        self.assertFalse(create_service.called)
+
+    def test_unresolved_placeholders_can_not_be_pickled(self):
+        host = models.Host({'ip': '10.0.0.1'}, self.ws)
+        placeholder = host.getIDOrPlaceholder()
+        with self.assertRaises(pickle.PicklingError):
+            pickle.dumps(placeholder)
+        host.setID(3)
+        self.assertEqual(pickle.loads(pickle.dumps(placeholder)), '3')
+
 
 # I'm Py3
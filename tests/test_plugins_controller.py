@@ -6,11 +6,15 @@ See the file 'doc/LICENSE' for the license information
 '''
 from __future__ import absolute_import
 
+import gzip
 import sys
 sys.path.append('.')
 import unittest
 from queue import Queue
 from unittest.mock import MagicMock as mock
+from unittest.mock import patch
+
+import responses
 
 import faraday_client.plugins.controller
 
@@ -100,4 +104,49 @@ class PluginControllerUnitTest(unittest.TestCase):
         self.plugin1.updateSettings.assert_called_once_with(new_settings)
 
 
+@patch('faraday_client.plugins.controller._conf')
+@patch('faraday_client.plugins.controller._get_base_server_url',
+       return_value='http://localhost:5985')
+class PluginControllerSendDataTest(unittest.TestCase):
+
+    url = 'http://localhost:5985/_api/v2/ws/a_ws/bulk_create/'
+    plugin_result = '{"hosts": [{"ip": "10.0.0.1"}], "command": {}}'
+
+    def setUp(self):
+        plugin_manager = mock()
+        plugin_manager.plugins = mock(return_value=[])
+        self.controller = faraday_client.plugins.controller.PluginController(
+            'PluginController', plugin_manager, mock(), Queue())
+
+    @responses.activate
+    def test_result_is_sent_as_is(self, base_url, conf):
+        responses.add(responses.POST, self.url, status=201)
+        self.assertTrue(self.controller.send_data('a_ws', self.plugin_result))
+        request = responses.calls[0].request
+        self.assertEqual(request.body, self.plugin_result.encode('utf8'))
+        self.assertEqual(request.headers['Content-Type'], 'application/json')
+
+    @responses.activate
+    @patch('faraday_client.plugins.controller.SEND_DATA_GZIP', True)
+    def test_result_is_compressed(self, base_url, conf):
+        responses.add(responses.POST, self.url, status=201)
+        self.assertTrue(self.controller.send_data('a_ws', self.plugin_result))
+        request = responses.calls[0].request
+        self.assertEqual(request.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(request.body), self.plugin_result.encode('utf8'))
+
+    @patch('faraday_client.plugins.controller.get_session')
+    def test_result_is_sent_with_the_upload_timeout(self, get_session, base_url, conf):
+        get_session.return_value.post.return_value.status_code = 201
+        self.assertTrue(self.controller.send_data('a_ws', self.plugin_result))
+        self.assertEqual(get_session.return_value.post.call_args[1]['timeout'],
+                         faraday_client.persistence.server.session.UPLOAD_TIMEOUT)
+
+    @responses.activate
+    @patch('faraday_client.plugins.controller.SEND_DATA_VALIDATE', True)
+    def test_invalid_result_is_not_sent(self, base_url, conf):
+        self.assertFalse(self.controller.send_data('a_ws', '{"hosts": ['))
+        self.assertEqual(len(responses.calls), 0)
+
+
 # I'm Py3
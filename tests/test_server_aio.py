@@ -0,0 +1,85 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from faraday_client.persistence.server import aio, server, server_io_exceptions, session
+
+server.FARADAY_UP = False
+server.SERVER_URL = "http://localhost:5985"
+
+
+class AsyncServerAPITests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        aio.set_max_concurrency(20)
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    @patch('faraday_client.persistence.server.server.get_hosts', return_value=[{'id': 1}])
+    def test_mirrors_server_function(self, get_hosts_mock):
+        hosts = self.run_coroutine(aio.get_hosts('a_ws', os='linux'))
+        self.assertEqual(hosts, [{'id': 1}])
+        get_hosts_mock.assert_called_once_with('a_ws', os='linux')
+
+    @patch('faraday_client.persistence.server.server.delete_host',
+           side_effect=server_io_exceptions.ResourceDoesNotExist('http://localhost'))
+    def test_raises_server_exceptions(self, delete_host_mock):
+        with self.assertRaises(server_io_exceptions.ResourceDoesNotExist):
+            self.run_coroutine(aio.delete_host('a_ws', 1))
+
+    def test_concurrency_is_bounded(self):
+        aio.set_max_concurrency(3)
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+
+        def slow_delete(workspace_name, host_id):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return host_id
+
+        async def delete_all():
+            return await asyncio.gather(*[aio.delete_host('a_ws', host_id)
+                                          for host_id in range(12)])
+
+        with patch('faraday_client.persistence.server.server.delete_host', slow_delete):
+            deleted = self.run_coroutine(delete_all())
+        self.assertEqual(deleted, list(range(12)))
+        self.assertEqual(max_in_flight[0], 3)
+
+    @patch('faraday_client.persistence.server.server.get_hosts', return_value=[])
+    def test_requests_keep_the_pooled_connections(self, get_hosts_mock):
+        with patch.object(session, 'configure') as configure_mock:
+            self.run_coroutine(aio.get_hosts('a_ws'))
+            asyncio.run(aio.get_hosts('a_ws'))
+        configure_mock.assert_not_called()
+        self.assertEqual(get_hosts_mock.call_count, 2)
+
+    def test_larger_concurrency_resizes_the_pool(self):
+        with patch.object(session, 'configure') as configure_mock:
+            aio.set_max_concurrency(session.POOL_MAXSIZE)
+            configure_mock.assert_not_called()
+            aio.set_max_concurrency(session.POOL_MAXSIZE + 5)
+        configure_mock.assert_called_once_with(pool_maxsize=session.POOL_MAXSIZE + 5)
+
+
+# I'm Py3
@@ -8,6 +8,7 @@ from __future__ import absolute_import
 
 import os
 import sys
+import threading
 import unittest
 
 import responses
@@ -110,6 +111,87 @@ class ClientServerAPITests(unittest.TestCase):
         expected_json = server._get(url)
         self.assertEqual(expected_json, {"some": "object"})
 
+    @responses.activate
+    def test_get_metadata_is_cached(self):
+        server.RESPONSE_CACHE.clear()
+        url = "http://localhost:5985/_api/v2/ws/a_ws"
+        responses.add(responses.GET, url, json={'name': 'a_ws'}, headers={'ETag': '"v1"'})
+        self.assertEqual(server._get(url), {'name': 'a_ws'})
+        self.assertEqual(server._get(url), {'name': 'a_ws'})
+        self.assertEqual(len(responses.calls), 1)
+
+        server.invalidate_response_cache()
+        responses.replace(responses.GET, url, status=304)
+        self.assertEqual(server._get(url), {'name': 'a_ws'})
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(responses.calls[1].request.headers['If-None-Match'], '"v1"')
+
+    @responses.activate
+    def test_responses_older_than_an_invalidation_are_not_cached(self):
+        server.RESPONSE_CACHE.clear()
+        url = "http://localhost:5985/_api/v2/ws/a_ws"
+
+        def answer_then_write(request):
+            server.invalidate_response_cache()
+            return 200, {}, '{"name": "a_ws"}'
+
+        responses.add_callback(responses.GET, url, callback=answer_then_write)
+        response = server._get(url)
+        self.assertEqual(response, {'name': 'a_ws'})
+        self.assertIsNone(server.RESPONSE_CACHE.get(server.RESPONSE_CACHE.key(url, {})))
+
+        responses.replace(responses.GET, url, json={'name': 'a_ws'})
+        response = server._get(url)
+        response['name'] = 'modified'
+        self.assertEqual(server._get(url), {'name': 'a_ws'})
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_writes_invalidate_cache(self):
+        server.RESPONSE_CACHE.clear()
+        url = "http://localhost:5985/_api/v2/ws"
+        responses.add(responses.GET, url, json=[{'name': 'a_ws'}])
+        responses.add(responses.POST, url + '/', json={'name': 'b_ws'}, status=201)
+        server._get(url)
+        server._post(url + '/', name='b_ws')
+        server._get(url)
+        self.assertEqual([call.request.method for call in responses.calls], ['GET', 'POST', 'GET'])
+
+    @responses.activate
+    def test_concurrent_gets_share_one_request(self):
+        url = "http://localhost:5985/_api/v2/ws/a_ws/hosts/1/"
+        release = threading.Event()
+
+        def slow_answer(request):
+            release.wait(timeout=5)
+            return 200, {}, '{"id": 1}'
+
+        responses.add_callback(responses.GET, url, callback=slow_answer)
+        collapsed = server.SINGLE_FLIGHT.collapsed
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(server._get(url)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for _ in range(5000):
+            if server.SINGLE_FLIGHT.collapsed - collapsed == 4:
+                break
+            release.wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(results, [{'id': 1}] * 5)
+        self.assertEqual(len({id(result) for result in results}), 5)
+
+    @responses.activate
+    def test_objects_are_not_cached(self):
+        url = "http://localhost:5985/_api/v2/ws/a_ws/hosts"
+        responses.add(responses.GET, url, json={'rows': []})
+        server._get(url)
+        server._get(url)
+        self.assertEqual(len(responses.calls), 2)
+
     @responses.activate
     def test_put_with_no_update(self):
         responses.add(responses.PUT, example_url, body='{"ok": "true"}', status=200)
@@ -151,6 +233,60 @@ class ClientServerAPITests(unittest.TestCase):
         mock_credentials.assert_called_once_with('a')
         mock_commands.assert_called_once_with('a')
 
+    def test_iter_pages_stops_on_short_page(self):
+        pages = {1: {'rows': [1, 2]}, 2: {'rows': [3, 4]}, 3: {'rows': [5]}}
+        mock_raw_hosts = MagicMock(side_effect=lambda ws, page, page_size, **params: pages[page])
+        for prefetch in (True, False):
+            mock_raw_hosts.reset_mock()
+            with patch('faraday_client.persistence.server.server._get_raw_hosts', mock_raw_hosts):
+                result = list(server.iter_hosts('a', page_size=2, prefetch=prefetch))
+            self.assertEqual(result, [[1, 2], [3, 4], [5]])
+            self.assertEqual(mock_raw_hosts.call_count, 3)
+
+    def test_iter_pages_without_server_pagination(self):
+        mock_raw_vulns = MagicMock(return_value={'vulnerabilities': [1, 2, 3]})
+        with patch('faraday_client.persistence.server.server._get_raw_vulns', mock_raw_vulns):
+            result = list(server.iter_all_vulns('a', page_size=2))
+        self.assertEqual(result, [[1, 2, 3]])
+        mock_raw_vulns.assert_called_once_with('a', page=1, page_size=2)
+
+    def test_iter_pages_of_a_server_ignoring_the_page_params(self):
+        # exactly page_size rows, sent again for every page
+        rows = [{'id': 1}, {'id': 2}]
+        for raw_page in ({'rows': rows}, rows):
+            mock_raw_hosts = MagicMock(return_value=raw_page)
+            with patch('faraday_client.persistence.server.server._get_raw_hosts', mock_raw_hosts):
+                result = list(server.iter_hosts('a', page_size=2))
+            self.assertEqual(result, [rows])
+            self.assertEqual(mock_raw_hosts.call_count, 2)
+
+        mock_raw_hosts = MagicMock(return_value={'rows': rows, 'count': 2})
+        with patch('faraday_client.persistence.server.server._get_raw_hosts', mock_raw_hosts):
+            result = list(server.iter_hosts('a', page_size=2, prefetch=False))
+        self.assertEqual(result, [rows])
+        mock_raw_hosts.assert_called_once_with('a', page=1, page_size=2)
+
+    def test_iter_pages_of_plain_lists(self):
+        mock_raw_services = MagicMock(side_effect=[['s1', 's2'], []])
+        with patch('faraday_client.persistence.server.server._get_raw_services', mock_raw_services):
+            result = list(server.iter_services('a', page_size=2, status='open'))
+        self.assertEqual(result, [['s1', 's2']])
+        mock_raw_services.assert_called_with('a', page=2, page_size=2, status='open')
+
+    @responses.activate
+    def test_delete_objects(self):
+        hosts_url = "http://localhost:5985/_api/v2/ws/a_ws/hosts/{0}/"
+        for host_id in range(5):
+            responses.add(responses.DELETE, hosts_url.format(host_id), status=204)
+        responses.add(responses.DELETE, hosts_url.format(5), status=404)
+        failed = server.delete_objects('a_ws', 'Host', range(6))
+        self.assertEqual(list(failed.keys()), [5])
+        self.assertIsInstance(failed[5], server_io_exceptions.ResourceDoesNotExist)
+        # no GET to fetch the revision of the objects
+        self.assertEqual({call.request.method for call in responses.calls}, {'DELETE'})
+        with self.assertRaises(server_io_exceptions.WrongObjectSignature):
+            server.delete_objects('a_ws', 'not a signature', [1])
+
     @patch('faraday_client.persistence.server.server.get_hosts', return_value='hosts')
     @patch('faraday_client.persistence.server.server.get_vulns', return_value='vulns')
     @patch('faraday_client.persistence.server.server.get_services', return_value='services')
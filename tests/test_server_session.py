@@ -0,0 +1,71 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import threading
+import unittest
+
+import responses
+
+from faraday_client.persistence.server import server, session
+
+server.FARADAY_UP = False
+server.SERVER_URL = "http://localhost:5985"
+
+
+class PooledSessionTests(unittest.TestCase):
+
+    def setUp(self):
+        session.close()
+
+    def tearDown(self):
+        session.configure(pool_maxsize=20, max_retries=3)
+
+    def test_same_session_in_same_thread(self):
+        self.assertIs(session.get_session(), session.get_session())
+
+    def test_threads_share_the_adapter(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(session.get_session()))
+        thread.start()
+        thread.join()
+        main_session = session.get_session()
+        self.assertIsNot(sessions[0], main_session)
+        self.assertIs(sessions[0].get_adapter('http://localhost'),
+                      main_session.get_adapter('http://localhost'))
+
+    def test_new_sessions_have_their_own_cookies(self):
+        own_session = session.new_session()
+        self.assertIsNot(own_session, session.get_session())
+        self.assertIsNot(own_session.cookies, session.get_session().cookies)
+        self.assertIs(own_session.get_adapter('http://localhost'),
+                      session.get_session().get_adapter('http://localhost'))
+
+    def test_configure_recreates_session(self):
+        old_session = session.get_session()
+        session.configure(pool_maxsize=30, max_retries=5)
+        new_session = session.get_session()
+        self.assertIsNot(old_session, new_session)
+        adapter = new_session.get_adapter('http://localhost')
+        self.assertEqual(adapter._pool_maxsize, 30)
+        self.assertEqual(adapter.max_retries.total, 5)
+
+    def test_post_is_not_retried(self):
+        retry = session.get_session().get_adapter('http://localhost').max_retries
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertTrue(retry.is_retry('GET', 503))
+
+    @responses.activate
+    def test_server_requests_are_counted(self):
+        url = "http://localhost:5985/_api/v2/ws/a_ws/hosts/"
+        responses.add(responses.GET, url, json={'rows': []})
+        server._get(url)
+        server._get(url)
+        self.assertEqual(session.stats()['requests'], 2)
+
+
+# I'm Py3
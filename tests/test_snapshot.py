@@ -0,0 +1,158 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import os
+import random
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from faraday_client.persistence.server import models
+from faraday_client.persistence.server.snapshot import (WorkspaceSnapshot, IntColumn, EncodedColumn,
+                                                        Table, VULN_COLUMNS, INDEXED_COLUMNS)
+
+models.FARADAY_UP = False
+
+WS = 'a_ws'
+
+
+def new_host(host_id, ip, os):
+    return models.Host({'id': host_id, 'ip': ip, 'name': ip, 'os': os}, WS)
+
+
+def new_service(service_id, host_id, port, status='open'):
+    return models.Service({'id': service_id, 'name': 'svc', 'protocol': 'tcp', 'ports': port,
+                           'version': '', 'status': status, 'parent': host_id}, WS)
+
+
+def new_vuln(vuln_id, parent_id, parent_type, severity, status='open'):
+    return models.Vuln({'id': vuln_id, 'name': 'vuln', 'desc': '', 'severity': severity,
+                        'status': status, 'parent': parent_id, 'parent_type': parent_type}, WS)
+
+
+class WorkspaceSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        hosts = [new_host(1, '10.0.0.1', 'Linux'),
+                 new_host(2, '10.0.0.2', 'Windows'),
+                 new_host(3, '10.0.0.3', 'Linux')]
+        services = [new_service(1, 1, 22),
+                    new_service(2, 1, 80),
+                    new_service(3, 2, 443, status='closed')]
+        vulns = [new_vuln(1, 1, 'Host', 'high'),
+                 new_vuln(2, 1, 'Service', 'critical'),
+                 new_vuln(3, 2, 'Service', 'low', status='closed'),
+                 new_vuln(4, 3, 'Host', 'high')]
+        self.snapshot = WorkspaceSnapshot.from_objects(WS, hosts, services, vulns)
+
+    def test_columns(self):
+        self.assertIsInstance(self.snapshot.hosts.columns['id'], IntColumn)
+        os_column = self.snapshot.hosts.columns['os']
+        self.assertIsInstance(os_column, EncodedColumn)
+        self.assertEqual(os_column.dictionary, ['Linux', 'Windows'])
+        self.assertEqual(self.snapshot.hosts.values('os'), ['Linux', 'Windows', 'Linux'])
+
+    def test_where_and_group_count(self):
+        self.assertEqual(self.snapshot.hosts.group_count('os'), {'Linux': 2, 'Windows': 1})
+        self.assertEqual(self.snapshot.vulns.count(severity=['high', 'critical']), 3)
+        selection = self.snapshot.vulns.where(severity='high', parent_type='Host')
+        self.assertEqual(selection.values('parent_id'), [1, 3])
+        self.assertEqual(self.snapshot.vulns.group_count('severity', status='open'),
+                         {'high': 2, 'critical': 1})
+        self.assertEqual(self.snapshot.services.where(port=[80, 443], status='open').values('id'), [2])
+        self.assertEqual(self.snapshot.hosts.count(os='BSD'), 0)
+
+    def test_indexes(self):
+        self.assertEqual(self.snapshot.hosts.get('ip', '10.0.0.2')['os'], 'Windows')
+        self.assertIsNone(self.snapshot.hosts.get('id', 7))
+        self.assertEqual(self.snapshot.services_of(1).values('port'), [22, 80])
+        self.assertEqual(self.snapshot.vulns_of(1, 'Service').values('id'), [2])
+        self.assertEqual(len(self.snapshot.vulns_of(1)), 2)
+
+    def test_selections_combine(self):
+        vulns = self.snapshot.vulns
+        high_or_low = vulns.where(severity='high') | vulns.where(severity='low')
+        self.assertEqual(high_or_low.values('id'), [1, 3, 4])
+        self.assertEqual((high_or_low & vulns.where(status='open')).values('id'), [1, 4])
+
+    def test_load_only_reads_the_tables_asked(self):
+        with patch.object(models, 'iter_hosts', return_value=iter([new_host(1, '10.0.0.1', 'Linux')])), \
+                patch.object(models, 'iter_services') as iter_services, \
+                patch.object(models, 'iter_vulns') as iter_vulns:
+            snapshot = WorkspaceSnapshot.load(WS, tables=['hosts'])
+        self.assertEqual(snapshot.hosts.values('ip'), ['10.0.0.1'])
+        self.assertEqual(len(snapshot.services), 0)
+        self.assertFalse(iter_services.called or iter_vulns.called)
+
+
+
+SEVERITIES = ['critical', 'high', 'medium', 'low', 'info']
+STATUSES = ['open', 'closed', 're-opened', 'risk-accepted']
+
+
+def random_vulns(count):
+    """Objects with the attributes of the VULN_COLUMNS, faster to make than vulns"""
+    generator = random.Random(count)
+    return [SimpleNamespace(id=vuln_id, class_signature='Vulnerability', name='vuln',
+                            severity=generator.choice(SEVERITIES), status=generator.choice(STATUSES),
+                            confirmed=vuln_id % 3 == 0, parent_id=vuln_id % (count // 40 or 1),
+                            parent_type=generator.choice(['Host', 'Service']))
+            for vuln_id in range(count)]
+
+
+class TableTest(unittest.TestCase):
+
+    def test_where_matches_a_loop_over_the_objects(self):
+        vulns = random_vulns(5000)
+        table = Table.from_objects(vulns, VULN_COLUMNS, INDEXED_COLUMNS['vulns'])
+
+        def loop(**conditions):
+            return [vuln.id for vuln in vulns
+                    if all(getattr(vuln, name) in values for name, values in conditions.items())]
+
+        # dense conditions use bitmaps, the parent_id ones the rows of its index
+        for conditions in ({'severity': ['high', 'critical'], 'status': ['open']},
+                           {'confirmed': [True], 'parent_type': ['Host']},
+                           {'parent_id': [7], 'severity': ['high', 'low']},
+                           {'parent_id': [7, 9], 'confirmed': [False]},
+                           {'severity': ['unknown']}):
+            selection = table.where(**conditions)
+            self.assertEqual(selection.values('id'), loop(**conditions), conditions)
+            self.assertEqual(selection.count(), len(loop(**conditions)))
+        open_vulns = table.where(status='open')
+        self.assertEqual(open_vulns.where(parent_id=7).values('id'),
+                         loop(status=['open'], parent_id=[7]))
+        self.assertEqual(open_vulns.group_count('severity'),
+                         table.columns['severity'].counts(open_vulns.rows))
+
+    @unittest.skipUnless(os.environ.get('FARADAY_BENCHMARKS'), 'set FARADAY_BENCHMARKS=1 to run the benchmarks')
+    def test_where_benchmark(self):
+        """where() against a loop over the objects, on 200k vulns. Only run
+        on demand, the times depend on the machine."""
+        vulns = random_vulns(200000)
+        table = Table.from_objects(vulns, VULN_COLUMNS, INDEXED_COLUMNS['vulns'])
+
+        def best_time(function):
+            times = []
+            for _ in range(5):
+                start = time.perf_counter()
+                function()
+                times.append(time.perf_counter() - start)
+            return min(times)
+
+        loop_time = best_time(lambda: [vuln.id for vuln in vulns
+                                       if vuln.severity in ('high', 'critical') and vuln.status == 'open'])
+        where_time = best_time(lambda: table.where(severity=['high', 'critical'], status='open').rows)
+        count_time = best_time(lambda: table.count(severity=['high', 'critical'], status='open'))
+        print('loop: {0:.4f}s, where: {1:.4f}s, count: {2:.4f}s'.format(loop_time, where_time, count_time))
+        self.assertLess(where_time, loop_time)
+        self.assertLess(count_time, loop_time)
+
+
+# I'm Py3
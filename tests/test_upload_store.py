@@ -0,0 +1,163 @@
+'''
+Faraday Penetration Test IDE
+Copyright (C) 2013  Infobyte LLC (http://www.infobytesec.com/)
+See the file 'doc/LICENSE' for the license information
+
+'''
+from __future__ import absolute_import
+
+import itertools
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from faraday_client.managers import upload_store
+from faraday_client.managers.mapper_manager import MapperManager
+from faraday_client.persistence.server import models
+
+models.FARADAY_UP = False
+
+WS = 'a_ws'
+
+
+def import_report(mappers_manager, severity='high'):
+    """Save a host, a service and a vuln as the controller does"""
+    def add(obj):
+        if not mappers_manager.skip_unchanged(obj):
+            mappers_manager.save_later(obj)
+        return obj
+
+    host = add(models.Host({'ip': '10.0.0.1', 'name': '10.0.0.1', 'os': 'Linux'}, WS))
+    service = add(models.Service({'name': 'ssh', 'protocol': 'tcp', 'ports': [22], 'version': '',
+                                  'status': 'open', 'parent': host.getIDOrPlaceholder()}, WS))
+    vuln = add(models.Vuln({'name': 'weak cipher', 'desc': '', 'severity': severity,
+                            'parent': service.getIDOrPlaceholder(), 'parent_type': 'Service'}, WS))
+    return host, service, vuln
+
+
+class UploadStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        ids = itertools.count(1)
+        # the hosts in the server
+        self.host_ids = []
+        self.workspace = {'id': 1, 'create_date': '2020-01-01'}
+
+        def create_object(ws, signature, obj, command_id):
+            obj_id = next(ids)
+            if signature == 'Host':
+                self.host_ids.append(obj_id)
+            return {'id': obj_id}
+
+        self.patches = [patch.object(upload_store, 'UPLOAD_STORES_PATH', self.directory),
+                        patch('faraday_client.managers.mapper_manager.create_object',
+                              side_effect=create_object),
+                        patch('faraday_client.managers.mapper_manager.delete_object'),
+                        patch('faraday_client.managers.mapper_manager.get_changes_stream'),
+                        patch.object(upload_store.server, 'get_workspace',
+                                     side_effect=lambda ws: self.workspace),
+                        patch.object(upload_store.server, 'get_hosts',
+                                     side_effect=lambda ws, **params: [{'id': host_id, 'value': {}}
+                                                                       for host_id in self.host_ids])]
+        _, self.create_object, _, self.get_changes_stream, _, _ = [started.start() for started in self.patches]
+
+    def tearDown(self):
+        for started in self.patches:
+            started.stop()
+        shutil.rmtree(self.directory)
+
+    def new_mappers_manager(self):
+        mappers_manager = MapperManager(dedup_uploads=True)
+        mappers_manager.createMappers(WS)
+        return mappers_manager
+
+    def test_unchanged_objects_are_not_sent_again(self):
+        mappers_manager = self.new_mappers_manager()
+        first_import = import_report(mappers_manager)
+        self.assertEqual(self.create_object.call_count, 3)
+        second_import = import_report(mappers_manager)
+        self.assertEqual(self.create_object.call_count, 3)
+        self.assertEqual([obj.getID() for obj in second_import], [obj.getID() for obj in first_import])
+        self.assertEqual(mappers_manager.upload_summary(), {'sent': 3, 'skipped': 3})
+        mappers_manager.close()
+
+        # the store is kept between sessions
+        mappers_manager = self.new_mappers_manager()
+        host, service, vuln = import_report(mappers_manager, severity='low')
+        self.assertEqual(mappers_manager.upload_summary(), {'sent': 1, 'skipped': 2})
+        sent_vuln = self.create_object.call_args[0][2]
+        self.assertIs(sent_vuln, vuln)
+        self.assertEqual(host.getID(), first_import[0].getID())
+        mappers_manager.close()
+
+    def test_deleted_objects_are_forgotten_with_their_children(self):
+        mappers_manager = self.new_mappers_manager()
+        host, _, _ = import_report(mappers_manager)
+        mappers_manager.remove(host.getID(), 'Host')
+        import_report(mappers_manager)
+        self.assertEqual(self.create_object.call_count, 6)
+        mappers_manager.close()
+
+    def test_deletes_of_others_are_forgotten(self):
+        mappers_manager = self.new_mappers_manager()
+        apply_changes = self.get_changes_stream.return_value.subscribe.call_args[0][0]
+        _, service, _ = import_report(mappers_manager)
+        apply_changes([{'action': 'DELETE', 'type': 'Service', 'id': service.getID()}])
+        import_report(mappers_manager)
+        self.assertEqual(mappers_manager.upload_summary(), {'sent': 5, 'skipped': 1})
+        mappers_manager.close()
+        self.assertTrue(self.get_changes_stream.return_value.stop.called)
+
+    def test_deletes_of_a_batch_are_forgotten_together(self):
+        mappers_manager = self.new_mappers_manager()
+        apply_changes = self.get_changes_stream.return_value.subscribe.call_args[0][0]
+        imported = [import_report(mappers_manager) for _ in range(2)]
+        host, service, vuln = imported[0]
+        store = mappers_manager.upload_store
+        statements = []
+        store._connection.set_trace_callback(statements.append)
+        apply_changes([{'action': 'DELETE', 'type': 'Vulnerability', 'id': vuln.getID()},
+                       {'action': 'DELETE', 'type': 'Host', 'id': host.getID()}])
+        self.assertEqual([statement for statement in statements if statement == 'BEGIN'], ['BEGIN'])
+        self.assertEqual(store._uploads, {})
+        self.assertEqual(store._keys_by_id, {})
+        self.assertEqual(store._children, {})
+        mappers_manager.close()
+
+    def test_hosts_missing_in_the_server_are_sent_again_with_their_children(self):
+        mappers_manager = self.new_mappers_manager()
+        import_report(mappers_manager)
+        mappers_manager.close()
+        del self.host_ids[:]
+        mappers_manager = self.new_mappers_manager()
+        import_report(mappers_manager)
+        self.assertEqual(mappers_manager.upload_summary(), {'sent': 3, 'skipped': 0})
+        mappers_manager.close()
+
+    def test_stores_of_other_servers_and_workspaces_are_not_used(self):
+        mappers_manager = self.new_mappers_manager()
+        import_report(mappers_manager)
+        mappers_manager.close()
+
+        store = upload_store.UploadStore(WS, server_url='http://another.server:5985')
+        self.assertEqual(len(store._uploads), 0)
+        store.close()
+
+        # the workspace was deleted and created again
+        self.workspace = {'id': 2, 'create_date': '2020-02-02'}
+        store = upload_store.UploadStore(WS)
+        self.assertEqual(len(store._uploads), 0)
+        store.close()
+
+    def test_old_uploads_are_sent_again(self):
+        mappers_manager = self.new_mappers_manager()
+        import_report(mappers_manager)
+        with patch.object(upload_store, 'UPLOADED_MAX_AGE', 0):
+            import_report(mappers_manager)
+        self.assertEqual(self.create_object.call_count, 6)
+        mappers_manager.close()
+
+
+# I'm Py3